@@ -0,0 +1,180 @@
+import re
+import time
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+# German stop words from the original tokenizer list (typos removed) plus common English ones
+GERMAN_STOP_WORDS = frozenset({
+    'aber', 'alle', 'allem', 'allen', 'aller', 'alles', 'als', 'also', 'am', 'an', 'ander', 'andere',
+    'anderem', 'anderen', 'anderer', 'anderes', 'anderm', 'andern', 'anderr', 'anders', 'auch', 'auf',
+    'aus', 'bei', 'bin', 'bis', 'bist', 'da', 'damit', 'dann', 'der', 'den', 'des', 'dem', 'die', 'das',
+    'dass', 'dein', 'deine', 'deren', 'derer', 'dergleichen', 'desgleichen', 'desto', 'dich', 'dies',
+    'diese', 'diesem', 'diesen', 'dieser', 'dieses', 'dir', 'doch', 'dort', 'du', 'durch', 'ein', 'eine',
+    'einem', 'einen', 'einer', 'eines', 'einige', 'einigem', 'einigen', 'einiger', 'einiges', 'einmal',
+    'er', 'für', 'ihm', 'ihn', 'ihr', 'ihre', 'ihrem', 'ihren', 'ihrer', 'ihres', 'im', 'in', 'indem',
+    'ins', 'ist', 'jede', 'jedem', 'jeden', 'jeder', 'jedes', 'jene', 'jenem', 'jenen', 'jener', 'jenes',
+    'jetzt', 'kann', 'kein', 'keine', 'keinem', 'keinen', 'keiner', 'keines', 'können', 'könnte',
+    'machen', 'man', 'manche', 'manchem', 'manchen', 'mancher', 'manches', 'mein', 'meine', 'meinem',
+    'meinen', 'meiner', 'meines', 'mich', 'mit', 'muss', 'musste', 'nach', 'nicht', 'nichts', 'noch', 'nun', 'nur', 'ob',
+    'oder', 'ohne', 'sehr', 'sein', 'seine', 'seinem', 'seinen', 'seiner', 'seines', 'selbst', 'sich',
+    'sie', 'sind', 'so', 'solche', 'solchem', 'solchen', 'solcher', 'solches', 'soll', 'sollte',
+    'sondern', 'sonst', 'über', 'um', 'und', 'uns', 'unser', 'unsere', 'unsers', 'unter', 'viel',
+    'viele', 'vielem', 'vielen', 'vieler', 'vieles', 'vom', 'von', 'vor', 'während', 'war', 'waren',
+    'warst', 'was', 'weg', 'weil', 'weiter', 'welche', 'welchem', 'welchen', 'welcher', 'welches',
+    'wenn', 'werde', 'werden', 'werdet', 'wir', 'wird', 'wirst', 'wo', 'wollen', 'wollte', 'würde', 'würden',
+    'zu', 'zum', 'zur', 'zwar', 'zwischen',
+    'and', 'are', 'for', 'from', 'has', 'have', 'into', 'not', 'that', 'the', 'this', 'was', 'were',
+    'which', 'with',
+})
+
+WORD_PATTERN = re.compile(r'\w+')
+UMLAUTS = str.maketrans({'ä': 'a', 'ö': 'o', 'ü': 'u', 'ß': 'ss'})
+# Consonants after which a final -s / -st is an inflection (Savoy's light stemmer)
+_ST_ENDING = frozenset('bdfghklmnt')
+
+
+def fold_umlauts(word: str) -> str:
+    """Map ä/ö/ü to a/o/u and ß to ss, so both spellings match"""
+    return word.translate(UMLAUTS)
+
+
+def stem_german(word: str) -> str:
+    """Light German stemmer (J. Savoy): strips common inflectional suffixes only.
+
+    Expects lower-case, umlaut-folded input. Being light, it conflates
+    plural and case forms (tabelle/tabellen) without the over-stemming of
+    full Snowball rules.
+    """
+    length = len(word)
+    if length > 5 and word.endswith('ern'):
+        length -= 3
+    elif length > 4 and word[length - 2:length] in ('em', 'en', 'er', 'es'):
+        length -= 2
+    elif length > 3 and word.endswith('e'):
+        length -= 1
+    elif length > 3 and word.endswith('s') and word[-2] in _ST_ENDING:
+        length -= 1
+
+    if length > 5 and word[length - 3:length] == 'est':
+        length -= 3
+    elif length > 4 and word[length - 2:length] in ('er', 'en'):
+        length -= 2
+    elif length > 4 and word[length - 2:length] == 'st' and word[length - 3] in _ST_ENDING:
+        length -= 2
+    return word[:length]
+
+
+class Analyzer:
+    """Turns text into index terms: lower-case, split, drop stop words, fold, stem.
+
+    Built once per engine. Every distinct word is normalized only once (the
+    result is kept in a word cache), and whole metadata values are cached by
+    cached_terms(), since the same module/topic strings recur on every page.
+    """
+
+    def __init__(self, stop_words: Iterable[str] = GERMAN_STOP_WORDS, min_length: int = 3,
+                 fold: bool = True, stem: bool = True, word_cache_size: int = 200_000,
+                 value_cache_size: int = 4096):
+        self.min_length = min_length
+        self.fold = fold
+        self.stem = stem
+        self.stop_words: FrozenSet[str] = frozenset(
+            fold_umlauts(word) if fold else word for word in (word.lower() for word in stop_words))
+        self.word_cache_size = word_cache_size
+        self._words: Dict[str, Optional[str]] = {}
+        self.cached_terms = lru_cache(maxsize=value_cache_size)(self._value_terms)
+        self._word_groups: Dict[int, re.Pattern] = {}
+
+    def config(self) -> Dict:
+        """Settings that determine the produced terms; stored with saved indexes"""
+        return {
+            'min_length': self.min_length,
+            'fold': self.fold,
+            'stem': self.stem,
+            'stop_words': sorted(self.stop_words),
+        }
+
+    def normalize(self, word: str) -> Optional[str]:
+        """Index term for one lower-case word, or None if it is dropped"""
+        term = fold_umlauts(word) if self.fold else word
+        if len(term) < self.min_length or term in self.stop_words:
+            return None
+        if self.stem:
+            term = stem_german(term)
+        return term
+
+    def terms(self, text: str) -> List[str]:
+        """Index terms of text in order, repeats included"""
+        if not text:
+            return []
+        words = self._words
+        if len(words) > self.word_cache_size:
+            words.clear()
+        result = []
+        for word in WORD_PATTERN.findall(text):
+            try:
+                term = words[word]
+            except KeyError:
+                term = words[word] = self.normalize(word.lower())
+            if term is not None:
+                result.append(term)
+        return result
+
+    def positions(self, text: str) -> List[Tuple[int, str]]:
+        """(word position, term) pairs of text; dropped words still advance the position"""
+        if not text:
+            return []
+        words = self._words
+        if len(words) > self.word_cache_size:
+            words.clear()
+        result = []
+        for position, word in enumerate(WORD_PATTERN.findall(text)):
+            try:
+                term = words[word]
+            except KeyError:
+                term = words[word] = self.normalize(word.lower())
+            if term is not None:
+                result.append((position, term))
+        return result
+
+    def word_offsets(self, text: str, every: int) -> Tuple[List[int], int]:
+        """Character offsets of words 0, every, 2 * every, ... of text followed by len(text), and the word count.
+
+        Word positions are counted as in positions(), so a word position can
+        be mapped to a short slice of the text without tokenizing all of it.
+        Words are split in the original text and lower-cased one by one, as
+        lower() can change the length of a text (İ becomes i̇) and with it
+        every later offset.
+        """
+        group = self._word_groups.get(every)
+        if group is None:
+            # One match per every words, found in a single C-level scan
+            group = self._word_groups[every] = re.compile(rf'\w+(?:\W+\w+){{0,{every - 1}}}')
+        offsets = []
+        last = None
+        for last in group.finditer(text):
+            offsets.append(last.start())
+        word_count = (len(offsets) - 1) * every + len(WORD_PATTERN.findall(last.group())) if last else 0
+        offsets.append(len(text))
+        return offsets, word_count
+
+    def _value_terms(self, value: str) -> Tuple[str, ...]:
+        return tuple(self.terms(value))
+
+
+def throughput(analyzer: Analyzer, texts: Iterable[str]) -> Dict[str, float]:
+    """Tokenize texts once and report MB/s of UTF-8 input"""
+    total_bytes = 0
+    total_terms = 0
+    elapsed = 0.0
+    for text in texts:
+        start = time.perf_counter()
+        total_terms += len(analyzer.terms(text))
+        elapsed += time.perf_counter() - start
+        total_bytes += len(text.encode('utf-8'))
+    return {
+        'bytes': total_bytes,
+        'terms': total_terms,
+        'seconds': elapsed,
+        'mb_per_second': total_bytes / 2**20 / elapsed if elapsed else 0.0,
+    }
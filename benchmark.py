@@ -0,0 +1,715 @@
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import logging
+import os
+import platform
+import random
+import re
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
+from itertools import accumulate
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional
+
+# Progress bars would dominate the timings of small queries
+os.environ.setdefault('TQDM_DISABLE', '1')
+
+from analyzer import Analyzer, throughput
+from metadata_extractor import DEFAULT_PATTERNS, MetadataExtractor
+from metrics import METRICS
+from near_duplicates import NearDuplicateIndex, signature
+from search_engine import SearchEngine
+from sharded_search import ShardedSearchEngine
+
+# Base vocabulary of the synthetic course material; rarer terms are built as
+# compounds of these words, which gives a long Zipf-like tail
+WORDS = {
+    'de': ['datenbank', 'tabelle', 'abfrage', 'schlüssel', 'beziehung', 'normalisierung', 'transaktion',
+           'index', 'sicht', 'spalte', 'zeile', 'fremdschlüssel', 'primärschlüssel', 'entität', 'attribut',
+           'modell', 'sprache', 'verbund', 'gruppierung', 'sortierung', 'bedingung', 'funktion', 'prozedur',
+           'auslöser', 'sperre', 'protokoll', 'sicherung', 'wiederherstellung', 'berechtigung', 'benutzer',
+           'rolle', 'schema', 'katalog', 'datei', 'speicher', 'leistung', 'optimierung', 'plan', 'kosten',
+           'statistik', 'verteilung', 'replikation', 'partition', 'knoten', 'netzwerk', 'dokument', 'suche',
+           'gewichtung', 'rangfolge', 'übung', 'aufgabe', 'lösung', 'beispiel', 'prüfung', 'vorlesung'],
+    'en': ['database', 'table', 'query', 'key', 'relation', 'normalization', 'transaction', 'index',
+           'view', 'column', 'row', 'foreign', 'primary', 'entity', 'attribute', 'model', 'language',
+           'join', 'grouping', 'ordering', 'condition', 'function', 'procedure', 'trigger', 'lock', 'log',
+           'backup', 'recovery', 'permission', 'user', 'role', 'schema', 'catalog', 'file', 'storage',
+           'performance', 'optimization', 'plan', 'cost', 'statistics', 'distribution', 'replication',
+           'partition', 'node', 'network', 'document', 'search', 'weighting', 'ranking', 'exercise',
+           'task', 'solution', 'example', 'exam', 'lecture'],
+}
+FILLER = {
+    'de': ['der', 'die', 'das', 'und', 'mit', 'für', 'eine', 'wird', 'ist', 'nicht', 'auf', 'bei'],
+    'en': ['the', 'and', 'with', 'for', 'a', 'is', 'not', 'on', 'of', 'to', 'in', 'this'],
+}
+INSTRUCTORS = ['Meier', 'Müller', 'Keller', 'Weber', 'Huber', 'Schmid', 'Brunner', 'Baumann']
+MODULES = ['Datenbanken', 'Information Retrieval', 'Data Engineering', 'Machine Learning', 'Statistik']
+
+
+def vocabulary(language: str, size: int = 3000) -> List[str]:
+    """Base words followed by compounds, most frequent first"""
+    words = WORDS[language]
+    terms = list(words)
+    for first in words:
+        for second in words:
+            if len(terms) >= size:
+                return terms
+            if first != second:
+                terms.append(first + second)
+    return terms
+
+
+def synthetic_corpus(num_docs: int, language: str = 'de', words_per_doc: int = 200,
+                     vocabulary_size: int = 3000, seed: int = 42) -> Iterator[Dict]:
+    """Yield course-like documents with Zipf-distributed terms and metadata"""
+    rng = random.Random(seed)
+    terms = vocabulary(language, vocabulary_size)
+    cum_weights = list(accumulate(1 / rank for rank in range(1, len(terms) + 1)))
+    filler = FILLER[language]
+    topics = WORDS[language]
+    for doc_id in range(num_docs):
+        words = rng.choices(terms, cum_weights=cum_weights, k=words_per_doc)
+        for position in range(0, words_per_doc, 4):
+            words[position] = rng.choice(filler)
+        yield {
+            'file_path': f"synthetic/{language}/doc{doc_id}.pdf",
+            'content': ' '.join(words),
+            'module': rng.choice(MODULES),
+            'topic': rng.choice(topics).capitalize(),
+            'subtopic': None,
+            'chapter': None,
+            'instructor': rng.choice(INSTRUCTORS),
+            'page_number': doc_id % 40 + 1,
+        }
+
+
+def query_shapes(language: str, num_queries: int, seed: int = 7) -> Dict[str, List[str]]:
+    """Queries grouped by shape, drawn from the same vocabulary as the corpus"""
+    rng = random.Random(seed)
+    terms = vocabulary(language)
+    frequent, rare = terms[:50], terms[1000:]
+    topics = WORDS[language]
+    return {
+        'single_frequent': [rng.choice(frequent) for _ in range(num_queries)],
+        'single_rare': [rng.choice(rare) for _ in range(num_queries)],
+        'two_terms': [' '.join(rng.sample(frequent, 2)) for _ in range(num_queries)],
+        'four_terms': [' '.join(rng.sample(frequent, 2) + rng.sample(rare, 2)) for _ in range(num_queries)],
+        'or_terms': [' OR '.join(rng.sample(frequent, 4)) for _ in range(num_queries)],
+        'boolean': [f"({a} OR {b}) NOT {c}" for a, b, c in (rng.sample(frequent, 3) for _ in range(num_queries))],
+        'phrase': [f'"{" ".join(rng.sample(frequent, 2))}"' for _ in range(num_queries)],
+        'near': [f"{rng.choice(frequent)} NEAR/5 {rng.choice(frequent)}" for _ in range(num_queries)],
+        'field_clause': [f"{rng.choice(frequent)} instructor:{rng.choice(INSTRUCTORS)} topic:{rng.choice(topics)}"
+                         for _ in range(num_queries)],
+    }
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    """p50/p95/p99 and mean of latency samples, in milliseconds"""
+    cuts = statistics.quantiles(samples, n=100, method='inclusive')
+    return {
+        'p50_ms': cuts[49] * 1000,
+        'p95_ms': cuts[94] * 1000,
+        'p99_ms': cuts[98] * 1000,
+        'mean_ms': statistics.fmean(samples) * 1000,
+    }
+
+
+def bench_indexing(docs: List[Dict]) -> Dict:
+    """add_documents throughput, then the traced memory of a second identical build"""
+    engine = SearchEngine()
+    start = time.perf_counter()
+    engine.add_documents(docs)
+    elapsed = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as tmp:
+        index_path = os.path.join(tmp, 'index.bin')
+        engine.save(index_path)
+        index_file_bytes = os.path.getsize(index_path)
+
+    tracemalloc.start()
+    traced = SearchEngine()
+    traced.add_documents(docs)
+    memory_bytes, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del traced
+
+    return {
+        'engine': engine,
+        'documents': len(docs),
+        'seconds': elapsed,
+        'docs_per_second': len(docs) / elapsed if elapsed else 0.0,
+        'terms': len(engine.index),
+        'memory_bytes': memory_bytes,
+        'index_file_bytes': index_file_bytes,
+    }
+
+
+def bench_queries(engine: SearchEngine, shapes: Dict[str, List[str]], k: Optional[int] = 10) -> Dict:
+    """Latency of search_with_progress per query shape, with the result cache disabled"""
+    cache = engine.cache
+    engine.cache = type(cache)(0)
+    try:
+        results = {}
+        for shape, queries in shapes.items():
+            samples = []
+            hits = 0
+            for query in queries:
+                start = time.perf_counter()
+                hits += len(engine.search_with_progress(query, k=k))
+                samples.append(time.perf_counter() - start)
+            results[shape] = dict(percentiles(samples), queries=len(queries), avg_results=hits / len(queries))
+        return results
+    finally:
+        engine.cache = cache
+
+
+def bench_sharding(docs: List[Dict], shard_counts: List[int], shapes: Dict[str, List[str]],
+                   k: Optional[int] = 10) -> List[Dict]:
+    """Build and query latency of ShardedSearchEngine per shard count, result caches disabled"""
+    results = []
+    for shards in shard_counts:
+        with ShardedSearchEngine(shards, cache_size=0) as engine:
+            start = time.perf_counter()
+            engine.add_documents(docs)
+            engine.refresh()
+            build_seconds = time.perf_counter() - start
+            latency = {}
+            for shape, queries in shapes.items():
+                samples = []
+                for query in queries:
+                    start = time.perf_counter()
+                    engine.search(query, k=k)
+                    samples.append(time.perf_counter() - start)
+                latency[shape] = dict(percentiles(samples), queries=len(queries))
+        results.append({'shards': shards, 'documents': len(docs), 'build_seconds': build_seconds,
+                        'docs_per_second': len(docs) / build_seconds if build_seconds else 0.0,
+                        'shapes': latency})
+    return results
+
+
+def _per_pattern_metadata(text: str) -> Dict[str, str]:
+    """Baseline: the former extract_metadata, one re.finditer scan per pattern"""
+    metadata = {}
+    for key, pattern_list in DEFAULT_PATTERNS.items():
+        for pattern in pattern_list:
+            for match in re.finditer(pattern, text, re.IGNORECASE | re.MULTILINE):
+                value = match.group(1).strip()
+                if value and len(value) < 100:
+                    metadata[key] = value
+                    break
+    return metadata
+
+
+def metadata_inputs(docs: List[Dict], doc_count: int = 200) -> Dict[str, str]:
+    """Large text and SQL files with a metadata header, and a text without any labels"""
+    body = '\n'.join(doc['content'] for doc in docs[:doc_count])
+    header = f"Modul: {docs[0]['module']}\nThema: {docs[0]['topic']}\nDozent: {docs[0]['instructor']}\n"
+    tables = '\n'.join(f"CREATE TABLE t{i} (id int);\n-- {doc['content'][:200]}"
+                       for i, doc in enumerate(docs[:doc_count * 4]))
+    return {'text': header + body, 'sql': f"-- {header.replace(chr(10), chr(10) + '-- ')}\n{tables}",
+            'no_labels': body}
+
+
+def metadata_samples(docs: List[Dict], seed: int = 42) -> List[str]:
+    """One text per document with labels in the forms of the default patterns, at random lines.
+
+    Some fields get several labels with different values, some values are
+    too long to be taken, so that which pattern wins matters.
+    """
+    rng = random.Random(seed)
+    forms = {
+        'module': ["CAS {}. ", "Modul: {}", "Module 3: {}", "M7: {}", "M12 - {}"],
+        'topic': ["Thema: {}", "Topic 2 - {}", "Subject: {}", "Thema 4: {}"],
+        'instructor': ["Dozent: {}", "Lecturer: {}", "Von: {}", "By: {}"],
+    }
+    texts = []
+    for doc in docs:
+        lines = [' '.join(words) for words in _chunks(doc['content'].split(), 12)]
+        for field, field_forms in forms.items():
+            for form in rng.sample(field_forms, rng.randint(0, 3)):
+                value = rng.choice(docs)[field]
+                if rng.random() < 0.2:
+                    value = ' '.join([value] * 30)
+                lines.insert(rng.randint(0, len(lines)), form.format(value))
+        texts.append('\n'.join(lines))
+    return texts
+
+
+def _chunks(items: List, size: int) -> Iterator[List]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def bench_metadata(docs: List[Dict], repeat: int = 5) -> Dict:
+    """MB/s of the single-pass MetadataExtractor against the per-pattern baseline.
+
+    Both must return the same values, on the large inputs and on every
+    document of metadata_samples(); the differing texts are counted.
+    """
+    extractor = MetadataExtractor()
+    results = {}
+    inputs = dict(metadata_inputs(docs), samples=metadata_samples(docs))
+    for name, texts in inputs.items():
+        texts = [texts] if isinstance(texts, str) else texts
+        megabytes = sum(len(text.encode('utf-8')) for text in texts) / 2**20
+        row = {'megabytes': megabytes}
+        for method, extract in (('per_pattern', _per_pattern_metadata), ('single_pass', extractor.extract)):
+            start = time.perf_counter()
+            for _ in range(repeat):
+                fields = [extract(text) for text in texts]
+            elapsed = (time.perf_counter() - start) / repeat
+            row[method] = {'seconds': elapsed, 'mb_per_second': megabytes / elapsed if elapsed else 0.0,
+                           'fields': fields}
+        row['mismatches'] = sum(old != new for old, new in zip(row['per_pattern'].pop('fields'),
+                                                               row['single_pass'].pop('fields')))
+        results[name] = row
+    return results
+
+
+def bench_near_duplicates(docs: List[Dict], probes: int = 200, seed: int = 42) -> Dict:
+    """Signing throughput, lookup latency, recall for copies with one word changed and false matches"""
+    rng = random.Random(seed)
+    megabytes = sum(len(doc['content'].encode('utf-8')) for doc in docs) / 2**20
+    start = time.perf_counter()
+    signatures = [signature(doc['content']) for doc in docs]
+    signing = time.perf_counter() - start
+
+    index = NearDuplicateIndex()
+    for doc_id, sig in enumerate(signatures):
+        index.add(doc_id, f"doc{doc_id}", doc_id, sig)
+
+    def edited(text: str) -> str:
+        words = text.split()
+        words[rng.randrange(len(words))] = 'geändert'
+        return ' '.join(words)
+
+    # Like a slide whose date was updated: should be found as a duplicate of its source
+    sources = rng.sample(range(len(docs)), min(probes, len(docs)))
+    copies = [(doc_id, signature(edited(docs[doc_id]['content']))) for doc_id in sources]
+    start = time.perf_counter()
+    matches = [(doc_id, index.best_match(sig)) for doc_id, sig in copies]
+    lookup = (time.perf_counter() - start) / len(copies)
+    found = sum(match is not None and match[0] == doc_id and match[2] >= index.duplicate_threshold
+                for doc_id, match in matches)
+
+    # Documents not in the index (same vocabulary): any cluster match is a false one
+    fresh = list(synthetic_corpus(min(probes, len(docs)), 'de', seed=seed + 1))
+    false_matches = sum(index.best_match(signature(doc['content'])) is not None for doc in fresh)
+    return {
+        'documents': len(docs),
+        'signatures_per_second': len(docs) / signing if signing else 0.0,
+        'mb_per_second': megabytes / signing if signing else 0.0,
+        'lookup_ms': lookup * 1000,
+        'duplicate_recall': found / len(copies),
+        'false_match_rate': false_matches / len(fresh),
+    }
+
+
+def write_corpus_files(root: Path, num_files: int, language: str, seed: int = 42) -> None:
+    """Write the synthetic corpus as .sql files with metadata headers the processors recognize"""
+    for doc in synthetic_corpus(num_files, language, seed=seed):
+        path = root / f"module{doc['page_number'] % 5}" / f"{Path(doc['file_path']).stem}.sql"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(f"-- Modul: {doc['module']}\n-- Thema: {doc['topic']}\n"
+                        f"-- Dozent: {doc['instructor']}\n{doc['content']}\n", encoding='utf-8')
+
+
+def bench_ingestion(num_files: int, workers: int, language: str = 'de') -> Dict:
+    """ContentProcessor throughput into a fresh SQLite database, first run and unchanged re-run"""
+    from content_processor import ContentProcessor
+    from sqlite_connector import SQLiteConnector
+
+    results = {'files': num_files, 'workers': workers}
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp) / 'corpus'
+        write_corpus_files(root, num_files, language)
+        db_path = os.path.join(tmp, 'bench.db')
+        for run in ('initial', 'unchanged'):
+            processor = ContentProcessor(root, workers=workers, db=SQLiteConnector(db_path))
+            try:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    processor.process_directory()
+            finally:
+                processor.close()
+            results[run] = {
+                'seconds': processor.elapsed,
+                'files_processed': processor.processed_files,
+                'files_skipped': processor.skipped_files,
+                'files_per_second': (processor.processed_files + processor.skipped_files) / processor.elapsed
+                if processor.elapsed else 0.0,
+                'words_per_second': processor.words_per_second(),
+                'errors': processor.errors,
+            }
+    return results
+
+
+def write_pdf_files(root: Path, num_files: int, pages: int = 30, language: str = 'de', seed: int = 42) -> None:
+    """Write slide-deck-like PDFs (title page with metadata, then text pages) with PyMuPDF"""
+    import fitz
+
+    docs = synthetic_corpus(num_files * pages, language, words_per_doc=120, seed=seed)
+    root.mkdir(parents=True, exist_ok=True)
+    for file_number in range(num_files):
+        with fitz.open() as pdf:
+            for page_number in range(pages):
+                doc = next(docs)
+                text = doc['content']
+                if not page_number:
+                    text = f"Modul: {doc['module']}\nDozent: {doc['instructor']}\nThema: {doc['topic']}\n{text}"
+                pdf.new_page().insert_textbox(fitz.Rect(40, 40, 555, 800), text, fontsize=9)
+            pdf.save(root / f"deck{file_number}.pdf")
+
+
+def _baseline_pdf_extract(processor, file_path) -> List:
+    """Baseline: the former PDFProcessor, default get_text flags and every field searched on every page"""
+    import fitz
+
+    records = []
+    with fitz.open(file_path) as doc:
+        for page_number, page in enumerate(doc, start=1):
+            text = processor.clean_text(page.get_text())
+            if text:
+                records.append((text, dict(processor.extract_metadata(text), page_number=page_number)))
+    return records
+
+
+def bench_pdf_extraction(pdf_dir: str, repeat: int = 5) -> Dict:
+    """PDFProcessor.extract on PDFs: former extraction, without page cache, into a fresh cache, cached re-run.
+
+    The runs are interleaved and repeated, and the median is reported, as
+    single runs differ by more than the effects measured. File hashes are
+    computed beforehand, as the ContentProcessor does for its manifest.
+    """
+    from page_cache import PageCache, file_hash
+    from processors import PDFProcessor
+
+    files = sorted(Path(pdf_dir).rglob('*.pdf'))
+    hashes = {file_path: file_hash(file_path) for file_path in files}
+    timings: Dict[str, List[float]] = {run: [] for run in ('baseline', 'uncached', 'first', 'cached')}
+    pages = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        for repetition in range(repeat):
+            cache_path = os.path.join(tmp, f'pages{repetition}.db')
+            for run, path in (('baseline', ''), ('uncached', ''), ('first', cache_path), ('cached', cache_path)):
+                processor = PDFProcessor(None, cache_path=path)
+                pages = 0
+                start = time.perf_counter()
+                for file_path in files:
+                    if run == 'baseline':
+                        pages += len(_baseline_pdf_extract(processor, file_path))
+                    else:
+                        pages += len(processor.extract(file_path, hashes[file_path]))
+                timings[run].append(time.perf_counter() - start)
+            cache = PageCache.open(cache_path)
+            if cache is not None:
+                cache.close()
+    results = {'files': len(files), 'repeat': repeat}
+    for run, seconds in timings.items():
+        elapsed = statistics.median(seconds)
+        results[run] = {'seconds': elapsed, 'pages': pages, 'pages_per_second': pages / elapsed if elapsed else 0.0}
+    return results
+
+
+class StandInConnection:
+    """Stand-in for a MySQL connection when no server is available.
+
+    Every statement sleeps for one round trip and opening a connection for
+    a handshake, which (like waiting on a socket) releases the GIL. It
+    models latency and connection setup, not server-side parsing, so
+    prepared and text statements cost the same here.
+    """
+
+    def __init__(self, round_trip: float = 0.0003, handshake: float = 0.004):
+        time.sleep(handshake)
+        self.round_trip = round_trip
+        self.in_transaction = False
+
+    def cursor(self, prepared: bool = False) -> '_StandInCursor':
+        return _StandInCursor(self.round_trip)
+
+    def ping(self, reconnect: bool = False) -> None:
+        time.sleep(self.round_trip)
+
+    def commit(self) -> None:
+        time.sleep(self.round_trip)
+
+    def rollback(self) -> None:
+        time.sleep(self.round_trip)
+
+    def close(self) -> None:
+        pass
+
+
+class _StandInCursor:
+    lastrowid = None
+
+    def __init__(self, round_trip: float):
+        self.round_trip = round_trip
+
+    def execute(self, query: str, params=()) -> None:
+        time.sleep(self.round_trip)
+
+    def fetchall(self) -> List[tuple]:
+        return [('',)]
+
+    def close(self) -> None:
+        pass
+
+
+def _mysql_connect(url: str) -> Callable:
+    """connect() for a user:password@host:port/database URL"""
+    import mysql.connector
+    match = re.fullmatch(r'(?:([^:@]*)(?::([^@]*))?@)?([^:/]*)(?::(\d+))?(?:/(.*))?', url)
+    user, password, host, port, database = match.groups()
+    return partial(mysql.connector.connect, host=host or '127.0.0.1', port=int(port or 3306),
+                   user=user or 'root', password=password or '', database=database or 'cas_course_data')
+
+
+def _concurrent_reads(read: Callable, threads: int, requests: int) -> Dict:
+    latencies = []
+
+    def timed(content_id: int) -> None:
+        start = time.perf_counter()
+        read(content_id)
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as executor:
+        list(executor.map(timed, range(1, requests + 1)))
+    elapsed = time.perf_counter() - start
+    return dict(percentiles(latencies), requests_per_second=requests / elapsed if elapsed else 0.0)
+
+
+async def _async_reads(pool, query: str, tasks: int, requests: int) -> Dict:
+    latencies = []
+
+    async def reader(ids: range) -> None:
+        for content_id in ids:
+            start = time.perf_counter()
+            await pool.fetch_one(query, (content_id,))
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(reader(range(task + 1, requests + 1, tasks)) for task in range(tasks)))
+    elapsed = time.perf_counter() - start
+    return dict(percentiles(latencies), requests_per_second=requests / elapsed if elapsed else 0.0)
+
+
+def bench_connections(connect: Callable, threads: int = 8, requests: int = 2000) -> Dict:
+    """Point reads by concurrent callers: one shared connection, one per request, the pool (threads and asyncio)"""
+    from mysql_pool import AsyncConnectionPool, ConnectionPool
+
+    query = "SELECT SUBSTR(content, 1, 200) FROM content WHERE id = %s"
+    shared = connect()
+    shared_lock = threading.Lock()
+
+    def read_shared(content_id: int) -> None:
+        with shared_lock:
+            cursor = shared.cursor()
+            cursor.execute(query, (content_id,))
+            cursor.fetchall()
+            cursor.close()
+
+    def read_per_request(content_id: int) -> None:
+        conn = connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(query, (content_id,))
+            cursor.fetchall()
+            cursor.close()
+        finally:
+            conn.close()
+
+    pool = ConnectionPool(threads, connect=connect)
+
+    def read_pooled_text(content_id: int) -> None:
+        with pool.connection() as conn:
+            cursor = conn.raw.cursor()
+            cursor.execute(query, (content_id,))
+            cursor.fetchall()
+            cursor.close()
+
+    results = {'threads': threads, 'requests': requests}
+    try:
+        for mode, read in (('shared_connection', read_shared), ('connection_per_request', read_per_request),
+                           ('pool_text', read_pooled_text),
+                           ('pool_prepared', lambda content_id: pool.fetch_one(query, (content_id,)))):
+            results[mode] = _concurrent_reads(read, threads, requests)
+        results['pool_asyncio'] = asyncio.run(_async_reads(AsyncConnectionPool(pool), query, threads, requests))
+        results['connections_opened'] = pool.stats()['idle']
+    finally:
+        pool.close()
+        shared.close()
+    return results
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(scales: List[int], languages: List[str], num_queries: int = 200,
+                   ingest_files: int = 200, workers: List[int] = (1,), seed: int = 42,
+                   shard_counts: List[int] = (), pdf_dir: Optional[str] = None, db_threads: int = 8,
+                   mysql_url: Optional[str] = None, pdf_files: int = 0) -> Dict:
+    """Run every benchmark and return the results as a JSON-serializable dict"""
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'revision': _git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'seed': seed,
+        },
+        'analyzer': [],
+        'indexing': [],
+        'queries': [],
+        'sharding': [],
+        'ingestion': [],
+        'metadata': [],
+        'near_duplicates': [],
+        'pdf_extraction': None,
+        'connections': None,
+    }
+    for language in languages:
+        shapes = query_shapes(language, num_queries)
+        for scale in scales:
+            print(f"[{language}] indexing {scale} documents...")
+            docs = list(synthetic_corpus(scale, language, seed=seed))
+            report['analyzer'].append(dict(throughput(Analyzer(), (doc['content'] for doc in docs)),
+                                           language=language, documents=scale))
+            report['metadata'].append({'language': language, 'documents': scale, 'inputs': bench_metadata(docs)})
+            report['near_duplicates'].append(dict(bench_near_duplicates(docs, seed=seed), language=language))
+            indexing = bench_indexing(docs)
+            engine = indexing.pop('engine')
+            report['indexing'].append(dict(indexing, language=language))
+            print(f"[{language}] querying {scale} documents...")
+            report['queries'].append({'language': language, 'documents': scale,
+                                      'shapes': bench_queries(engine, shapes)})
+            if shard_counts:
+                print(f"[{language}] querying {scale} documents in {shard_counts} shards...")
+                for row in bench_sharding(docs, shard_counts, shapes):
+                    report['sharding'].append(dict(row, language=language))
+        if ingest_files:
+            for count in workers:
+                print(f"[{language}] ingesting {ingest_files} files with {count} worker(s)...")
+                report['ingestion'].append(dict(bench_ingestion(ingest_files, count, language), language=language))
+    if pdf_dir:
+        print(f"extracting PDFs below {pdf_dir}...")
+        report['pdf_extraction'] = bench_pdf_extraction(pdf_dir)
+    elif pdf_files:
+        print(f"extracting {pdf_files} generated PDFs...")
+        with tempfile.TemporaryDirectory() as tmp:
+            write_pdf_files(Path(tmp), pdf_files, seed=seed)
+            report['pdf_extraction'] = dict(bench_pdf_extraction(tmp), generated=True)
+    if db_threads:
+        print(f"reading with {db_threads} threads from {'MySQL' if mysql_url else 'a stand-in database'}...")
+        report['connections'] = dict(bench_connections(_mysql_connect(mysql_url) if mysql_url else StandInConnection,
+                                                       db_threads), server='mysql' if mysql_url else 'stand-in')
+    # Time per ingestion and search stage, summed over all runs above
+    report['stages'] = METRICS.to_json()
+    return report
+
+
+def print_summary(report: Dict) -> None:
+    print("\nTokenization")
+    for row in report['analyzer']:
+        print(f"  {row['language']} {row['documents']:>8} docs: {row['mb_per_second']:>10.1f} MB/s")
+    print("\nMetadata extraction (MB/s per pattern -> single pass)")
+    for row in report['metadata']:
+        for name, stats in row['inputs'].items():
+            print(f"  {row['language']} {row['documents']:>8} docs {name:<10}"
+                  f"{stats['per_pattern']['mb_per_second']:10.1f} -> {stats['single_pass']['mb_per_second']:10.1f}"
+                  f"  ({stats['mismatches']} differing results)")
+    print("\nNear-duplicate signatures")
+    for row in report['near_duplicates']:
+        print(f"  {row['language']} {row['documents']:>8} docs: {row['signatures_per_second']:>10.0f} docs/s, "
+              f"lookup {row['lookup_ms']:.3f} ms, recall {row['duplicate_recall']:.1%}, "
+              f"false matches {row['false_match_rate']:.1%}")
+    print("\nIndexing")
+    for row in report['indexing']:
+        print(f"  {row['language']} {row['documents']:>8} docs: {row['docs_per_second']:>10.0f} docs/s, "
+              f"{row['memory_bytes'] / 2**20:.1f} MiB in memory, {row['index_file_bytes'] / 2**20:.1f} MiB on disk")
+    print("\nQuery latency (p50 / p95 / p99 ms)")
+    for row in report['queries']:
+        for shape, stats in row['shapes'].items():
+            print(f"  {row['language']} {row['documents']:>8} docs {shape:<16}"
+                  f"{stats['p50_ms']:8.2f} {stats['p95_ms']:8.2f} {stats['p99_ms']:8.2f}")
+    if report['sharding']:
+        print("\nSharded query latency (p50 / p95 ms)")
+        for row in report['sharding']:
+            for shape, stats in row['shapes'].items():
+                print(f"  {row['language']} {row['documents']:>8} docs {row['shards']:>2} shards {shape:<16}"
+                      f"{stats['p50_ms']:8.2f} {stats['p95_ms']:8.2f}")
+    if report['ingestion']:
+        print("\nIngestion (SQLite)")
+        for row in report['ingestion']:
+            print(f"  {row['language']} {row['files']} files, {row['workers']} worker(s): "
+                  f"{row['initial']['files_per_second']:.0f} files/s initial, "
+                  f"{row['unchanged']['files_per_second']:.0f} files/s unchanged")
+    if report['pdf_extraction']:
+        row = report['pdf_extraction']
+        print(f"\nPDF extraction ({row['files']} files)")
+        for run in ('baseline', 'uncached', 'first', 'cached'):
+            print(f"  {run:<9} {row[run]['pages_per_second']:>10.0f} pages/s")
+    if report['connections']:
+        row = report['connections']
+        print(f"\nDatabase reads ({row['server']}, {row['threads']} threads; requests/s, p50 / p95 ms)")
+        for mode in ('shared_connection', 'connection_per_request', 'pool_text', 'pool_prepared', 'pool_asyncio'):
+            stats = row[mode]
+            print(f"  {mode:<24}{stats['requests_per_second']:10.0f}{stats['p50_ms']:8.2f}{stats['p95_ms']:8.2f}")
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(item) for item in value.split(',') if item]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Indexing, query latency and ingestion benchmarks")
+    parser.add_argument('--scales', type=_int_list, default=[1000, 10000],
+                        help="Corpus sizes in documents, comma separated")
+    parser.add_argument('--languages', default='de,en', help="Corpus languages: de, en or both")
+    parser.add_argument('--queries', type=int, default=200, help="Queries per shape")
+    parser.add_argument('--ingest-files', type=int, default=200, help="Files for the ingestion run (0 to skip)")
+    parser.add_argument('--workers', type=_int_list, default=[1], help="Worker counts for ingestion")
+    parser.add_argument('--shards', type=_int_list, default=[1, 2, 4],
+                        help="Shard counts for the sharded query benchmark (empty to skip)")
+    parser.add_argument('--pdf-dir', help="Directory with PDFs for the extraction benchmark (needs PyMuPDF)")
+    parser.add_argument('--pdf-files', type=int, default=0,
+                        help="Without --pdf-dir: generate this many 30-page PDFs for the extraction benchmark")
+    parser.add_argument('--db-threads', type=int, default=8,
+                        help="Concurrent readers for the connection pool benchmark (0 to skip)")
+    parser.add_argument('--mysql', metavar='USER:PASSWORD@HOST:PORT/DATABASE',
+                        help="Benchmark the pool against this MySQL server instead of a stand-in")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default='benchmark_results.json')
+    args = parser.parse_args()
+
+    # Keep ContentProcessor from replacing processing.log with benchmark output
+    logging.basicConfig(level=logging.WARNING)
+    report = run_benchmarks(args.scales, args.languages.split(','), args.queries,
+                            args.ingest_files, args.workers, args.seed, args.shards, args.pdf_dir,
+                            args.db_threads, args.mysql, args.pdf_files)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print_summary(report)
+    print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
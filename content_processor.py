@@ -1,25 +1,77 @@
 import os
 import logging
+import sqlite3
 import time
 import traceback
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 from pathlib import Path
+from typing import Optional
 from processors import TextProcessor, PDFProcessor
-from db_connector import DatabaseConnector
+from page_cache import PageCache, file_hash
+from db_connector import StorageBackend, connect_database
+from metrics import METRICS, counter, export_metrics, histogram
+from near_duplicates import NearDuplicateIndex
+from profiler import start_profiler, stop_profiler
+
+# Processor class per supported file extension
+PROCESSOR_TYPES = {
+    '.py': TextProcessor,
+    '.sql': TextProcessor,
+    '.pdf': PDFProcessor
+}
+
+# Extraction processes unless a caller passes workers; more than 1 is opt-in,
+# since a process pool re-imports all modules per worker on Windows
+WORKERS = int(os.environ.get('CAS_WORKERS', '1'))
+
+FILE_TIME = histogram('ingest_file_seconds', "Extracting one file (with one worker: extracting and storing it)")
+STORE_TIME = histogram('ingest_store_seconds', "Storing the extracted records of one file (writer stage)")
+WRITER_WAIT_TIME = histogram('ingest_writer_wait_seconds', "Writer waiting for the next extracted file")
+FILES = counter('ingest_files_total', "Files extracted")
+ERRORS = counter('ingest_errors_total', "Files that failed")
+
+def extract_file(file_path, content_hash=None, sign=False):
+    """Worker stage: extract and clean one file without database access.
+
+    Returns (file_path, records, error, error_details, metrics); on failure
+    records is None and error holds the message, error_details the
+    traceback. With sign, each record also carries its near-duplicate
+    signature, so the writer does not have to compute it. metrics holds what
+    this worker process recorded since its previous file.
+    """
+    try:
+        with FILE_TIME.time():
+            processor = PROCESSOR_TYPES[file_path.suffix.lower()](None)
+            records = processor.extract(file_path, content_hash)
+            if sign:
+                records = [(content, metadata, processor.sign(content)) for content, metadata in records]
+        return file_path, records, None, None, METRICS.drain()
+    except Exception as e:
+        return file_path, None, str(e), traceback.format_exc(), METRICS.drain()
 
 class ContentProcessor:
-    def __init__(self, root_dir):
+    def __init__(self, root_dir, workers=None, batch_size=500, db: Optional[StorageBackend] = None,
+                 deduplicate=True):
         self.root_dir = Path(root_dir)
-        self.db = DatabaseConnector(
-            host="127.0.0.1",
-            port=3306,
-            user="root",
-            password="rootroot",
-            database="cas_course_data"
-        )
+        # Number of extraction processes; 1 processes files on the main thread
+        self.workers = workers or WORKERS
+        # Backend from CAS_DB_BACKEND (MySQL by default) unless one is passed in
+        self.db = db or connect_database()
         self.processed_files = 0
         self.total_files = 0
+        self.files_to_process = 0
+        self.skipped_files = 0
+        self.duplicate_files = 0
+        self.dependent_files = 0
+        self.removed_files = 0
         self.total_words = 0
         self.errors = 0
+        self.elapsed = 0.0
+        # (size, mtime, hash) of files being (re)processed in this run
+        self._file_info = {}
+        # Byte-identical copies of a file being processed, stored once it is done
+        self._duplicates = defaultdict(list)
 
         # Configure logging
         logging.basicConfig(
@@ -31,37 +83,282 @@ class ContentProcessor:
             ]
         )
 
-        self.processors = {
-            '.py': TextProcessor(self.db),
-            '.sql': TextProcessor(self.db),
-            '.pdf': PDFProcessor(self.db)
-        }
+        # All writes go through one buffered writer: rows are inserted in bulk
+        # and committed every batch_size rows instead of once per page
+        self.writer = self.db.bulk_writer(batch_size=batch_size)
+        self.processors = {ext: processor_type(self.writer) for ext, processor_type in PROCESSOR_TYPES.items()}
+
+        # Signatures of all stored rows: near-duplicate pages of new files are
+        # stored as references to them, or clustered with them for searching
+        self.duplicates = NearDuplicateIndex.from_rows(self.db.iter_signatures()) if deduplicate else None
+        for processor in self.processors.values():
+            processor.duplicates = self.duplicates
+        if self.duplicates is not None:
+            # Rows lost with a failed batch must not be matched by later pages
+            self.writer.on_discard = self.duplicates.discard
+
+
+    def scan_directory(self):
+        """Collect all supported files below root_dir in a single walk"""
+        logging.info(f"Scanning directory: {self.root_dir}")
+        return [
+            file_path for file_path in self.root_dir.rglob('*')
+            if file_path.suffix.lower() in self.processors and file_path.is_file()
+        ]
+
+    def plan_files(self, files):
+        """Compare scanned files with the manifest and return those that need extraction.
+
+        Files whose size and mtime match the manifest are skipped without being
+        read. Changed or new files are hashed: content already in the database
+        (same hash under another path, or an unchanged file merely touched) is
+        copied or re-registered instead of extracted, and byte-identical new
+        files are extracted only once. Files that disappeared from root_dir
+        have their rows removed.
+        """
+        manifest = self.db.fetch_manifest()
+        known_hashes = {}
+        changed = []
+        for file_path in files:
+            stat = file_path.stat()
+            entry = manifest.get(str(file_path))
+            if entry and entry[0] == stat.st_size and entry[1] == stat.st_mtime:
+                self.skipped_files += 1
+                known_hashes[entry[2]] = str(file_path)
+                continue
+            content_hash = file_hash(file_path)
+            if entry and entry[2] == content_hash:
+                # Touched but unchanged: only refresh the manifest
+                self.skipped_files += 1
+                known_hashes[content_hash] = str(file_path)
+                self.writer.store_manifest(str(file_path), stat.st_size, stat.st_mtime, content_hash)
+                continue
+            changed.append((file_path, (stat.st_size, stat.st_mtime, content_hash)))
 
+        to_process = []
+        copies = []
+        first_with_hash = {}
+        for file_path, info in changed:
+            content_hash = info[2]
+            if content_hash in known_hashes:
+                self.duplicate_files += 1
+                copies.append((known_hashes[content_hash], file_path, info))
+            elif content_hash in first_with_hash:
+                self.duplicate_files += 1
+                self._duplicates[first_with_hash[content_hash]].append((file_path, info))
+            else:
+                first_with_hash[content_hash] = file_path
+                self._file_info[file_path] = info
+                to_process.append(file_path)
+
+        scanned = {str(file_path) for file_path in files}
+        root_prefix = os.path.join(str(self.root_dir), '')
+        removed = []
+        for path in manifest:
+            if path.startswith(root_prefix) and path not in scanned:
+                self.removed_files += 1
+                removed.append(path)
+                self._forget(path)
+                self.writer.delete_content(path)
+                self.writer.remove_manifest(path)
+
+        # Every path whose rows are deleted in this run
+        rewritten = [str(file_path) for file_path in to_process] + removed
+        rewritten += [str(file_path) for _, file_path, _ in copies]
+        rewritten += [str(file_path) for copies_of in self._duplicates.values() for file_path, _ in copies_of]
+        dependents = self._plan_dependents(rewritten, scanned)
+        # Rows deleted later in the run must not be matched by files extracted before that
+        for path in rewritten + [str(file_path) for file_path in dependents]:
+            self._forget(path)
+        for source_path, file_path, info in copies:
+            source = Path(source_path)
+            if source in self._file_info:
+                # The source is extracted again: refer to its new rows once they are stored
+                self._duplicates[source].append((file_path, info))
+            else:
+                self._copy_content(source_path, file_path, info)
+        return to_process + dependents
+
+    def _plan_dependents(self, rewritten, scanned):
+        """Files whose references point at rows that are about to be deleted.
+
+        Their text is stored as rows of a changed or removed file, so they are
+        extracted again (which may in turn affect files referring to them).
+        """
+        queued = set(rewritten)
+        pending = list(rewritten)
+        dependents = []
+        while pending:
+            for path in self.db.fetch_dependent_paths(pending.pop()):
+                if path in queued or path not in scanned:
+                    continue
+                queued.add(path)
+                pending.append(path)
+                file_path = Path(path)
+                stat = file_path.stat()
+                self._file_info[file_path] = (stat.st_size, stat.st_mtime, file_hash(file_path))
+                dependents.append(file_path)
+        self.dependent_files = len(dependents)
+        return dependents
+
+    def _forget(self, file_path):
+        """Drop a file's rows from the near-duplicate index before they are deleted"""
+        if self.duplicates is not None:
+            self.duplicates.remove_path(str(file_path))
+
+    def _copy_content(self, source_path, file_path, info):
+        """Register file_path with the already stored rows of an identical file"""
+        self._forget(file_path)
+        self.writer.delete_content(str(file_path))
+        self.writer.copy_content(str(source_path), str(file_path))
+        self.writer.store_manifest(str(file_path), *info)
+        logging.info(f"Identical to {source_path}, referenced its rows: {file_path}")
+
+    def _content_hash(self, file_path):
+        """Hash computed while planning, so extraction does not read the file twice for it"""
+        info = self._file_info.get(file_path)
+        return info[2] if info else None
+
+    def _begin_file(self, file_path):
+        """Drop rows from a previous version of the file before storing new ones"""
+        self._forget(file_path)
+        self.writer.delete_content(str(file_path))
+
+    def _finish_file(self, file_path):
+        """Record a stored file in the manifest and store its identical copies"""
+        info = self._file_info.pop(file_path, None)
+        if info is None:
+            return
+        self.writer.store_manifest(str(file_path), *info)
+        for duplicate_path, duplicate_info in self._duplicates.pop(file_path, []):
+            self._copy_content(file_path, duplicate_path, duplicate_info)
 
     def process_directory(self):
-        """Process all files in the directory recursively"""
+        """Process new and changed files in the directory recursively"""
+        start_time = time.perf_counter()
         try:
-            # Count total files first
-            logging.info(f"Scanning directory: {self.root_dir}")
-            for file_path in self.root_dir.rglob('*'):
-                if file_path.is_file() and file_path.suffix.lower() in self.processors:
-                    self.total_files += 1
+            files = self.scan_directory()
+            self.total_files = len(files)
             
             if self.total_files == 0:
                 logging.warning("No supported files found in directory")
                 return
             
-            logging.info(f"Found {self.total_files} files to process")
+            files = self.plan_files(files)
+            self.files_to_process = len(files)
+            logging.info(
+                f"Found {self.total_files} files: {self.files_to_process} to process, "
+                f"{self.skipped_files} unchanged, {self.duplicate_files} duplicates, "
+                f"{self.removed_files} removed, {self.dependent_files} re-extracted for references"
+            )
             
             # Process files
-            for file_path in self.root_dir.rglob('*'):
-                if file_path.is_file():
+            if self.workers > 1:
+                self._process_pipelined(files)
+            else:
+                for file_path in files:
                     self.process_file(file_path)
-                    
+
+            self.writer.flush()
+            self._prune_page_cache()
+
         except Exception as e:
             error_msg = f"Error processing directory: {str(e)}\n{traceback.format_exc()}"
             logging.error(error_msg)
             print(f"\nError processing directory: {str(e)}")
+        finally:
+            self.writer.flush()
+            self.elapsed = time.perf_counter() - start_time
+            if self.processed_files:
+                logging.info(
+                    f"Throughput: {self.files_per_second():.2f} files/s, "
+                    f"{self.words_per_second():.0f} words/s with {self.workers} worker(s)"
+                )
+
+    def _process_pipelined(self, files):
+        """Extract files in a process pool while the main thread writes results to the database.
+
+        At most a few files per worker are in flight, so extracted text never
+        piles up faster than the single writer can store it.
+        """
+        max_in_flight = self.workers * 2
+        pending = set()
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            for file_path in files:
+                if self.processors[file_path.suffix.lower()].streams(file_path):
+                    # Shipping a huge file's records back from a worker would hold it
+                    # in memory; the main thread streams it into the database instead
+                    self.process_file(file_path)
+                    continue
+                pending.add(pool.submit(extract_file, file_path, self._content_hash(file_path),
+                                        self.duplicates is not None))
+                if len(pending) >= max_in_flight:
+                    with WRITER_WAIT_TIME.time():
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        self._store_extracted(*future.result())
+            for future in pending:
+                with WRITER_WAIT_TIME.time():
+                    result = future.result()
+                self._store_extracted(*result)
+
+    def _prune_page_cache(self):
+        """Drop cached pages of PDFs no longer in the manifest and cap the cache size"""
+        processor = self.processors['.pdf']
+        cache = PageCache.open(processor.cache_path)
+        if cache is None:
+            return
+        hashes = {content_hash for _, _, content_hash in self.db.fetch_manifest().values()}
+        try:
+            removed = cache.prune(hashes, processor.CACHE_SETTINGS)
+        except sqlite3.Error as e:
+            logging.warning(f"Could not prune the page cache: {e}")
+            return
+        if removed:
+            logging.info(f"Removed {removed} files from the page cache")
+
+    def _store_extracted(self, file_path, records, error, error_details, metrics=None):
+        """Writer stage: persist one worker result and update progress"""
+        self.processed_files += 1
+        if metrics:
+            METRICS.merge(metrics)
+        try:
+            if error is None:
+                processor = self.processors[file_path.suffix.lower()]
+                with STORE_TIME.time():
+                    self._begin_file(file_path)
+                    content_id, word_count = processor.store(file_path, records) if records else (None, 0)
+                    self._finish_file(file_path)
+                FILES.inc()
+                if content_id is not None:
+                    self.total_words += word_count
+                    logging.info(f"Successfully processed: {file_path} ({word_count} words)")
+        except Exception as e:
+            error, error_details = str(e), traceback.format_exc()
+
+        if error is not None:
+            self.errors += 1
+            ERRORS.inc()
+            logging.error(f"Error processing {file_path}: {error}\n{error_details}")
+            print(f"\nError processing {file_path}: {error}")
+            self.writer.store_error(str(file_path), error)
+        self._print_progress()
+
+    def close(self):
+        """Flush pending rows and close the database connection"""
+        self.db.close()
+
+    def _print_progress(self):
+        total = self.files_to_process or self.total_files
+        progress = (self.processed_files / total) * 100
+        # Show progress with proper spacing
+        print(f"\rProgress: {progress:.1f}% | Files: {self.processed_files}/{total} | Words: {self.total_words}      ", end="\n" if progress == 100 else "")
+
+    def files_per_second(self):
+        return self.processed_files / self.elapsed if self.elapsed else 0.0
+
+    def words_per_second(self):
+        return self.total_words / self.elapsed if self.elapsed else 0.0
 
     def process_file(self, file_path):
         """Process a single file based on its extension"""
@@ -71,23 +368,26 @@ class ContentProcessor:
             if ext in self.processors:
                 # Update progress
                 self.processed_files += 1
-                progress = (self.processed_files / self.total_files) * 100
                 
                 # Process file
                 processor = self.processors[ext]
                 try:
                     logging.info(f"Processing {file_path}")
-                    content_id, word_count = processor.process(file_path)
+                    with FILE_TIME.time():
+                        self._begin_file(file_path)
+                        content_id, word_count = processor.process(file_path, self._content_hash(file_path))
+                        self._finish_file(file_path)
+                    FILES.inc()
                     
                     if content_id is not None:
                         self.total_words += word_count
                         logging.info(f"Successfully processed: {file_path} ({word_count} words)")
                     
-                    # Show progress with proper spacing
-                    print(f"\rProgress: {progress:.1f}% | Files: {self.processed_files}/{self.total_files} | Words: {self.total_words}      ", end="\n" if progress == 100 else "")
+                    self._print_progress()
                     
                 except Exception as e:
                     self.errors += 1
+                    ERRORS.inc()
                     error_msg = f"Error processing {file_path}: {str(e)}\n{traceback.format_exc()}"
                     logging.error(error_msg)
                     print(f"\nError processing {file_path}: {str(e)}")
@@ -99,9 +399,6 @@ class ContentProcessor:
             print(f"\nError handling {file_path}: {str(e)}")
 
 def main():
-    # Record start time
-    start_time = time.time()
-
     # Start message
     print("CAS Content Processor")
     print("====================")
@@ -113,22 +410,39 @@ def main():
         print("Error: Invalid directory path")
         return
     
+    workers = input(f"Enter number of worker processes (press Enter for {WORKERS}, "
+                    f"{os.cpu_count()} CPU cores): ").strip()
+    
     # Initialize and run processor
-    processor = ContentProcessor(directory)
-    processor.process_directory()
-
-    # Record end time
-    end_time = time.time()
-    processing_time = end_time - start_time
+    processor = ContentProcessor(directory, workers=int(workers) if workers else None)
+    profiler = start_profiler()
+    try:
+        processor.process_directory()
+    finally:
+        processor.close()
+        stop_profiler(profiler)
     
     # Print summary with proper spacing
     print("\n\nProcessing Summary")
     print("=================")
     print(f"Total files found: {processor.total_files}")
     print(f"Files processed: {processor.processed_files}")
+    print(f"Unchanged files skipped: {processor.skipped_files}")
+    print(f"Duplicate files (not re-extracted): {processor.duplicate_files}")
+    print(f"Files re-extracted for references to changed files: {processor.dependent_files}")
+    print(f"Removed files: {processor.removed_files}")
     print(f"Words extracted: {processor.total_words}")
     print(f"Errors encountered: {processor.errors}")
-    print(f"Processing time: {processing_time:.2f} seconds")
+    print(f"Processing time: {processor.elapsed:.2f} seconds")
+    print(f"Throughput: {processor.files_per_second():.2f} files/s, {processor.words_per_second():.0f} words/s "
+          f"({processor.workers} worker(s))")
+
+    # Time per stage; extraction stages are summed over all workers
+    print("\nStages")
+    print("======")
+    for line in METRICS.summary():
+        print(line)
+    export_metrics()
     
     # Show log file location with absolute path
     log_path = os.path.abspath('processing.log')
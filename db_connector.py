@@ -1,20 +1,567 @@
-import mysql.connector
+import os
+import time
 from datetime import datetime
-from typing import Optional, Tuple, List
+from typing import Callable, Dict, Iterator, Optional, Tuple, List
 
+try:
+    import mysql.connector
+except ImportError:  # Only needed for the MySQL backend
+    mysql = None
 
-class DatabaseConnector:
-    def __init__(self, host="127.0.0.1", port=3306, user="root", password="rootroot", database="cas_course_data"):
+from metrics import COUNT_BUCKETS, histogram
+from mysql_pool import POOL_SIZE, ConnectionPool, is_disconnect, shared_pool
+from near_duplicates import encode_signature
+
+CONTENT_COLUMNS = (
+    "file_path, content, file_type, module, topic, subtopic, chapter, instructor, "
+    "page_number, created_at, word_count"
+)
+
+FLUSH_TIME = histogram('db_flush_seconds', "Writing one batch of buffered rows, including the commit")
+COMMIT_TIME = histogram('db_commit_seconds', "Committing one batch")
+FLUSH_ROWS = histogram('db_flush_rows', "Buffered rows written per batch", COUNT_BUCKETS)
+
+
+def content_row(file_path: str, content: str, metadata: dict, file_type: str) -> Tuple:
+    """Build the parameter tuple for one content INSERT"""
+    word_count = len(content.split()) if content else 0
+    return (
+        str(file_path), content, file_type,
+        metadata.get('module'), metadata.get('topic'),
+        metadata.get('subtopic'), metadata.get('chapter'),
+        metadata.get('instructor'), metadata.get('page_number'),
+        datetime.now(), word_count
+    )
+
+
+class ContentId:
+    """Id of a buffered content row, known once the row has been flushed"""
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value: Optional[int] = None
+
+    def __int__(self) -> int:
+        if self.value is None:
+            raise RuntimeError("Content row has not been flushed yet")
+        return self.value
+
+    def __repr__(self) -> str:
+        return f"ContentId({self.value})"
+
+
+class BulkWriter:
+    """Buffers INSERTs and writes them in bulk, one transaction per flush.
+
+    Rows are flushed once batch_size rows or max_bytes of content are
+    buffered, or when flush_interval seconds have passed since the last flush
+    (checked as rows are added), and on flush()/close(). Offers the same
+    store_* methods as the storage backends, so processors can write through it
+    unchanged; store_content returns a ContentId filled in at flush time.
+    """
+
+    def __init__(self, connector: 'StorageBackend', batch_size: int = 500,
+                 flush_interval: float = 5.0, max_bytes: int = 8 * 2**20):
+        self.connector = connector
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self._contents: List[Tuple] = []
+        self._content_ids: List[ContentId] = []
+        self._content_bytes = 0
+        self._errors: List[Tuple] = []
+        self._file_references: List[Tuple] = []
+        self._deleted_paths: List[Tuple] = []
+        self._copies: List[Tuple] = []
+        self._signatures: List[Tuple] = []
+        self._content_paths: List[Tuple] = []
+        self._manifest: List[Tuple] = []
+        self._removed_manifest: List[Tuple] = []
+        self._last_flush = time.monotonic()
+        # Set once a flush reaches its commit; a commit cut off by a lost connection is not repeated
+        self._committing = False
+        # Called with the ContentIds of the rows a failed flush dropped, e.g. to
+        # remove them from a NearDuplicateIndex that hands them out as matches
+        self.on_discard: Optional[Callable[[List[ContentId]], None]] = None
+
+    def __enter__(self) -> 'BulkWriter':
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    @property
+    def pending(self) -> int:
+        return (len(self._contents) + len(self._errors) + len(self._file_references)
+                + len(self._deleted_paths) + len(self._copies)
+                + len(self._signatures) + len(self._content_paths)
+                + len(self._manifest) + len(self._removed_manifest))
+
+    def store_content(self, file_path: str, content: str, metadata: dict, file_type: str) -> ContentId:
+        """Buffer a content row"""
+        content_id = ContentId()
+        self._contents.append(content_row(file_path, content, metadata, file_type))
+        self._content_ids.append(content_id)
+        self._content_bytes += len(content) if content else 0
+        self._maybe_flush()
+        return content_id
+
+    def store_file_reference(self, file_path: str, file_type: str, metadata: Optional[str] = None):
+        """Buffer a file reference row"""
+        self._file_references.append((file_path, file_type, datetime.now(), metadata))
+        self._maybe_flush()
+
+    def store_error(self, file_path: str, error_message: str):
+        """Buffer a processing error row"""
+        self._errors.append((str(file_path), error_message, datetime.now()))
+        self._maybe_flush()
+
+    def delete_content(self, file_path: str):
+        """Buffer removal of all content rows of a file; runs before the inserts of the same flush"""
+        self._deleted_paths.append((str(file_path),))
+        self._maybe_flush()
+
+    def copy_content(self, source_path: str, target_path: str):
+        """Buffer references from another path to a file's content rows, run after the inserts"""
+        self._copies.append((str(target_path), str(source_path)))
+        self._maybe_flush()
+
+    def store_signature(self, content_id, cluster_id, signature):
+        """Buffer the near-duplicate signature and cluster of a (possibly buffered) content row"""
+        self._signatures.append((content_id, cluster_id, encode_signature(signature)))
+        self._maybe_flush()
+
+    def store_content_path(self, content_id, file_path: str, page_number: Optional[int], similarity: float):
+        """Buffer a reference from a path to a near-duplicate row stored for another file"""
+        self._content_paths.append((content_id, str(file_path), page_number, similarity))
+        self._maybe_flush()
+
+    def store_manifest(self, file_path: str, size: int, mtime: float, content_hash: str):
+        """Buffer a manifest upsert; it commits together with the file's content"""
+        self._manifest.append((str(file_path), size, mtime, content_hash))
+        self._maybe_flush()
+
+    def remove_manifest(self, file_path: str):
+        """Buffer removal of a file from the manifest"""
+        self._removed_manifest.append((str(file_path),))
+        self._maybe_flush()
+
+    def _maybe_flush(self) -> None:
+        if (self.pending >= self.batch_size or self._content_bytes >= self.max_bytes
+                or time.monotonic() - self._last_flush >= self.flush_interval):
+            self.flush()
+
+    def flush(self) -> None:
+        """Write all buffered rows in a single transaction"""
+        self._last_flush = time.monotonic()
+        if not self.pending:
+            return
+        FLUSH_ROWS.observe(self.pending)
+        try:
+            with FLUSH_TIME.time():
+                try:
+                    self._write()
+                except Exception as e:
+                    # The transaction was rolled back with the lost connection: write it again
+                    if self._committing or not self.connector._reconnect_after(e):
+                        raise
+                    self._write()
+        except Exception:
+            # The rows were rolled back: ids assigned during the failed attempt do not exist
+            for content_id in self._content_ids:
+                content_id.value = None
+            if self._content_ids and self.on_discard is not None:
+                self.on_discard(list(self._content_ids))
+            raise
+        finally:
+            self._clear()
+
+    def _write(self) -> None:
+        db, cursor = self.connector.db, self.connector.cursor
+        self._committing = False
+        try:
+            if self._deleted_paths:
+                for table in ('tags', 'content_signatures', 'content_paths'):
+                    cursor.executemany(
+                        f"DELETE FROM {table} WHERE content_id IN (SELECT id FROM content WHERE file_path = %s)",
+                        self._deleted_paths
+                    )
+                cursor.executemany("DELETE FROM content_paths WHERE file_path = %s", self._deleted_paths)
+                cursor.executemany("DELETE FROM content WHERE file_path = %s", self._deleted_paths)
+            if self._contents:
+                ids = self.connector._insert_content_rows(self._contents)
+                for content_id, value in zip(self._content_ids, ids):
+                    content_id.value = value
+            if self._signatures:
+                cursor.executemany(
+                    "INSERT INTO content_signatures (content_id, cluster_id, signature) VALUES (%s, %s, %s)",
+                    [(int(content_id), int(cluster_id), signature)
+                     for content_id, cluster_id, signature in self._signatures]
+                )
+            if self._content_paths:
+                cursor.executemany(
+                    "INSERT INTO content_paths (content_id, file_path, page_number, similarity) VALUES (%s, %s, %s, %s)",
+                    [(int(content_id), *reference) for content_id, *reference in self._content_paths]
+                )
+            if self._copies:
+                # A copy refers to the rows stored for the source and to those it refers to itself
+                cursor.executemany("""
+                    INSERT INTO content_paths (content_id, file_path, page_number, similarity)
+                    SELECT id, %s, page_number, 1.0 FROM content WHERE file_path = %s ORDER BY id
+                """, self._copies)
+                cursor.executemany("""
+                    INSERT INTO content_paths (content_id, file_path, page_number, similarity)
+                    SELECT content_id, %s, page_number, similarity FROM content_paths WHERE file_path = %s ORDER BY id
+                """, self._copies)
+            if self._file_references:
+                cursor.executemany("""
+                    INSERT INTO file_references 
+                    (file_path, file_type, created_at, metadata)
+                    VALUES (%s, %s, %s, %s)
+                """, self._file_references)
+            if self._errors:
+                cursor.executemany("""
+                    INSERT INTO processing_errors 
+                    (file_path, error_message, timestamp)
+                    VALUES (%s, %s, %s)
+                """, self._errors)
+            if self._manifest:
+                cursor.executemany(self.connector.MANIFEST_UPSERT, self._manifest)
+            if self._removed_manifest:
+                cursor.executemany("DELETE FROM file_manifest WHERE file_path = %s", self._removed_manifest)
+            if self._deleted_paths or self._contents or self._signatures or self._content_paths or self._copies:
+                self.connector._content_changed()
+            self._committing = True
+            with COMMIT_TIME.time():
+                db.commit()
+        except Exception:
+            try:
+                db.rollback()
+            except Exception:
+                # A lost connection cannot roll back; the server already did
+                pass
+            raise
+
+    def _clear(self) -> None:
+        self._contents.clear()
+        self._content_ids.clear()
+        self._content_bytes = 0
+        self._file_references.clear()
+        self._errors.clear()
+        self._deleted_paths.clear()
+        self._copies.clear()
+        self._signatures.clear()
+        self._content_paths.clear()
+        self._manifest.clear()
+        self._removed_manifest.clear()
+
+    def close(self) -> None:
+        """Flush remaining rows and detach from the connector"""
+        try:
+            self.flush()
+        finally:
+            if self in self.connector._writers:
+                self.connector._writers.remove(self)
+
+
+class StorageBackend:
+    """Storage interface shared by the MySQL and SQLite backends.
+
+    Subclasses open self.db / self.cursor (a DB-API connection and a cursor
+    accepting %s placeholders) and provide the dialect specific parts: the
+    schema, the manifest upsert, bulk content inserts and the fingerprint.
+    All other queries are written once, here.
+    """
+
+    MANIFEST_UPSERT = ""
+
+    def _init_database(self):
+        """Initialize database with proper tables"""
+        raise NotImplementedError
+
+    def _insert_content_rows(self, rows: List[Tuple]) -> List[int]:
+        """Insert content rows in bulk and return their ids in order"""
+        raise NotImplementedError
+
+    def content_fingerprint(self) -> str:
+        """Return a value that changes whenever the content table changes"""
+        raise NotImplementedError
+
+    def _content_changed(self) -> None:
+        """Bump content_version within the current transaction (SQLite does it with triggers)"""
+
+    def _new_cursor(self):
+        """Open an additional cursor, e.g. for streaming while self.cursor is in use"""
+        return self.db.cursor()
+
+    def _execute(self, query: str, params=()):
+        """Run one statement and return the cursor holding its result.
+
+        Callers read results with fetchall(), so a backend may hand out a
+        separate (prepared) cursor per statement.
+        """
+        self.cursor.execute(query, params)
+        return self.cursor
+
+    def _reconnect_after(self, error: Exception) -> bool:
+        """Replace a lost connection after error; False if the error is not recoverable"""
+        return False
+
+    def fetch_manifest(self) -> Dict[str, Tuple[int, float, str]]:
+        """Return file_path -> (size, mtime, content_hash) for every file seen by earlier runs"""
+        rows = self._execute("SELECT file_path, size, mtime, content_hash FROM file_manifest").fetchall()
+        return {row[0]: (row[1], row[2], row[3]) for row in rows}
+
+    def bulk_writer(self, batch_size: int = 500, flush_interval: float = 5.0) -> BulkWriter:
+        """Return a buffered writer for bulk inserts; it is flushed on close()"""
+        writer = BulkWriter(self, batch_size=batch_size, flush_interval=flush_interval)
+        self._writers.append(writer)
+        return writer
+
+    def store_content(self, file_path: str, content: str, metadata: dict, file_type: str) -> int:
+        """Store processed content in the database"""
+        insert_query = f"""
+            INSERT INTO content 
+            ({CONTENT_COLUMNS})
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        """
+        # Ensure file_path is converted to string
+        cursor = self._execute(insert_query, content_row(file_path, content, metadata, file_type))
+        content_id = cursor.lastrowid
+        self._content_changed()
+        self.db.commit()
+        return content_id
+
+
+    def store_signature(self, content_id: int, cluster_id: int, signature):
+        """Store the near-duplicate signature and cluster of a content row"""
+        self._execute("INSERT INTO content_signatures (content_id, cluster_id, signature) VALUES (%s, %s, %s)",
+                      (int(content_id), int(cluster_id), encode_signature(signature)))
+        self._content_changed()
+        self.db.commit()
+
+    def store_content_path(self, content_id: int, file_path: str, page_number: Optional[int], similarity: float):
+        """Store a reference from a path to a near-duplicate row stored for another file"""
+        self._execute(
+            "INSERT INTO content_paths (content_id, file_path, page_number, similarity) VALUES (%s, %s, %s, %s)",
+            (int(content_id), str(file_path), page_number, similarity))
+        self._content_changed()
+        self.db.commit()
+
+    def store_file_reference(self, file_path: str, file_type: str, metadata: Optional[str] = None):
+        """Store a reference to unprocessed or binary files"""
+        insert_query = """
+            INSERT INTO file_references 
+            (file_path, file_type, created_at, metadata)
+            VALUES (%s, %s, CURRENT_TIMESTAMP, %s)
+        """
+        self._execute(insert_query, (file_path, file_type, metadata))
+        self.db.commit()
+
+    def store_error(self, file_path: str, error_message: str):
+        """Store processing errors in the database"""
+        insert_query = """
+            INSERT INTO processing_errors 
+            (file_path, error_message, timestamp)
+            VALUES (%s, %s, CURRENT_TIMESTAMP)
+        """
+        self._execute(insert_query, (str(file_path), error_message))
+        self.db.commit()
+
+    def fetch_all_content(self) -> List[Tuple]:
+        """Fetch all content from the database"""
+        self.cursor.execute("SELECT * FROM content")
+        return self.cursor.fetchall()
+
+    def count_content(self) -> int:
+        """Number of rows in the content table"""
+        return self._execute("SELECT COUNT(*) FROM content").fetchall()[0][0]
+
+    def iter_content(self, batch_size: int = 1000) -> Iterator[Tuple]:
+        """Stream content rows in id order without loading the whole table.
+
+        Uses keyset pagination (WHERE id > last id), so only batch_size rows
+        are held at a time and the connection stays usable between batches.
+        Rows are (id, file_path, content, file_type, module, topic, subtopic,
+        chapter, instructor, page_number).
+        """
+        cursor = self._new_cursor()
+        last_id = 0
+        try:
+            while True:
+                cursor.execute("""
+                    SELECT id, file_path, content, file_type, module, topic, subtopic,
+                           chapter, instructor, page_number
+                    FROM content WHERE id > %s ORDER BY id LIMIT %s
+                """, (last_id, batch_size))
+                rows = cursor.fetchall()
+                if not rows:
+                    return
+                yield from rows
+                last_id = rows[-1][0]
+        finally:
+            cursor.close()
+
+    def fetch_content(self, content_id: int) -> Optional[str]:
+        """Fetch the text of a single content row"""
+        rows = self._execute("SELECT content FROM content WHERE id = %s", (content_id,)).fetchall()
+        return rows[0][0] if rows else None
+
+    def iter_signatures(self) -> List[Tuple[int, str, int, bytes]]:
+        """(content_id, file_path, cluster_id, signature) of every signed content row"""
+        cursor = self._new_cursor()
+        try:
+            cursor.execute("""
+                SELECT s.content_id, c.file_path, s.cluster_id, s.signature
+                FROM content_signatures s JOIN content c ON c.id = s.content_id ORDER BY s.content_id
+            """)
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+
+    def fetch_clusters(self) -> Dict[int, int]:
+        """content_id -> cluster_id for rows clustered with an earlier, different row"""
+        return dict(self._execute(
+            "SELECT content_id, cluster_id FROM content_signatures WHERE cluster_id <> content_id").fetchall())
+
+    def fetch_content_paths(self) -> Dict[int, List[str]]:
+        """content_id -> other files whose text is stored as that row"""
+        rows = self._execute("SELECT content_id, file_path FROM content_paths ORDER BY id").fetchall()
+        paths: Dict[int, List[str]] = {}
+        for content_id, file_path in rows:
+            if file_path not in paths.setdefault(content_id, []):
+                paths[content_id].append(file_path)
+        return paths
+
+    def fetch_dependent_paths(self, file_path: str) -> List[str]:
+        """Other files with references to rows of file_path; they lose text when it is deleted"""
+        rows = self._execute("""
+            SELECT DISTINCT p.file_path FROM content_paths p JOIN content c ON c.id = p.content_id
+            WHERE c.file_path = %s AND p.file_path <> %s
+        """, (file_path, file_path)).fetchall()
+        return [row[0] for row in rows]
+
+    def fetch_content_slice(self, content_id: int, start: int, length: int) -> Optional[str]:
+        """Fetch length characters of a content row's text, starting at character start"""
+        rows = self._execute("SELECT SUBSTR(content, %s, %s) FROM content WHERE id = %s",
+                             (start + 1, length, content_id)).fetchall()
+        return rows[0][0] if rows else None
+
+    def update_content(self, module: Optional[str], topic: Optional[str], 
+                       instructor: Optional[str], file_path: str):
+        """Update content metadata in the database with length validation"""
+        if module:
+            module = module[:200]
+        if topic:
+            topic = topic[:200]
+        if instructor:
+            instructor = instructor[:100]  # Adjusted for new schema
+            
+        update_query = """
+        UPDATE content 
+        SET module = %s, topic = %s, instructor = %s 
+        WHERE file_path = %s
+        """
+        self._execute(update_query, (module, topic, instructor, file_path))
+        self._content_changed()
+        self.db.commit()
+
+    def close(self):
+        """Flush open bulk writers and close the database connection"""
+        for writer in list(self._writers):
+            writer.close()
+        self.cursor.close()
+        self.db.close()
+
+
+class DatabaseConnector(StorageBackend):
+    """MySQL storage backend.
+
+    With a pool (or a pool_size for the process-wide pool of these
+    settings) the connector holds one pooled connection until close() and
+    returns it instead of closing it; the schema is checked once per pool.
+    Single statements then run as server-side prepared statements, and a
+    statement or batch interrupted by a lost connection is repeated once on
+    a new connection, unless it was already being committed.
+    """
+
+    MANIFEST_UPSERT = """
+        INSERT INTO file_manifest (file_path, size, mtime, content_hash)
+        VALUES (%s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            size = VALUES(size), mtime = VALUES(mtime), content_hash = VALUES(content_hash)
+    """
+
+    def __init__(self, host="127.0.0.1", port=3306, user="root", password="rootroot", database="cas_course_data",
+                 pool: Optional[ConnectionPool] = None, pool_size: int = 0):
         """Initialize the MySQL database connection"""
-        self.db = mysql.connector.connect(
-            host=host,
-            port=port,
-            user=user,
-            password=password,
-            database=database
-        )
+        if pool is None and pool_size > 0:
+            pool = shared_pool(pool_size, host=host, port=port, user=user, password=password, database=database)
+        self.pool = pool
+        self._pooled = None
+        self._consecutive: Optional[bool] = None
+        if pool is not None:
+            self._pooled = pool.acquire()
+            self.db = self._pooled.raw
+        else:
+            if mysql is None:
+                raise ImportError("mysql-connector-python is required for the MySQL backend")
+            self.db = mysql.connector.connect(
+                host=host,
+                port=port,
+                user=user,
+                password=password,
+                database=database
+            )
         self.cursor = self.db.cursor()
-        self._init_database()
+        self._writers: List[BulkWriter] = []
+        if pool is None or not pool.schema_ready:
+            self._init_database()
+            if pool is not None:
+                pool.schema_ready = True
+
+    def _execute(self, query: str, params=()):
+        """Run one statement, prepared on a pooled connection and repeated once if that was lost"""
+        if self._pooled is None:
+            return super()._execute(query, params)
+        # Earlier uncommitted writes would be lost with the connection, so writes
+        # are only repeated outside a transaction; reads always can be
+        retry = query.lstrip()[:6].upper() == 'SELECT' or not self.db.in_transaction
+        try:
+            cursor = self._pooled.cursor(query)
+            cursor.execute(query, params)
+        except Exception as e:
+            if not retry or not self._reconnect_after(e):
+                raise
+            cursor = self._pooled.cursor(query)
+            cursor.execute(query, params)
+        return cursor
+
+    def _reconnect_after(self, error: Exception) -> bool:
+        if self._pooled is None or not is_disconnect(error):
+            return False
+        try:
+            self._pooled = self.pool.replace(self._pooled)
+        except Exception:
+            # replace() gave the slot back; nothing is left to release on close()
+            self._pooled = None
+            raise
+        self.db = self._pooled.raw
+        self.cursor = self.db.cursor()
+        return True
+
+    def close(self):
+        """Flush open bulk writers and return the connection to the pool (or close it)"""
+        if self.pool is None:
+            return super().close()
+        try:
+            for writer in list(self._writers):
+                writer.close()
+        finally:
+            if self._pooled is not None:
+                self.cursor.close()
+                self.pool.release(self._pooled)
+                self._pooled = None
 
     def _init_database(self):
         """Initialize database with proper tables"""
@@ -64,72 +611,118 @@ class DatabaseConnector:
             )
         """)
 
-        self.db.commit()
+        # Tracks which files are in the database, so unchanged files can be skipped
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS file_manifest (
+                file_path VARCHAR(500) PRIMARY KEY,
+                size BIGINT,
+                mtime DOUBLE,
+                content_hash CHAR(64),
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                INDEX idx_manifest_hash (content_hash)
+            )
+        """)
 
-    def store_content(self, file_path: str, content: str, metadata: dict, file_type: str) -> int:
-        """Store processed content in the database"""
-        word_count = len(content.split()) if content else 0
-        insert_query = """
-            INSERT INTO content 
-            (file_path, content, file_type, module, topic, subtopic, chapter, instructor, page_number, created_at, word_count)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, NOW(), %s)
-        """
-        # Ensure file_path is converted to string
-        self.cursor.execute(insert_query, (
-            str(file_path), content, file_type,
-            metadata.get('module'), metadata.get('topic'),
-            metadata.get('subtopic'), metadata.get('chapter'),
-            metadata.get('instructor'), metadata.get('page_number'),
-            word_count
-        ))
-        self.db.commit()
-        return self.cursor.lastrowid
+        # Near-duplicate detection: signature and cluster of each stored row, and
+        # paths whose text is stored as another file's row
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS content_signatures (
+                content_id INT PRIMARY KEY,
+                cluster_id INT NOT NULL,
+                signature VARBINARY(256) NOT NULL
+            )
+        """)
 
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS content_paths (
+                id INT AUTO_INCREMENT PRIMARY KEY,
+                content_id INT NOT NULL,
+                file_path VARCHAR(500),
+                page_number INT,
+                similarity FLOAT,
+                INDEX idx_content_paths_content (content_id),
+                INDEX idx_content_paths_file_path (file_path)
+            )
+        """)
 
-    def store_file_reference(self, file_path: str, file_type: str, metadata: Optional[str] = None):
-        """Store a reference to unprocessed or binary files"""
-        insert_query = """
-            INSERT INTO file_references 
-            (file_path, file_type, created_at, metadata)
-            VALUES (%s, %s, NOW(), %s)
-        """
-        self.cursor.execute(insert_query, (file_path, file_type, metadata))
-        self.db.commit()
+        # Bumped by every write to the tables above that the index is built from;
+        # part of the index fingerprint
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS content_version (
+                id TINYINT PRIMARY KEY,
+                version BIGINT NOT NULL
+            )
+        """)
+        self.cursor.execute("INSERT IGNORE INTO content_version (id, version) VALUES (1, 0)")
+
+        self._ensure_index('content', 'idx_content_file_path', 'file_path')
 
-    def store_error(self, file_path: str, error_message: str):
-        """Store processing errors in the database"""
-        insert_query = """
-            INSERT INTO processing_errors 
-            (file_path, error_message, timestamp)
-            VALUES (%s, %s, NOW())
-        """
-        self.cursor.execute(insert_query, (str(file_path), error_message))
         self.db.commit()
 
-    def fetch_all_content(self) -> List[Tuple]:
-        """Fetch all content from the database"""
-        self.cursor.execute("SELECT * FROM content")
-        return self.cursor.fetchall()
+    def _ensure_index(self, table: str, name: str, column: str):
+        """Create an index on an existing table unless it is already there"""
+        self.cursor.execute("""
+            SELECT COUNT(*) FROM information_schema.statistics
+            WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s
+        """, (table, name))
+        if not self.cursor.fetchone()[0]:
+            self.cursor.execute(f"CREATE INDEX {name} ON {table} ({column})")
 
-    def update_content(self, module: Optional[str], topic: Optional[str], 
-                       instructor: Optional[str], file_path: str):
-        """Update content metadata in the database with length validation"""
-        if module:
-            module = module[:200]
-        if topic:
-            topic = topic[:200]
-        if instructor:
-            instructor = instructor[:100]  # Adjusted for new schema
-            
-        update_query = """
-        UPDATE content 
-        SET module = %s, topic = %s, instructor = %s 
-        WHERE file_path = %s
-        """
-        self.cursor.execute(update_query, (module, topic, instructor, file_path))
-        self.db.commit()
+    def _content_changed(self) -> None:
+        self.cursor.execute("UPDATE content_version SET version = version + 1 WHERE id = 1")
 
-    def close(self):
-        """Close the database connection"""
-        self.cursor.close()
-        self.db.close()
+    def _consecutive_ids(self) -> bool:
+        """Whether one multi-row INSERT gets consecutive ids (checked once per connector)"""
+        if self._consecutive is None:
+            self.cursor.execute("SELECT @@auto_increment_increment, @@innodb_autoinc_lock_mode")
+            increment, lock_mode = self.cursor.fetchone()
+            # Lock mode 2 (interleaved) may hand out ids of concurrent inserts in between
+            self._consecutive = int(increment) == 1 and int(lock_mode) in (0, 1)
+        return self._consecutive
+
+    def _insert_content_rows(self, rows: List[Tuple]) -> List[int]:
+        row_placeholders = "(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)"
+        if not self._consecutive_ids():
+            ids = []
+            for row in rows:
+                self.cursor.execute(f"INSERT INTO content ({CONTENT_COLUMNS}) VALUES {row_placeholders}", row)
+                ids.append(self.cursor.lastrowid)
+            return ids
+        # One multi-row INSERT: MySQL reports the first generated id
+        # and assigns the rest consecutively
+        placeholders = ", ".join([row_placeholders] * len(rows))
+        self.cursor.execute(
+            f"INSERT INTO content ({CONTENT_COLUMNS}) VALUES {placeholders}",
+            [value for row in rows for value in row]
+        )
+        first_id = self.cursor.lastrowid
+        return list(range(first_id, first_id + len(rows)))
+
+    def content_fingerprint(self) -> str:
+        """Return a value that changes whenever the content table or its duplicate references change"""
+        self.cursor.execute("SELECT COUNT(*), MAX(id) FROM content")
+        count, max_id = self.cursor.fetchone()
+        # A counter row instead of CHECKSUM TABLE, which reads every row
+        self.cursor.execute("SELECT version FROM content_version WHERE id = 1")
+        version = self.cursor.fetchone()[0]
+        return f"{count}:{max_id}:{version}"
+
+
+def connect_database(backend: Optional[str] = None, pool_size: Optional[int] = None, **kwargs) -> StorageBackend:
+    """Open the configured storage backend.
+
+    backend is 'mysql' or 'sqlite'; it defaults to the CAS_DB_BACKEND
+    environment variable and then to MySQL. MySQL connections come from a
+    pool of pool_size connections shared within the process (default
+    CAS_DB_POOL_SIZE, 0 for an unpooled connection). For SQLite the database
+    file is taken from CAS_SQLITE_PATH unless a path is passed.
+    """
+    backend = (backend or os.environ.get('CAS_DB_BACKEND', 'mysql')).lower()
+    if backend == 'mysql':
+        kwargs.setdefault('pool_size', POOL_SIZE if pool_size is None else pool_size)
+        return DatabaseConnector(**kwargs)
+    if backend == 'sqlite':
+        from sqlite_connector import SQLiteConnector
+        kwargs.setdefault('path', os.environ.get('CAS_SQLITE_PATH', 'cas_content.db'))
+        return SQLiteConnector(**kwargs)
+    raise ValueError(f"Unknown database backend '{backend}', expected 'mysql' or 'sqlite'")
@@ -0,0 +1,282 @@
+import json
+import mmap
+import os
+import struct
+from array import array
+from collections.abc import MutableMapping, Sequence
+from typing import Dict, List, Optional, Tuple
+
+from postings import InvertedIndex, PostingList, encode_positions, encode_varints
+
+# File layout:
+#   header   MAGIC | version (u16) | section count (u16)
+#   table    per section: name (32 bytes, NUL padded) | offset (u64) | length (u64)
+#   sections raw bytes, addressed through the table
+#
+# Each inverted index (full text and one per metadata field) is stored as
+# three sections named <index>.terms, <index>.postings and <index>.lengths.
+MAGIC = b"CASIDX"
+FORMAT_VERSION = 10
+
+_HEADER = struct.Struct("<6sHH")
+_SECTION = struct.Struct("<32sQQ")
+# doc id, term frequency and position block offset/length, document frequency;
+# the position block is empty for non-positional (field) indexes
+_TERM_ENTRY = struct.Struct("<QIQIQII")
+
+
+class IndexFormatError(Exception):
+    """Raised when an index file is missing, corrupt or has an unsupported version"""
+
+
+class MappedPostings(MutableMapping):
+    """Term -> PostingList mapping backed by a memory-mapped index file.
+
+    Posting lists are decoded on first access and kept afterwards, so only the
+    terms actually queried (or extended by add_document) cost memory. Like the
+    defaultdict it replaces, unknown terms yield a new empty PostingList.
+    """
+
+    def __init__(self, buffer, terms: Dict[str, Tuple[int, int, int, int, int, int, int]]):
+        self._buffer = buffer
+        self._terms = terms
+        self._decoded: Dict[str, PostingList] = {}
+
+    def __getitem__(self, term: str) -> PostingList:
+        postings = self._decoded.get(term)
+        if postings is None:
+            location = self._terms.get(term)
+            postings = PostingList.decode(self._buffer, *location[:6]) if location else PostingList()
+            self._decoded[term] = postings
+        return postings
+
+    def __setitem__(self, term: str, postings: PostingList) -> None:
+        self._decoded[term] = postings
+
+    def __delitem__(self, term: str) -> None:
+        found = self._terms.pop(term, None) is not None
+        found = self._decoded.pop(term, None) is not None or found
+        if not found:
+            raise KeyError(term)
+
+    def __contains__(self, term) -> bool:
+        return term in self._decoded or term in self._terms
+
+    def __iter__(self):
+        yield from self._terms
+        for term in self._decoded:
+            if term not in self._terms:
+                yield term
+
+    def __len__(self) -> int:
+        return len(self._terms) + sum(1 for term in self._decoded if term not in self._terms)
+
+    def doc_freqs(self) -> Dict[str, int]:
+        """Document frequency of every term, read from the term table where not yet decoded"""
+        doc_freqs = {term: location[6] for term, location in self._terms.items()}
+        for term, postings in self._decoded.items():
+            if postings:
+                doc_freqs[term] = len(postings)
+            else:
+                doc_freqs.pop(term, None)
+        return doc_freqs
+
+
+class MappedDocuments(Sequence):
+    """Document table backed by a memory-mapped index file.
+
+    Stored documents are decoded from the mapping on every access instead of
+    being held in memory; documents added after loading live in a plain list.
+    """
+
+    def __init__(self, buffer, offset: int, length: int):
+        self._buffer = buffer
+        (self._count,) = struct.unpack_from("<I", buffer, offset)
+        self._offsets = struct.unpack_from(f"<{self._count + 1}Q", buffer, offset + 4)
+        self._data_start = offset + 4 + 8 * (self._count + 1)
+        self._appended: List[Dict] = []
+
+    def __getitem__(self, doc_id: int) -> Dict:
+        if doc_id < 0:
+            doc_id += len(self)
+        if doc_id >= self._count:
+            return self._appended[doc_id - self._count]
+        if doc_id < 0:
+            raise IndexError(doc_id)
+        start = self._data_start + self._offsets[doc_id]
+        end = self._data_start + self._offsets[doc_id + 1]
+        return json.loads(bytes(self._buffer[start:end]).decode("utf-8"))
+
+    def __len__(self) -> int:
+        return self._count + len(self._appended)
+
+    def append(self, doc: Dict) -> None:
+        self._appended.append(doc)
+
+
+def _encode_documents(documents) -> bytes:
+    blobs = [json.dumps(doc, ensure_ascii=False, default=str).encode("utf-8") for doc in documents]
+    offsets = [0]
+    for blob in blobs:
+        offsets.append(offsets[-1] + len(blob))
+    header = struct.pack(f"<I{len(offsets)}Q", len(blobs), *offsets)
+    return header + b"".join(blobs)
+
+
+def _encode_terms(index) -> Tuple[bytes, bytes]:
+    term_table = bytearray()
+    postings = bytearray()
+    for term in sorted(index):
+        posting_list = index[term]
+        if not posting_list:
+            continue
+        doc_block = encode_varints(posting_list.doc_ids, delta=True)
+        tf_block = encode_varints(posting_list.frequencies)
+        pos_block = (encode_positions(posting_list.positions, posting_list.frequencies)
+                     if posting_list.has_positions else b"")
+        encoded_term = term.encode("utf-8")
+        term_table += struct.pack("<H", len(encoded_term)) + encoded_term
+        tf_offset = len(postings) + len(doc_block)
+        term_table += _TERM_ENTRY.pack(len(postings), len(doc_block), tf_offset, len(tf_block),
+                                       tf_offset + len(tf_block), len(pos_block), len(posting_list))
+        postings += doc_block + tf_block + pos_block
+    return bytes(term_table), bytes(postings)
+
+
+def _decode_terms(buffer, offset: int, length: int,
+                  postings_offset: int) -> Dict[str, Tuple[int, int, int, int, int, int, int]]:
+    """Return the doc id, term frequency and position block locations and the df of every term"""
+    terms = {}
+    position = offset
+    end = offset + length
+    while position < end:
+        (term_length,) = struct.unpack_from("<H", buffer, position)
+        position += 2
+        term = bytes(buffer[position:position + term_length]).decode("utf-8")
+        position += term_length
+        doc_offset, doc_length, tf_offset, tf_length, pos_offset, pos_length, doc_freq = \
+            _TERM_ENTRY.unpack_from(buffer, position)
+        position += _TERM_ENTRY.size
+        terms[term] = (postings_offset + doc_offset, doc_length, postings_offset + tf_offset, tf_length,
+                       postings_offset + pos_offset, pos_length, doc_freq)
+    return terms
+
+
+def _inverted_indexes(engine) -> Dict[str, InvertedIndex]:
+    indexes = {'text': engine.index}
+    for name, field_index in engine.field_index.items():
+        indexes[f"field:{name}"] = field_index
+    return indexes
+
+
+def save_index(engine, path: str, fingerprint: Optional[str] = None) -> None:
+    """Write the engine's postings and document table to path atomically"""
+    indexes = _inverted_indexes(engine)
+    meta = {
+        'doc_count': len(engine.documents),
+        'total_lengths': {name: inverted.total_length for name, inverted in indexes.items()},
+        'fingerprint': fingerprint,
+        'analyzer': engine.analyzer.config(),
+    }
+    sections = [
+        (b"meta", json.dumps(meta).encode("utf-8")),
+        (b"docs", _encode_documents(engine.documents)),
+        (b"clusters", engine.clusters.tobytes()),
+    ]
+    for name, inverted in indexes.items():
+        term_table, postings = _encode_terms(inverted.postings)
+        sections.append((f"{name}.terms".encode("ascii"), term_table))
+        sections.append((f"{name}.postings".encode("ascii"), postings))
+        sections.append((f"{name}.lengths".encode("ascii"), array('I', inverted.doc_lengths).tobytes()))
+
+    offset = _HEADER.size + _SECTION.size * len(sections)
+    table = bytearray()
+    for name, data in sections:
+        table += _SECTION.pack(name, offset, len(data))
+        offset += len(data)
+
+    # Write to a temp file first so a crash never leaves a half-written index
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, len(sections)))
+        f.write(table)
+        for _, data in sections:
+            f.write(data)
+    os.replace(tmp_path, path)
+
+
+def read_sections(buffer) -> Dict[str, Tuple[int, int]]:
+    """Validate the header and return the section table"""
+    if len(buffer) < _HEADER.size:
+        raise IndexFormatError("Index file is truncated")
+    magic, version, count = _HEADER.unpack_from(buffer, 0)
+    if magic != MAGIC:
+        raise IndexFormatError("Not a search index file")
+    if version != FORMAT_VERSION:
+        raise IndexFormatError(f"Unsupported index version {version} (expected {FORMAT_VERSION})")
+    sections = {}
+    for i in range(count):
+        name, offset, length = _SECTION.unpack_from(buffer, _HEADER.size + i * _SECTION.size)
+        name = name.rstrip(b"\x00").decode("ascii")
+        if offset + length > len(buffer):
+            raise IndexFormatError(f"Section {name} exceeds file size")
+        sections[name] = (offset, length)
+    return sections
+
+
+def _read_meta(buffer, sections) -> Dict:
+    offset, length = sections['meta']
+    return json.loads(bytes(buffer[offset:offset + length]).decode("utf-8"))
+
+
+def read_fingerprint(path: str) -> Optional[str]:
+    """Return the content fingerprint stored in an index file, or None if unreadable"""
+    try:
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            return _read_meta(buffer, read_sections(buffer)).get('fingerprint')
+    except (OSError, KeyError, ValueError, IndexFormatError):
+        return None
+
+
+def _load_inverted(buffer, sections, name: str, total_length: int) -> InvertedIndex:
+    terms_offset, terms_length = sections[f"{name}.terms"]
+    postings_offset, _ = sections[f"{name}.postings"]
+    lengths_offset, lengths_size = sections[f"{name}.lengths"]
+    inverted = InvertedIndex()
+    inverted.postings = MappedPostings(buffer, _decode_terms(buffer, terms_offset, terms_length, postings_offset))
+    inverted.doc_lengths = array('I', buffer[lengths_offset:lengths_offset + lengths_size])
+    inverted.total_length = total_length
+    return inverted
+
+
+def load_index(path: str, engine):
+    """Memory-map an index file and attach its contents to an empty engine"""
+    with open(path, "rb") as f:
+        try:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            raise IndexFormatError("Index file is empty")
+    try:
+        sections = read_sections(buffer)
+        meta = _read_meta(buffer, sections)
+        if meta.get('analyzer') != engine.analyzer.config():
+            raise IndexFormatError("Index was built with different analyzer settings")
+        documents = MappedDocuments(buffer, *sections['docs'])
+        clusters_offset, clusters_length = sections['clusters']
+        clusters = array('q', buffer[clusters_offset:clusters_offset + clusters_length])
+        indexes = {name: _load_inverted(buffer, sections, name, total_length)
+                   for name, total_length in meta['total_lengths'].items()}
+    except IndexFormatError:
+        buffer.close()
+        raise
+    except (KeyError, ValueError, struct.error) as e:
+        buffer.close()
+        raise IndexFormatError(f"Corrupt index file: {e}")
+
+    engine.documents = documents
+    engine.clusters = clusters
+    engine.index = indexes.pop('text')
+    engine.field_index = {name[len("field:"):]: inverted for name, inverted in indexes.items()}
+    engine.fingerprint = meta.get('fingerprint')
+    engine._mapping = buffer
+    return engine
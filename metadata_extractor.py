@@ -0,0 +1,123 @@
+import json
+import os
+import re
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Pattern, Tuple
+
+# Patterns per metadata field; each has exactly one capture group, the value
+DEFAULT_PATTERNS = {
+    'module': [
+        r'(?:CAS|Certificate of Advanced Studies)\s+([^\.]+)',
+        r'(?:Modul|Module)\s*(?:\d+)?:\s*([^\n]+)',
+        r'(?:^|\n)M\d+\s*[-:]\s*([^\n]+)'
+    ],
+    'topic': [
+        r'(?:Topic|Thema|Subject)\s*:\s*([^\n]+)',
+        r'(?:^|\n)(?:Thema|Topic)\s*\d*\s*[-:]\s*([^\n]+)'
+    ],
+    'instructor': [
+        r'(?:Instructor|Dozent|Lecturer|Referent)\s*:\s*([^\n]+)',
+        r'(?:By|Von)\s*:\s*([^\n]+)'
+    ]
+}
+
+# JSON file with additional fields or patterns, e.g. {"chapter": ["Kapitel\\s*\\d+\\s*:\\s*([^\\n]+)"]}
+METADATA_PATTERNS_PATH = os.environ.get('CAS_METADATA_PATTERNS')
+# Longer matches are taken for running text rather than a label value
+MAX_VALUE_LENGTH = 100
+FLAGS = re.IGNORECASE | re.MULTILINE
+
+
+class MetadataExtractor:
+    """Finds metadata values (module, topic, instructor, ...) in one scan of the text.
+
+    All patterns are combined into a single alternation, compiled once per
+    set of requested fields and only tried where a word starts, so a label
+    like "Von:" is not found inside "davon:". Where it matches, every pattern
+    still open is tried on its own. The result is that of running the
+    patterns one by one: each pattern takes its first acceptable value
+    (non-empty and shorter than max_length) and a later pattern of a field
+    overrides an earlier one, so patterns added in CAS_METADATA_PATTERNS
+    take precedence. After every new value the scan goes on with only the
+    patterns that could still override one, and ends when none is left.
+    """
+
+    def __init__(self, patterns: Dict[str, List[str]] = DEFAULT_PATTERNS, max_length: int = MAX_VALUE_LENGTH):
+        self.compiled: Dict[str, List[Pattern]] = {}
+        for field, pattern_list in patterns.items():
+            self.compiled[field] = []
+            for pattern in pattern_list:
+                compiled = re.compile(pattern, FLAGS)
+                if compiled.groups != 1 or compiled.groupindex:
+                    raise ValueError(f"Pattern for '{field}' must have exactly one unnamed group: {pattern}")
+                self.compiled[field].append(compiled)
+        self.patterns = {field: list(pattern_list) for field, pattern_list in patterns.items()}
+        self.fields = tuple(self.patterns)
+        self.max_length = max_length
+        self._scanners: Dict[Tuple[Tuple[str, int], ...], Pattern] = {}
+
+    def _scanner(self, patterns: Tuple[Tuple[str, int], ...]) -> Pattern:
+        """Zero-width pattern matching wherever one of the (field, rank) patterns starts"""
+        scanner = self._scanners.get(patterns)
+        if scanner is None:
+            alternatives = [f"(?:{self.patterns[field][rank]})" for field, rank in patterns]
+            # Zero-width, so a match never hides one of another field inside its value
+            scanner = self._scanners[patterns] = re.compile(r"(?<!\w)(?=" + "|".join(alternatives) + ")", FLAGS)
+        return scanner
+
+    def extract(self, text: str, fields: Optional[Iterable[str]] = None) -> Dict[str, str]:
+        """Values of all fields (or only the given ones) found in text"""
+        fields = self.fields if fields is None else tuple(field for field in self.fields if field in fields)
+        if not fields or not text:
+            return {}
+        # Patterns as (field, rank); a higher rank overrides a lower one
+        open_patterns = tuple((field, rank) for field in fields for rank in range(len(self.compiled[field])))
+        # Like re.finditer: after a rejected value a pattern resumes at its end
+        resume: Dict[Tuple[str, int], int] = {}
+        best: Dict[str, Tuple[int, str]] = {}
+        position = 0
+        while open_patterns:
+            accepted = False
+            for match in self._scanner(open_patterns).finditer(text, position):
+                position = match.start()
+                for field, rank in open_patterns:
+                    if position < resume.get((field, rank), 0) or (field in best and best[field][0] >= rank):
+                        continue
+                    found = self.compiled[field][rank].match(text, position)
+                    if found is None:
+                        continue
+                    value = found.group(1)
+                    value = value.strip() if value else None
+                    if value and len(value) < self.max_length:
+                        best[field] = (rank, value)
+                        accepted = True
+                    else:
+                        resume[field, rank] = max(found.end(), position + 1)
+                if accepted:
+                    break
+            if not accepted:
+                break
+            # Only patterns that could still override a value keep scanning
+            open_patterns = tuple((field, rank) for field, rank in open_patterns
+                                  if field not in best or rank > best[field][0])
+            position += 1
+        return {field: best[field][1] for field in fields if field in best}
+
+
+def load_patterns(path: Optional[str]) -> Dict[str, List[str]]:
+    """Default patterns extended by the fields/patterns of a JSON file"""
+    patterns = {field: list(pattern_list) for field, pattern_list in DEFAULT_PATTERNS.items()}
+    if path:
+        with open(path, encoding='utf-8') as f:
+            extra = json.load(f)
+        for field, pattern_list in extra.items():
+            if isinstance(pattern_list, str):
+                pattern_list = [pattern_list]
+            patterns.setdefault(field, []).extend(pattern_list)
+    return patterns
+
+
+@lru_cache(maxsize=None)
+def default_extractor() -> MetadataExtractor:
+    """Extractor shared by all processors of this process, built from CAS_METADATA_PATTERNS"""
+    return MetadataExtractor(load_patterns(METADATA_PATTERNS_PATH))
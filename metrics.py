@@ -0,0 +1,290 @@
+import json
+import math
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, Iterable, Optional, Sequence
+
+# CAS_METRICS=0 turns all recording into no-ops
+METRICS_ENABLED = os.environ.get('CAS_METRICS', '1') != '0'
+# File the command line tools export their metrics to when they finish (.prom for Prometheus text, else JSON)
+METRICS_PATH = os.environ.get('CAS_METRICS_PATH')
+# CAS_PROGRESS=0 hides all progress bars (tqdm is then not imported either)
+PROGRESS_ENABLED = os.environ.get('CAS_PROGRESS', '1') != '0'
+
+# Upper bounds of the timing buckets in seconds, from 50 µs to 10 s
+TIME_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Upper bounds of the size buckets (documents, rows, ...)
+COUNT_BUCKETS = (1, 10, 100, 1000, 10000, 100000, 1000000)
+
+
+class Counter:
+    """Monotonically increasing total, e.g. files processed"""
+
+    kind = 'counter'
+
+    def __init__(self, name: str, help: str = ''):
+        self.name = name
+        self.help = help
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1) -> None:
+        if METRICS_ENABLED:
+            with self._lock:
+                self.value += amount
+
+    def snapshot(self) -> float:
+        return self.value
+
+    def merge(self, value: float) -> None:
+        with self._lock:
+            self.value += value
+
+    def reset(self) -> None:
+        with self._lock:
+            self.value = 0
+
+
+class _Timer:
+    """Context manager adding the seconds spent inside it to a histogram"""
+
+    __slots__ = ('histogram', 'start')
+
+    def __init__(self, histogram: 'Histogram'):
+        self.histogram = histogram
+
+    def __enter__(self) -> '_Timer':
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+class _NoTimer:
+    __slots__ = ()
+
+    def __enter__(self) -> '_NoTimer':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        pass
+
+
+_NO_TIMER = _NoTimer()
+
+
+class Histogram:
+    """Distribution of observed values in fixed buckets, with their count and sum.
+
+    Buckets are upper bounds as in Prometheus; values above the last one
+    land in an implicit +Inf bucket. Observing is one bisect and a few
+    additions, cheap enough for per-file and per-query stages, but not for
+    per-document loops.
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str = '', buckets: Sequence[float] = TIME_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        if METRICS_ENABLED:
+            with self._lock:
+                self.counts[bisect_left(self.buckets, value)] += 1
+                self.count += 1
+                self.sum += value
+
+    def time(self):
+        """with histogram.time(): ... records the seconds the block took"""
+        return _Timer(self) if METRICS_ENABLED else _NO_TIMER
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-quantile (the last bound if it is beyond)"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.buckets[-1]
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {'count': self.count, 'sum': self.sum, 'counts': list(self.counts)}
+
+    def merge(self, snapshot: Dict) -> None:
+        with self._lock:
+            self.counts = [a + b for a, b in zip(self.counts, snapshot['counts'])]
+            self.count += snapshot['count']
+            self.sum += snapshot['sum']
+
+    def reset(self) -> None:
+        with self._lock:
+            self.counts = [0] * (len(self.buckets) + 1)
+            self.count = 0
+            self.sum = 0.0
+
+
+class MetricsRegistry:
+    """Named counters and histograms of one process, exportable as JSON or Prometheus text.
+
+    Modules create their metrics once at import time (like their compiled
+    regexes) and record into them on the hot path. Worker processes send
+    drain() snapshots back to the main process, which merge()s them.
+    """
+
+    def __init__(self):
+        self.metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, metric_type, name: str, *args):
+        with self._lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = metric_type(name, *args)
+            elif not isinstance(metric, metric_type):
+                raise ValueError(f"Metric '{name}' is already registered as a {metric.kind}")
+            return metric
+
+    def counter(self, name: str, help: str = '') -> Counter:
+        return self._get(Counter, name, help)
+
+    def histogram(self, name: str, help: str = '', buckets: Sequence[float] = TIME_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, help, buckets)
+
+    def snapshot(self) -> Dict[str, object]:
+        """Current values by metric name: a number per counter, count/sum/counts per histogram"""
+        return {name: metric.snapshot() for name, metric in list(self.metrics.items())}
+
+    def drain(self) -> Dict[str, object]:
+        """Snapshot of the values recorded since the last drain(), resetting them"""
+        snapshot = {}
+        for name, metric in list(self.metrics.items()):
+            value = metric.snapshot()
+            recorded = value if isinstance(metric, Counter) else value['count']
+            if recorded:
+                snapshot[name] = value
+                metric.reset()
+        return snapshot
+
+    def merge(self, snapshot: Dict[str, object]) -> None:
+        """Add the values of a snapshot taken in another process"""
+        for name, value in snapshot.items():
+            metric = self.metrics.get(name)
+            if metric is not None:
+                metric.merge(value)
+
+    def reset(self) -> None:
+        for metric in list(self.metrics.values()):
+            metric.reset()
+
+    def to_json(self) -> Dict[str, Dict]:
+        """Counters and histograms (with mean and estimated percentiles) as plain JSON data"""
+        counters = {}
+        histograms = {}
+        for name, metric in sorted(self.metrics.items()):
+            if isinstance(metric, Counter):
+                counters[name] = metric.value
+            else:
+                histograms[name] = {
+                    'count': metric.count,
+                    'sum': metric.sum,
+                    'mean': metric.sum / metric.count if metric.count else 0.0,
+                    'p50': metric.quantile(0.5),
+                    'p95': metric.quantile(0.95),
+                    'p99': metric.quantile(0.99),
+                    'buckets': {_format_bound(bound): count
+                                for bound, count in zip(metric.buckets + (math.inf,), metric.counts)},
+                }
+        return {'counters': counters, 'histograms': histograms}
+
+    def to_prometheus(self, prefix: str = 'cas_') -> str:
+        """Text exposition format (version 0.0.4), e.g. for a /metrics endpoint"""
+        lines = []
+        for name, metric in sorted(self.metrics.items()):
+            full_name = prefix + name
+            if metric.help:
+                lines.append(f"# HELP {full_name} {metric.help}")
+            lines.append(f"# TYPE {full_name} {metric.kind}")
+            if isinstance(metric, Counter):
+                lines.append(f"{full_name} {_format_value(metric.value)}")
+                continue
+            snapshot = metric.snapshot()
+            cumulative = 0
+            for bound, count in zip(metric.buckets + (math.inf,), snapshot['counts']):
+                cumulative += count
+                lines.append(f'{full_name}_bucket{{le="{_format_bound(bound)}"}} {cumulative}')
+            lines.append(f"{full_name}_sum {_format_value(snapshot['sum'])}")
+            lines.append(f"{full_name}_count {snapshot['count']}")
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path: str) -> None:
+        """Export to a file: Prometheus text for .prom/.txt, JSON otherwise"""
+        with open(path, 'w', encoding='utf-8') as f:
+            if os.path.splitext(path)[1].lower() in ('.prom', '.txt'):
+                f.write(self.to_prometheus())
+            else:
+                json.dump(self.to_json(), f, indent=2)
+
+    def summary(self, prefix: str = '') -> Iterable[str]:
+        """One line per histogram whose name starts with prefix, most total time first"""
+        histograms = [metric for name, metric in self.metrics.items()
+                      if isinstance(metric, Histogram) and name.startswith(prefix) and metric.count]
+        for metric in sorted(histograms, key=lambda metric: -metric.sum):
+            mean = metric.sum / metric.count
+            if metric.buckets == TIME_BUCKETS:
+                yield (f"{metric.name}: {metric.count} x, total {metric.sum:.3f} s, "
+                       f"mean {mean * 1000:.3f} ms, p95 <= {metric.quantile(0.95) * 1000:g} ms")
+            else:
+                yield f"{metric.name}: {metric.count} x, mean {mean:.1f}, p95 <= {metric.quantile(0.95):g}"
+
+
+
+def _format_bound(bound: float) -> str:
+    return '+Inf' if bound == math.inf else f"{bound:g}"
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+# Registry of this process, used by all modules
+METRICS = MetricsRegistry()
+
+
+def counter(name: str, help: str = '') -> Counter:
+    return METRICS.counter(name, help)
+
+
+def histogram(name: str, help: str = '', buckets: Sequence[float] = TIME_BUCKETS) -> Histogram:
+    return METRICS.histogram(name, help, buckets)
+
+
+def export_metrics(path: Optional[str] = METRICS_PATH) -> None:
+    """Write the metrics to path (CAS_METRICS_PATH by default), if one is set"""
+    if path:
+        METRICS.write(path)
+        print(f"Metrics written to {os.path.abspath(path)}")
+
+
+def progress(iterable, enabled: bool = True, **kwargs):
+    """iterable wrapped in a tqdm progress bar, or unchanged if bars are off or tqdm is missing"""
+    if not enabled or not PROGRESS_ENABLED:
+        return iterable
+    try:
+        from tqdm import tqdm  # Fortschrittsbalken
+    except ImportError:
+        return iterable
+    return tqdm(iterable, **kwargs)
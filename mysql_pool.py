@@ -0,0 +1,327 @@
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+try:
+    import mysql.connector
+except ImportError:  # Only needed for the MySQL backend
+    mysql = None
+
+from metrics import counter, histogram
+
+# Connections per pool; 0 makes connect_database() open unpooled connections
+POOL_SIZE = int(os.environ.get('CAS_DB_POOL_SIZE', '10'))
+# Idle connections older than this are pinged before they are handed out
+HEALTH_CHECK_INTERVAL = 30.0
+# Client errors of a connection that is gone: server has gone away, lost
+# connection during query, lost connection (extended)
+DISCONNECT_ERRORS = {2006, 2013, 2055}
+# ... and those worth retrying when connecting: no socket, connection refused
+CONNECT_RETRY_ERRORS = DISCONNECT_ERRORS | {2002, 2003}
+
+WAIT_TIME = histogram('db_pool_wait_seconds', "Waiting for a free pooled connection")
+CONNECTS = counter('db_pool_connects_total', "Connections opened by a pool")
+RECONNECTS = counter('db_pool_reconnects_total', "Dropped connections replaced by a pool")
+
+# One pool per process and connection settings; connections must not cross a fork
+_shared_pools: Dict[Tuple, 'ConnectionPool'] = {}
+_shared_lock = threading.Lock()
+
+
+class PoolTimeout(RuntimeError):
+    """No connection became free within the pool's timeout"""
+
+
+def is_disconnect(error: BaseException) -> bool:
+    """True if error means the connection was lost (and the statement did not run)"""
+    return getattr(error, 'errno', None) in DISCONNECT_ERRORS
+
+
+class PooledConnection:
+    """A connection owned by a pool, with the statements prepared on it"""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.last_used = time.monotonic()
+        self._statements: Dict[str, object] = {}
+
+    def cursor(self, query: str):
+        """Cursor with query prepared on the server; prepared on first use, then reused"""
+        cursor = self._statements.get(query)
+        if cursor is None:
+            cursor = self._statements[query] = self.raw.cursor(prepared=True)
+        return cursor
+
+    def close(self) -> None:
+        for cursor in self._statements.values():
+            try:
+                cursor.close()
+            except Exception:
+                pass
+        self._statements.clear()
+        try:
+            self.raw.close()
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    """Thread-safe pool of at most size MySQL connections.
+
+    Connections are opened on demand and handed out most recently used
+    first; callers wait up to timeout seconds for a free one. A connection
+    idle for longer than health_check_interval is pinged before it is handed
+    out and replaced if it is gone. Opening a connection is retried with
+    exponential backoff while the server is unreachable. Each connection
+    keeps its prepared statements, so a query is prepared once per
+    connection and afterwards only executed.
+
+    The query helpers (fetch_all, fetch_one, execute, executemany) retry a
+    statement once on a new connection if the old one was lost before the
+    statement took effect; a commit cut off by a lost connection is not
+    retried, since it may have succeeded.
+    """
+
+    def __init__(self, size: int = POOL_SIZE, timeout: float = 10.0,
+                 health_check_interval: float = HEALTH_CHECK_INTERVAL, connect_retries: int = 3,
+                 retry_delay: float = 0.5, connect: Optional[Callable] = None, **connect_kwargs):
+        if size < 1:
+            raise ValueError("Pool size must be at least 1")
+        if connect is None:
+            if mysql is None:
+                raise ImportError("mysql-connector-python is required for the MySQL backend")
+            connect = mysql.connector.connect
+        self.size = size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self.connect_retries = connect_retries
+        self.retry_delay = retry_delay
+        self._connect = partial(connect, **connect_kwargs)
+        # Set by the first DatabaseConnector, so the schema is checked once per pool
+        self.schema_ready = False
+        self._idle: deque = deque()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._in_use = 0
+        self._closed = False
+
+    def __enter__(self) -> 'ConnectionPool':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _open(self) -> PooledConnection:
+        for attempt in range(self.connect_retries + 1):
+            try:
+                raw = self._connect()
+            except Exception as e:
+                if attempt == self.connect_retries or getattr(e, 'errno', None) not in CONNECT_RETRY_ERRORS:
+                    raise
+                time.sleep(self.retry_delay * 2 ** attempt)
+                continue
+            CONNECTS.inc()
+            return PooledConnection(raw)
+
+    @staticmethod
+    def _healthy(conn: PooledConnection) -> bool:
+        try:
+            conn.raw.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+
+    def acquire(self, timeout: Optional[float] = None) -> PooledConnection:
+        """Take a connection, waiting up to timeout (default: the pool's) for a free one"""
+        if self._closed:
+            raise RuntimeError("Connection pool is closed")
+        timeout = self.timeout if timeout is None else timeout
+        start = time.perf_counter()
+        if not self._slots.acquire(timeout=timeout):
+            raise PoolTimeout(f"No free database connection within {timeout}s (pool size {self.size})")
+        WAIT_TIME.observe(time.perf_counter() - start)
+        try:
+            with self._lock:
+                conn = self._idle.pop() if self._idle else None
+                self._in_use += 1
+            if conn is None:
+                return self._open()
+            if time.monotonic() - conn.last_used >= self.health_check_interval and not self._healthy(conn):
+                conn.close()
+                RECONNECTS.inc()
+                return self._open()
+            return conn
+        except BaseException:
+            self._give_back_slot()
+            raise
+
+    def release(self, conn: PooledConnection, discard: bool = False) -> None:
+        """Return a connection; discarded (e.g. lost) connections are closed instead"""
+        try:
+            if not discard and not self._closed:
+                # Never hand out a connection with another caller's open transaction
+                if getattr(conn.raw, 'in_transaction', False):
+                    conn.raw.rollback()
+                conn.last_used = time.monotonic()
+                with self._lock:
+                    self._idle.append(conn)
+                conn = None
+        except Exception:
+            pass
+        finally:
+            if conn is not None:
+                conn.close()
+            self._give_back_slot()
+
+    def _give_back_slot(self) -> None:
+        with self._lock:
+            self._in_use -= 1
+        self._slots.release()
+
+    def replace(self, conn: PooledConnection) -> PooledConnection:
+        """Close a lost connection and open a new one in its place (keeping the slot)"""
+        conn.close()
+        RECONNECTS.inc()
+        try:
+            return self._open()
+        except BaseException:
+            self._give_back_slot()
+            raise
+
+    @contextmanager
+    def connection(self) -> Iterator[PooledConnection]:
+        """with pool.connection() as conn: ... returns conn to the pool afterwards"""
+        conn = self.acquire()
+        discard = False
+        try:
+            yield conn
+        except Exception as e:
+            discard = is_disconnect(e)
+            raise
+        finally:
+            self.release(conn, discard)
+
+    def _run(self, query: str, params, read: Optional[Callable], commit: bool, many: bool = False):
+        for attempt in range(2):
+            conn = self.acquire()
+            committing = False
+            try:
+                # executemany on a plain cursor becomes one multi-row INSERT
+                cursor = conn.raw.cursor() if many else conn.cursor(query)
+                if many:
+                    cursor.executemany(query, params)
+                else:
+                    cursor.execute(query, params)
+                value = read(cursor) if read is not None else cursor.lastrowid
+                if many:
+                    cursor.close()
+                if commit:
+                    committing = True
+                    conn.raw.commit()
+            except Exception as e:
+                lost = is_disconnect(e)
+                self.release(conn, discard=lost)
+                if not lost or committing or attempt:
+                    raise
+                RECONNECTS.inc()
+                continue
+            self.release(conn)
+            return value
+
+    def fetch_all(self, query: str, params: Sequence = ()) -> List[Tuple]:
+        """All rows of a prepared query"""
+        return self._run(query, params, lambda cursor: cursor.fetchall(), commit=False)
+
+    def fetch_one(self, query: str, params: Sequence = ()) -> Optional[Tuple]:
+        """First row of a prepared query, or None"""
+        rows = self.fetch_all(query, params)
+        return rows[0] if rows else None
+
+    def execute(self, query: str, params: Sequence = ()) -> int:
+        """Run and commit a prepared statement; returns the generated id of an INSERT"""
+        return self._run(query, params, None, commit=True)
+
+    def executemany(self, query: str, seq_of_params: Sequence[Sequence]) -> None:
+        """Run and commit a statement for many parameter rows in one transaction"""
+        self._run(query, seq_of_params, lambda cursor: None, commit=True, many=True)
+
+    def connector(self):
+        """A DatabaseConnector holding one connection of this pool until it is closed"""
+        from db_connector import DatabaseConnector
+        return DatabaseConnector(pool=self)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'size': self.size, 'in_use': self._in_use, 'idle': len(self._idle)}
+
+    def close(self) -> None:
+        """Close idle connections; connections still in use are closed when released"""
+        self._closed = True
+        with self._lock:
+            idle, self._idle = list(self._idle), deque()
+        for conn in idle:
+            conn.close()
+
+
+class AsyncConnectionPool:
+    """asyncio front end of a ConnectionPool.
+
+    mysql.connector speaks a blocking protocol, so every call runs on one of
+    size threads and the event loop only awaits the result: at most size
+    queries run at once, and further callers wait without blocking the loop.
+    """
+
+    def __init__(self, pool: Optional[ConnectionPool] = None, **pool_kwargs):
+        self.pool = pool or ConnectionPool(**pool_kwargs)
+        self._executor = ThreadPoolExecutor(max_workers=self.pool.size, thread_name_prefix="db-pool")
+
+    async def __aenter__(self) -> 'AsyncConnectionPool':
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    async def _call(self, function: Callable, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, partial(function, *args))
+
+    async def fetch_all(self, query: str, params: Sequence = ()) -> List[Tuple]:
+        return await self._call(self.pool.fetch_all, query, params)
+
+    async def fetch_one(self, query: str, params: Sequence = ()) -> Optional[Tuple]:
+        return await self._call(self.pool.fetch_one, query, params)
+
+    async def execute(self, query: str, params: Sequence = ()) -> int:
+        return await self._call(self.pool.execute, query, params)
+
+    async def executemany(self, query: str, seq_of_params: Sequence[Sequence]) -> None:
+        await self._call(self.pool.executemany, query, seq_of_params)
+
+    async def run(self, function: Callable):
+        """Call function(db) with a pooled DatabaseConnector, e.g. await pool.run(lambda db: db.fetch_content(1))"""
+        def call():
+            db = self.pool.connector()
+            try:
+                return function(db)
+            finally:
+                db.close()
+        return await self._call(call)
+
+    async def close(self) -> None:
+        self._executor.shutdown(wait=True)
+        self.pool.close()
+
+
+def shared_pool(size: int = POOL_SIZE, **connect_kwargs) -> ConnectionPool:
+    """The pool of this process for the given connection settings, created on first use"""
+    key = (os.getpid(), size, tuple(sorted(connect_kwargs.items())))
+    with _shared_lock:
+        pool = _shared_pools.get(key)
+        if pool is None or pool._closed:
+            pool = _shared_pools[key] = ConnectionPool(size, **connect_kwargs)
+        return pool
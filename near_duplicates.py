@@ -0,0 +1,222 @@
+import argparse
+import sys
+import zlib
+from array import array
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from analyzer import WORD_PATTERN
+
+# Words per shingle; a signature describes the set of shingles of a text
+SHINGLE_SIZE = 4
+# Bins of a signature (one-permutation MinHash): the top 6 bits of a shingle hash pick the bin
+SIGNATURE_SIZE = 64
+_BIN_SHIFT = 26
+_VALUE_MASK = (1 << _BIN_SHIFT) - 1
+# Locality sensitive hashing: rows that agree on all bins of one band are compared
+BANDS = 16
+ROWS_PER_BAND = SIGNATURE_SIZE // BANDS
+# Estimated Jaccard similarity of the shingle sets from which a row is stored
+# only once, as a path reference to the earlier row
+DUPLICATE_THRESHOLD = 0.9
+# ... from which rows are stored separately but shown as one search hit (same cluster)
+CLUSTER_THRESHOLD = 0.6
+
+Signature = array
+
+
+def signature(text: str) -> Optional[Signature]:
+    """MinHash signature of the word shingles of text, None if it has no words.
+
+    Every shingle is hashed once (CRC-32, spread by a multiplicative hash);
+    its top bits choose one of SIGNATURE_SIZE bins, which keeps the smallest
+    value. Empty bins take the value of the next filled bin plus their
+    distance to it (densification), so short texts get full signatures too.
+    The fraction of equal bins of two signatures estimates the Jaccard
+    similarity of the shingle sets.
+    """
+    words = WORD_PATTERN.findall(text.lower())
+    if not words:
+        return None
+    bins = [None] * SIGNATURE_SIZE
+    crc32 = zlib.crc32
+    shingles = zip(*(words[i:] for i in range(SHINGLE_SIZE))) if len(words) >= SHINGLE_SIZE else [words]
+    for shingle in shingles:
+        h = crc32(' '.join(shingle).encode('utf-8')) * 0x9E3779B1 & 0xFFFFFFFF
+        b = h >> _BIN_SHIFT
+        value = h & _VALUE_MASK
+        if bins[b] is None or value < bins[b]:
+            bins[b] = value
+    if None in bins:
+        _densify(bins)
+    return array('I', bins)
+
+
+def _densify(bins: List[Optional[int]]) -> None:
+    """Fill each empty bin from the next filled bin to its right (circularly)"""
+    filled = next(b for b, value in enumerate(bins) if value is not None)
+    source, distance = bins[filled], 0
+    # Walking left from a filled bin, the last filled bin seen is the next one to the right
+    for offset in range(1, SIGNATURE_SIZE):
+        b = (filled - offset) % SIGNATURE_SIZE
+        if bins[b] is None:
+            distance += 1
+            # Above every real value, so a filled bin never equals a borrowed one
+            bins[b] = distance << _BIN_SHIFT | source
+        else:
+            source, distance = bins[b], 0
+
+
+def similarity(a: Signature, b: Signature) -> float:
+    """Estimated Jaccard similarity of the texts of two signatures"""
+    return sum(x == y for x, y in zip(a, b)) / SIGNATURE_SIZE
+
+
+def encode_signature(sig: Signature) -> bytes:
+    """Little-endian bytes for the database"""
+    if sys.byteorder == 'big':
+        sig = array('I', sig)
+        sig.byteswap()
+    return sig.tobytes()
+
+
+def decode_signature(data: bytes) -> Signature:
+    sig = array('I')
+    sig.frombytes(bytes(data))
+    if sys.byteorder == 'big':
+        sig.byteswap()
+    return sig
+
+
+class NearDuplicateIndex:
+    """Signatures of stored content rows, searchable for near-duplicates of a new row.
+
+    Only rows that were stored (not those stored as references) are added.
+    Each band of a signature is a key into a hash table, so a lookup only
+    compares the rows sharing at least one band with the new signature
+    instead of every row. Content and cluster ids may be ContentIds that are
+    filled in once their rows are flushed.
+    """
+
+    def __init__(self, duplicate_threshold: float = DUPLICATE_THRESHOLD,
+                 cluster_threshold: float = CLUSTER_THRESHOLD):
+        self.duplicate_threshold = duplicate_threshold
+        self.cluster_threshold = cluster_threshold
+        # Entry lists, indexed by entry number; removed entries have signature None
+        self.content_ids: List = []
+        self.cluster_ids: List = []
+        self.signatures: List[Optional[Signature]] = []
+        self.paths: List[str] = []
+        self._bands: Dict[int, List[int]] = {}
+        self._by_path: Dict[str, List[int]] = {}
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Tuple[int, str, int, bytes]], **kwargs) -> 'NearDuplicateIndex':
+        """Build from (content_id, file_path, cluster_id, signature bytes) rows"""
+        index = cls(**kwargs)
+        for content_id, file_path, cluster_id, data in rows:
+            index.add(content_id, file_path, cluster_id, decode_signature(data))
+        return index
+
+    def __len__(self) -> int:
+        return sum(len(entries) for entries in self._by_path.values())
+
+    @staticmethod
+    def _band_keys(sig: Signature) -> List[int]:
+        # Deterministic: tuples of ints hash the same in every process
+        return [hash((band,) + tuple(sig[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]))
+                for band in range(BANDS)]
+
+    def add(self, content_id, file_path: str, cluster_id, sig: Signature) -> None:
+        entry = len(self.signatures)
+        self.content_ids.append(content_id)
+        self.cluster_ids.append(cluster_id)
+        self.signatures.append(sig)
+        self.paths.append(file_path)
+        for key in self._band_keys(sig):
+            self._bands.setdefault(key, []).append(entry)
+        self._by_path.setdefault(file_path, []).append(entry)
+
+    def remove_path(self, file_path: str) -> None:
+        """Forget the rows of a file, e.g. before it is extracted again"""
+        for entry in self._by_path.pop(file_path, []):
+            self._forget(entry)
+
+    def discard(self, content_ids: Iterable) -> None:
+        """Forget rows with these (ContentId) ids or in their clusters, e.g. after their batch failed to write"""
+        lost = set(content_ids)
+        for entry, sig in enumerate(self.signatures):
+            if sig is not None and (self.content_ids[entry] in lost or self.cluster_ids[entry] in lost):
+                self._forget(entry)
+                entries = self._by_path[self.paths[entry]]
+                entries.remove(entry)
+                if not entries:
+                    del self._by_path[self.paths[entry]]
+
+    def _forget(self, entry: int) -> None:
+        sig = self.signatures[entry]
+        self.signatures[entry] = None
+        for key in self._band_keys(sig):
+            self._bands[key].remove(entry)
+            if not self._bands[key]:
+                del self._bands[key]
+
+    def best_match(self, sig: Signature) -> Optional[Tuple[object, object, float]]:
+        """(content_id, cluster_id, similarity) of the most similar row at or above cluster_threshold"""
+        candidates = set()
+        for key in self._band_keys(sig):
+            candidates.update(self._bands.get(key, ()))
+        best, best_similarity = None, -1.0
+        # In entry order, so ties go to the earliest row
+        for entry in sorted(candidates):
+            value = similarity(sig, self.signatures[entry])
+            if value > best_similarity:
+                best, best_similarity = entry, value
+        if best is None or best_similarity < self.cluster_threshold:
+            return None
+        return self.content_ids[best], self.cluster_ids[best], best_similarity
+
+
+def backfill(db, duplicate_threshold: float = DUPLICATE_THRESHOLD,
+             cluster_threshold: float = CLUSTER_THRESHOLD) -> Tuple[int, int]:
+    """Compute signatures and clusters for content rows stored without one.
+
+    Rows stay stored; near-duplicates are only put into the cluster of the
+    earlier row, so searches can collapse them. Returns the number of rows
+    signed and how many of them joined an existing cluster.
+    """
+    index = NearDuplicateIndex.from_rows(db.iter_signatures(), duplicate_threshold=duplicate_threshold,
+                                         cluster_threshold=cluster_threshold)
+    signed = set(index.content_ids)
+    added = clustered = 0
+    with db.bulk_writer() as writer:
+        for row in db.iter_content():
+            content_id, file_path, content = row[0], row[1], row[2]
+            sig = signature(content or '') if content_id not in signed else None
+            if sig is None:
+                continue
+            match = index.best_match(sig)
+            cluster_id = match[1] if match else content_id
+            clustered += match is not None
+            writer.store_signature(content_id, cluster_id, sig)
+            index.add(content_id, file_path, cluster_id, sig)
+            added += 1
+    return added, clustered
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sign and cluster content rows stored before near-duplicate detection")
+    parser.add_argument('--cluster-threshold', type=float, default=CLUSTER_THRESHOLD,
+                        help="Estimated similarity from which rows are collapsed into one search hit")
+    args = parser.parse_args()
+
+    from db_connector import connect_database
+    db = connect_database()
+    try:
+        added, clustered = backfill(db, cluster_threshold=args.cluster_threshold)
+    finally:
+        db.close()
+    print(f"Signed {added} content rows, {clustered} of them near-duplicates of earlier rows")
+
+
+if __name__ == "__main__":
+    main()
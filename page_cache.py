@@ -0,0 +1,140 @@
+import hashlib
+import os
+import sqlite3
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Cache file for extracted PDF pages; an empty CAS_PAGE_CACHE disables caching
+PAGE_CACHE_PATH = os.environ.get('CAS_PAGE_CACHE', 'pdf_page_cache.db')
+# Text kept in the cache; prune() evicts the files stored longest ago beyond it
+PAGE_CACHE_MAX_BYTES = int(os.environ.get('CAS_PAGE_CACHE_MAX_MB', '512')) * 2**20
+
+# Only takes effect when the file is created; lets prune() give freed pages back to the OS
+_SCHEMA = """
+PRAGMA auto_vacuum = INCREMENTAL;
+CREATE TABLE IF NOT EXISTS pdf_pages (
+    file_hash CHAR(64) NOT NULL,
+    settings TEXT NOT NULL,
+    page_number INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    PRIMARY KEY (file_hash, settings, page_number)
+);
+CREATE TABLE IF NOT EXISTS pdf_files (
+    file_hash CHAR(64) NOT NULL,
+    settings TEXT NOT NULL,
+    page_count INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    stored_at REAL NOT NULL,
+    PRIMARY KEY (file_hash, settings)
+);
+"""
+
+# One connection per cache file and process; sqlite connections must not cross a fork
+_open_caches: Dict[Tuple[str, int], 'PageCache'] = {}
+
+
+def file_hash(file_path, chunk_size=1 << 20):
+    """SHA-256 of a file's bytes, read in chunks"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class PageCache:
+    """Extracted page texts on disk, keyed by file hash and page number.
+
+    A file's pages are only returned once all of them were stored, so an
+    interrupted extraction is simply repeated. settings identifies the
+    extraction options that produced the text; changing them misses the
+    cache instead of returning text extracted differently. The cache can be
+    shared by several processes (WAL mode) and deleted at any time.
+
+    Entries are not removed as files change; the ContentProcessor calls
+    prune() after each run with the hashes still in the manifest, which
+    also caps the cache at max_bytes of text.
+    """
+
+    def __init__(self, path: str = PAGE_CACHE_PATH):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(pdf_files)")]
+        if columns and 'size' not in columns:
+            # Written by an older version without sizes; it is only a cache
+            self.conn.executescript("DROP TABLE pdf_files; DROP TABLE IF EXISTS pdf_pages;")
+        self.conn.executescript(_SCHEMA)
+
+    @classmethod
+    def open(cls, path: str = PAGE_CACHE_PATH) -> Optional['PageCache']:
+        """Shared cache for this process, or None if caching is disabled"""
+        if not path:
+            return None
+        key = (os.path.abspath(path), os.getpid())
+        cache = _open_caches.get(key)
+        if cache is None:
+            cache = _open_caches[key] = cls(path)
+        return cache
+
+    def get(self, content_hash: str, settings: str) -> Optional[List[str]]:
+        """Texts of all pages in order, or None if the file is not (completely) cached"""
+        row = self.conn.execute("SELECT page_count FROM pdf_files WHERE file_hash = ? AND settings = ?",
+                                (content_hash, settings)).fetchone()
+        if row is None:
+            return None
+        pages = self.conn.execute(
+            "SELECT text FROM pdf_pages WHERE file_hash = ? AND settings = ? ORDER BY page_number",
+            (content_hash, settings)).fetchall()
+        if len(pages) != row[0]:
+            return None
+        return [text for (text,) in pages]
+
+    def put(self, content_hash: str, settings: str, pages: List[str]) -> None:
+        """Store the texts of all pages of a file in one transaction"""
+        with self.conn:
+            self.conn.execute("DELETE FROM pdf_pages WHERE file_hash = ? AND settings = ?", (content_hash, settings))
+            self.conn.executemany(
+                "INSERT INTO pdf_pages (file_hash, settings, page_number, text) VALUES (?, ?, ?, ?)",
+                [(content_hash, settings, page_number, text) for page_number, text in enumerate(pages, start=1)])
+            self.conn.execute(
+                "INSERT OR REPLACE INTO pdf_files (file_hash, settings, page_count, size, stored_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (content_hash, settings, len(pages), sum(len(text.encode('utf-8')) for text in pages), time.time()))
+
+    def size(self) -> int:
+        """Bytes of page text in the cache"""
+        return self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM pdf_files").fetchone()[0]
+
+    def prune(self, keep_hashes: Iterable[str], settings: str,
+              max_bytes: int = PAGE_CACHE_MAX_BYTES) -> int:
+        """Remove files not in keep_hashes or cached with other settings, then the oldest beyond max_bytes.
+
+        Returns the number of files removed.
+        """
+        with self.conn:
+            self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS keep_hashes (file_hash TEXT PRIMARY KEY)")
+            self.conn.execute("DELETE FROM keep_hashes")
+            self.conn.executemany("INSERT OR IGNORE INTO keep_hashes VALUES (?)", ((h,) for h in keep_hashes))
+            removed = [row for row in self.conn.execute("""
+                SELECT file_hash, settings FROM pdf_files
+                WHERE settings <> ? OR file_hash NOT IN (SELECT file_hash FROM keep_hashes)
+            """, (settings,))]
+            total = 0
+            for file_hash, file_settings, size in self.conn.execute(
+                    "SELECT file_hash, settings, size FROM pdf_files WHERE settings = ? "
+                    "AND file_hash IN (SELECT file_hash FROM keep_hashes) ORDER BY stored_at DESC", (settings,)):
+                total += size
+                if total > max_bytes:
+                    removed.append((file_hash, file_settings))
+            self.conn.executemany("DELETE FROM pdf_pages WHERE file_hash = ? AND settings = ?", removed)
+            self.conn.executemany("DELETE FROM pdf_files WHERE file_hash = ? AND settings = ?", removed)
+            self.conn.execute("DELETE FROM keep_hashes")
+        if removed:
+            self.conn.execute("PRAGMA incremental_vacuum")
+        return len(removed)
+
+    def close(self) -> None:
+        self.conn.close()
+        _open_caches.pop((os.path.abspath(self.path), os.getpid()), None)
@@ -0,0 +1,408 @@
+import argparse
+import random
+import time
+import tracemalloc
+from array import array
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from itertools import accumulate
+from typing import Dict, Iterable, Iterator, List, Mapping, Optional, Sequence
+
+
+def encode_varints(values: Sequence[int], delta: bool = False) -> bytes:
+    """Encode non-negative ints as LEB128 varints, optionally as gaps of a sorted list"""
+    out = bytearray()
+    previous = 0
+    for value in values:
+        if delta:
+            value, previous = value - previous, value
+        while value >= 0x80:
+            out.append((value & 0x7F) | 0x80)
+            value >>= 7
+        out.append(value)
+    return bytes(out)
+
+
+def decode_varints(buffer, offset: int, length: int, delta: bool = False) -> array:
+    """Decode a block written by encode_varints into an array('I')"""
+    values = array('I')
+    current = 0
+    value = 0
+    shift = 0
+    for byte in buffer[offset:offset + length]:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        if delta:
+            current += value
+            value = current
+        values.append(value)
+        value = 0
+        shift = 0
+    return values
+
+
+def encode_positions(positions: Sequence[int], frequencies: Sequence[int]) -> bytes:
+    """Varint-encode word positions as gaps, restarting at every document"""
+    out = bytearray()
+    start = 0
+    for frequency in frequencies:
+        out += encode_varints(positions[start:start + frequency], delta=True)
+        start += frequency
+    return bytes(out)
+
+
+def decode_positions(buffer, offset: int, length: int, frequencies: Sequence[int]) -> array:
+    """Decode a block written by encode_positions"""
+    positions = decode_varints(buffer, offset, length)
+    start = 0
+    for frequency in frequencies:
+        for i in range(start + 1, start + frequency):
+            positions[i] += positions[i - 1]
+        start += frequency
+    return positions
+
+
+class PostingList:
+    """Sorted doc ids of one term with their term frequencies.
+
+    Both columns are array('I') buffers (4 bytes per entry) instead of lists
+    of Python ints. Doc ids must be appended in increasing order, which
+    add_document guarantees by assigning ids sequentially.
+
+    Positional lists also keep the word positions of every occurrence in
+    one array, frequency entries per document. Lists decoded from an index
+    file only decode their positions when a phrase query first needs them.
+    """
+
+    __slots__ = ('doc_ids', 'frequencies', '_positions', '_position_offsets', '_position_block', '_max_frequency')
+
+    def __init__(self, doc_ids: array = None, frequencies: array = None, positions: array = None):
+        self.doc_ids = doc_ids if doc_ids is not None else array('I')
+        self.frequencies = frequencies if frequencies is not None else array('I')
+        self._positions = positions
+        self._position_offsets = None
+        self._position_block = None
+        self._max_frequency: Optional[int] = None
+
+    def append(self, doc_id: int, frequency: int = 1, positions: Sequence[int] = None) -> None:
+        if self.doc_ids and doc_id <= self.doc_ids[-1]:
+            raise ValueError(f"Doc id {doc_id} appended out of order")
+        if positions is not None:
+            if len(positions) != frequency:
+                raise ValueError(f"Expected {frequency} positions, got {len(positions)}")
+            if self._positions is None:
+                if self.doc_ids and self._position_block is None:
+                    raise ValueError("Cannot add positions to a non-positional posting list")
+                self._load_positions()
+            if self._position_offsets is not None:
+                self._position_offsets.append(len(self._positions) + frequency)
+            self._positions.extend(positions)
+        self.doc_ids.append(doc_id)
+        self.frequencies.append(frequency)
+        if self._max_frequency is not None and frequency > self._max_frequency:
+            self._max_frequency = frequency
+
+    @property
+    def max_frequency(self) -> int:
+        """Highest term frequency of any document; scanned once, then kept up to date by append()"""
+        if self._max_frequency is None:
+            self._max_frequency = max(self.frequencies, default=0)
+        return self._max_frequency
+
+    def _index(self, doc_id: int) -> int:
+        """Entry of doc_id, or -1 if the term does not occur there"""
+        position = bisect_left(self.doc_ids, doc_id)
+        if position < len(self.doc_ids) and self.doc_ids[position] == doc_id:
+            return position
+        return -1
+
+    def frequency(self, doc_id: int) -> int:
+        """Term frequency in doc_id, or 0 if the term does not occur there"""
+        position = self._index(doc_id)
+        return self.frequencies[position] if position >= 0 else 0
+
+    @property
+    def has_positions(self) -> bool:
+        return self._positions is not None or self._position_block is not None
+
+    @property
+    def positions(self) -> array:
+        """Positions of all occurrences, grouped by document (empty if not positional)"""
+        if self._positions is None:
+            self._load_positions()
+        return self._positions
+
+    def _load_positions(self) -> None:
+        # Safe under concurrent readers: _positions is set before the block is
+        # dropped, so a racing thread at worst decodes the block twice
+        block = self._position_block
+        if block is not None:
+            self._positions = decode_positions(*block, self.frequencies)
+            self._position_block = None
+        elif self._positions is None:
+            self._positions = array('I')
+
+    def doc_positions(self, doc_id: int) -> Sequence[int]:
+        """Sorted word positions of the term in doc_id"""
+        position = self._index(doc_id)
+        if position < 0 or not self.has_positions:
+            return array('I')
+        positions = self.positions
+        if self._position_offsets is None:
+            self._position_offsets = array('I', accumulate(self.frequencies, initial=0))
+        return positions[self._position_offsets[position]:self._position_offsets[position + 1]]
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.doc_ids)
+
+    def __contains__(self, doc_id: int) -> bool:
+        return self.frequency(doc_id) > 0
+
+    def encode(self) -> bytes:
+        """Varint-encode as doc id gaps followed by frequencies"""
+        return encode_varints(self.doc_ids, delta=True) + encode_varints(self.frequencies)
+
+    @classmethod
+    def decode(cls, buffer, doc_offset: int, doc_length: int, freq_offset: int, freq_length: int,
+               pos_offset: int = 0, pos_length: int = 0) -> 'PostingList':
+        postings = cls(decode_varints(buffer, doc_offset, doc_length, delta=True),
+                       decode_varints(buffer, freq_offset, freq_length))
+        if pos_length:
+            postings._position_block = (buffer, pos_offset, pos_length)
+        return postings
+
+
+@dataclass
+class CollectionStats:
+    """Document count, total length and document frequencies of a collection"""
+    doc_count: int
+    total_length: int
+    doc_freqs: Dict[str, int]
+
+    @classmethod
+    def merge(cls, parts: Iterable['CollectionStats']) -> 'CollectionStats':
+        """Statistics of the union of disjoint document sets (e.g. shards)"""
+        doc_count = 0
+        total_length = 0
+        doc_freqs = Counter()
+        for part in parts:
+            doc_count += part.doc_count
+            total_length += part.total_length
+            doc_freqs.update(part.doc_freqs)
+        return cls(doc_count, total_length, dict(doc_freqs))
+
+
+class InvertedIndex:
+    """Term postings plus the per-document lengths used for length normalization.
+
+    Every document gets a length entry, even when it contributes no terms, so
+    doc_lengths can be indexed by doc id directly.
+
+    An index holding one shard of a larger collection can be given the
+    statistics of the whole collection (collection), so that its idf and
+    length normalization match those of a single index over everything.
+    """
+
+    def __init__(self):
+        self.postings: Dict[str, PostingList] = defaultdict(PostingList)
+        self.doc_lengths = array('I')
+        self.total_length = 0
+        self.collection: Optional[CollectionStats] = None
+
+    def add(self, doc_id: int, term_counts: Mapping[str, int],
+            positions: Optional[Mapping[str, Sequence[int]]] = None) -> None:
+        """Index one document; positions (term -> word positions) makes the postings positional"""
+        if doc_id != len(self.doc_lengths):
+            raise ValueError(f"Expected doc id {len(self.doc_lengths)}, got {doc_id}")
+        for term, count in term_counts.items():
+            self.postings[term].append(doc_id, count, positions[term] if positions is not None else None)
+        doc_length = sum(term_counts.values())
+        self.doc_lengths.append(doc_length)
+        self.total_length += doc_length
+
+    def average_length(self) -> float:
+        if self.collection is not None:
+            return self.collection.total_length / self.collection.doc_count if self.collection.doc_count else 0.0
+        return self.total_length / len(self.doc_lengths) if self.doc_lengths else 0.0
+
+    def doc_count(self) -> int:
+        """Documents in the collection used for idf"""
+        return self.collection.doc_count if self.collection is not None else len(self.doc_lengths)
+
+    def doc_freq(self, term: str) -> int:
+        """Documents containing term, collection-wide if collection statistics are set"""
+        if self.collection is not None:
+            return self.collection.doc_freqs.get(term, 0)
+        return len(self.postings[term]) if term in self.postings else 0
+
+    def stats(self) -> CollectionStats:
+        """Statistics of the documents in this index only"""
+        if hasattr(self.postings, 'doc_freqs'):
+            # Mapped postings know their lengths without decoding every list
+            doc_freqs = self.postings.doc_freqs()
+        else:
+            doc_freqs = {term: len(postings) for term, postings in self.postings.items() if postings}
+        return CollectionStats(len(self.doc_lengths), self.total_length, doc_freqs)
+
+    def __contains__(self, term: str) -> bool:
+        return term in self.postings
+
+    def __getitem__(self, term: str) -> PostingList:
+        return self.postings[term]
+
+    def __len__(self) -> int:
+        """Number of distinct terms"""
+        return len(self.postings)
+
+
+def gallop(doc_ids: Sequence[int], target: int, low: int) -> int:
+    """Index of the first entry >= target at or after low, probing 1, 2, 4, ... ahead"""
+    size = len(doc_ids)
+    step = 1
+    high = low
+    while high < size and doc_ids[high] < target:
+        low = high + 1
+        high = low + step
+        step <<= 1
+    return bisect_left(doc_ids, target, low, min(high, size))
+
+
+def intersect(posting_lists: List[Sequence[int]]) -> array:
+    """Intersect sorted doc id sequences, starting from the shortest.
+
+    Each surviving candidate is located in the longer lists by galloping
+    search from the previous match, so the cost grows with the shortest list
+    rather than the longest.
+    """
+    if not posting_lists:
+        return array('I')
+    ordered = sorted(posting_lists, key=len)
+    result = array('I', ordered[0])
+    for other in ordered[1:]:
+        if not result:
+            break
+        matched = array('I')
+        position = 0
+        for doc_id in result:
+            position = gallop(other, doc_id, position)
+            if position == len(other):
+                break
+            if other[position] == doc_id:
+                matched.append(doc_id)
+        result = matched
+    return result
+
+
+def phrase_starts(position_lists: List[Sequence[int]], offsets: List[int]) -> List[int]:
+    """Start positions where every list i has an entry at start + offsets[i]"""
+    starts = {position - offsets[0] for position in position_lists[0]}
+    for positions, offset in zip(position_lists[1:], offsets[1:]):
+        if not starts:
+            break
+        starts.intersection_update(position - offset for position in positions)
+    return sorted(starts)
+
+
+def near(first: Sequence[int], first_length: int, second: Sequence[int], second_length: int,
+         distance: int) -> bool:
+    """True if spans starting in first and second are at most distance words apart, in either order.
+
+    Both start lists must be sorted; spans are first_length and
+    second_length words long.
+    """
+    for start in first:
+        low = start - distance - second_length
+        high = start + first_length + distance
+        i = bisect_left(second, low)
+        if i < len(second) and second[i] <= high:
+            return True
+    return False
+
+
+def _synthetic_postings(num_docs: int, terms_per_doc: int, vocabulary: int, seed: int):
+    """Yield (doc_id, terms) pairs with a Zipf-like term distribution"""
+    rng = random.Random(seed)
+    cum_weights = list(accumulate(1 / rank for rank in range(1, vocabulary + 1)))
+    terms = range(vocabulary)
+    for doc_id in range(num_docs):
+        yield doc_id, set(rng.choices(terms, cum_weights=cum_weights, k=terms_per_doc))
+
+
+def _measure(build):
+    tracemalloc.start()
+    start = time.perf_counter()
+    structure = build()
+    elapsed = time.perf_counter() - start
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return structure, size, elapsed
+
+
+def memory_report(num_docs: int = 1_000_000, terms_per_doc: int = 20,
+                  vocabulary: int = 50_000, seed: int = 42) -> Dict[str, float]:
+    """Compare the memory of list-of-int postings with PostingList on a synthetic corpus"""
+    def build_lists():
+        # Previous layout: parallel dicts of doc id and term frequency lists
+        index = defaultdict(list)
+        frequencies = defaultdict(list)
+        for doc_id, terms in _synthetic_postings(num_docs, terms_per_doc, vocabulary, seed):
+            for term in terms:
+                index[term].append(doc_id)
+                frequencies[term].append(1)
+        return index, frequencies
+
+    def build_arrays():
+        index = defaultdict(PostingList)
+        for doc_id, terms in _synthetic_postings(num_docs, terms_per_doc, vocabulary, seed):
+            for term in terms:
+                index[term].append(doc_id, 1)
+        return index
+
+    list_index, list_bytes, list_seconds = _measure(build_lists)
+    num_postings = sum(len(postings) for postings in list_index[0].values())
+    del list_index
+    array_index, array_bytes, array_seconds = _measure(build_arrays)
+    encoded_bytes = sum(len(postings.encode()) for postings in array_index.values())
+
+    return {
+        'documents': num_docs,
+        'postings': num_postings,
+        'list_bytes': list_bytes,
+        'list_bytes_per_posting': list_bytes / num_postings,
+        'list_build_seconds': list_seconds,
+        'array_bytes': array_bytes,
+        'array_bytes_per_posting': array_bytes / num_postings,
+        'array_build_seconds': array_seconds,
+        'varint_bytes': encoded_bytes,
+        'varint_bytes_per_posting': encoded_bytes / num_postings,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Posting list memory report")
+    parser.add_argument('--docs', type=int, default=1_000_000)
+    parser.add_argument('--terms-per-doc', type=int, default=20)
+    parser.add_argument('--vocabulary', type=int, default=50_000)
+    args = parser.parse_args()
+
+    print(f"Building synthetic index: {args.docs} docs x {args.terms_per_doc} terms...")
+    report = memory_report(args.docs, args.terms_per_doc, args.vocabulary)
+    print("\nPosting Memory Report")
+    print("=====================")
+    print(f"Postings: {report['postings']}")
+    print(f"Dict[str, List[int]] (ids + tf): {report['list_bytes'] / 2**20:.1f} MiB "
+          f"({report['list_bytes_per_posting']:.1f} B/posting, built in {report['list_build_seconds']:.1f}s)")
+    print(f"PostingList (ids + tf): {report['array_bytes'] / 2**20:.1f} MiB "
+          f"({report['array_bytes_per_posting']:.1f} B/posting, built in {report['array_build_seconds']:.1f}s)")
+    print(f"Varint-encoded on disk: {report['varint_bytes'] / 2**20:.1f} MiB "
+          f"({report['varint_bytes_per_posting']:.2f} B/posting)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,86 +1,186 @@
 import os
 import re
+import sqlite3
 import logging
 import fitz  # PyMuPDF
 from pathlib import Path
+from metadata_extractor import default_extractor
+from metrics import counter, histogram
+from near_duplicates import signature
+from page_cache import PAGE_CACHE_PATH, PageCache, file_hash
+
+# Everything except word characters, whitespace, German umlauts and basic punctuation
+SPECIAL_CHARS = re.compile(r'[^\w\s\däöüßÄÖÜ\.,;:\-\(\)]')
+WHITESPACE = re.compile(r'\s+')
+DOCSTRING = re.compile(r'"""[\s\S]*?"""|\'\'\'[\s\S]*?\'\'\'')
+CREATE_TABLE = re.compile(r'CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?([^\s(]+)', re.IGNORECASE)
+
+# Ingestion stages; recorded in the extraction workers and merged by the ContentProcessor
+PDF_PAGE_TIME = histogram('ingest_pdf_page_seconds', "PyMuPDF text extraction of one page")
+PAGE_CACHE_HITS = counter('ingest_page_cache_hits_total', "PDFs whose pages came from the page cache")
+PAGE_CACHE_MISSES = counter('ingest_page_cache_misses_total', "PDFs extracted with PyMuPDF")
+CLEAN_TIME = histogram('ingest_clean_seconds', "Cleaning one text (page, file or chunk)")
+METADATA_TIME = histogram('ingest_metadata_seconds', "Metadata regex scan of one text")
+SIGNATURE_TIME = histogram('ingest_signature_seconds', "Near-duplicate signature of one text")
+DUPLICATE_LOOKUP_TIME = histogram('ingest_duplicate_lookup_seconds', "Near-duplicate index lookup of one text")
+STORED_ROWS = counter('ingest_rows_total', "Content rows stored")
+REFERENCED_ROWS = counter('ingest_references_total', "Texts stored as references to a near-duplicate row")
 
 class BaseProcessor:
     def __init__(self, database):
         self.db = database
+        # Compiled once per process, shared by all processors
+        self.metadata_extractor = default_extractor()
+        # NearDuplicateIndex of the stored rows; None stores every row as is
+        self.duplicates = None
 
-    def extract_metadata(self, content):
-        """Extract metadata from content using pattern matching"""
-        metadata = {}
-        patterns = {
-            'module': [
-                r'(?:CAS|Certificate of Advanced Studies)\s+([^\.]+)',
-                r'(?:Modul|Module)\s*(?:\d+)?:\s*([^\n]+)',
-                r'(?:^|\n)M\d+\s*[-:]\s*([^\n]+)'
-            ],
-            'topic': [
-                r'(?:Topic|Thema|Subject)\s*:\s*([^\n]+)',
-                r'(?:^|\n)(?:Thema|Topic)\s*\d*\s*[-:]\s*([^\n]+)'
-            ],
-            'instructor': [
-                r'(?:Instructor|Dozent|Lecturer|Referent)\s*:\s*([^\n]+)',
-                r'(?:By|Von)\s*:\s*([^\n]+)'
-            ]
-        }
-        
-        for key, pattern_list in patterns.items():
-            for pattern in pattern_list:
-                matches = re.finditer(pattern, content, re.IGNORECASE | re.MULTILINE)
-                for match in matches:
-                    value = match.group(1).strip()
-                    if value and len(value) < 100:
-                        metadata[key] = value
-                        break
-        return metadata
+    def extract_metadata(self, content, fields=None):
+        """Extract metadata from content using pattern matching, optionally only the given fields"""
+        with METADATA_TIME.time():
+            return self.metadata_extractor.extract(content, fields)
+
+    def sign(self, content):
+        """Near-duplicate signature of a text"""
+        with SIGNATURE_TIME.time():
+            return signature(content)
+
+    def store(self, file_path, records):
+        """Store extracted (content, metadata) or (content, metadata, signature) records.
+
+        With a near-duplicate index, a record nearly identical to a stored
+        row is not stored again but recorded as a reference from file_path
+        to that row; a merely similar record is stored in the row's cluster.
+        Returns the last content id (a ContentId when writing through a
+        BulkWriter) and the total word count.
+        """
+        content_id = None
+        total_word_count = 0
+        for content, metadata, *signed in records:
+            total_word_count += len(content.split())
+            if self.duplicates is None:
+                sig = None
+            else:
+                sig = signed[0] if signed else self.sign(content)
+            match = None
+            if sig is not None:
+                with DUPLICATE_LOOKUP_TIME.time():
+                    match = self.duplicates.best_match(sig)
+            if match is not None and match[2] >= self.duplicates.duplicate_threshold:
+                content_id = match[0]
+                self.db.store_content_path(content_id, str(file_path), metadata.get('page_number'), match[2])
+                REFERENCED_ROWS.inc()
+                continue
+
+            content_id = self.db.store_content(
+                file_path=str(file_path),
+                content=content,
+                metadata=metadata,
+                file_type=Path(file_path).suffix.lower()[1:]
+            )
+            STORED_ROWS.inc()
+            if sig is not None:
+                cluster_id = match[1] if match is not None else content_id
+                self.db.store_signature(content_id, cluster_id, sig)
+                self.duplicates.add(content_id, str(file_path), cluster_id, sig)
+        return content_id, total_word_count
+
+    def streams(self, file_path):
+        """True if the file is too large to extract in a worker and is streamed to the database instead"""
+        return False
 
     def clean_text(self, text):
         """Clean and normalize text content"""
         if not text:
             return ""
-        # Remove special characters but keep German umlauts
-        text = re.sub(r'[^\w\s\däöüßÄÖÜ\.,;:\-\(\)]', ' ', text)
-        # Normalize whitespace
-        text = re.sub(r'\s+', ' ', text)
-        return text.strip()
+        with CLEAN_TIME.time():
+            # Remove special characters but keep German umlauts
+            text = SPECIAL_CHARS.sub(' ', text)
+            # Normalize whitespace
+            text = WHITESPACE.sub(' ', text)
+            return text.strip()
+
+def read_chunks(f, size):
+    """Yield pieces of a text file of up to about size characters, cut after a newline where possible"""
+    rest = ''
+    while True:
+        block = f.read(size)
+        if not block:
+            if rest:
+                yield rest
+            return
+        block = rest + block
+        # Prefer a line break, then any whitespace; a single huge token is cut hard
+        cut = block.rfind('\n') + 1 or block.rfind(' ') + 1 or len(block)
+        yield block[:cut]
+        rest = block[cut:]
 
 class TextProcessor(BaseProcessor):
-    def process(self, file_path):
-        """Process text files (.txt, .py, .sql)"""
+    # Larger files are read, cleaned and stored in chunks instead of as one row
+    STREAM_THRESHOLD = 8 * 2**20
+    # Characters per chunk row
+    CHUNK_SIZE = 256 * 2**10
+
+    def streams(self, file_path):
+        return os.path.getsize(file_path) > self.STREAM_THRESHOLD
+
+    def extract(self, file_path, content_hash=None):
+        """Read, clean and annotate a text file (.txt, .py, .sql) without storing it"""
+        if self.streams(file_path):
+            return list(self.iter_chunks(file_path))
+
+        with open(file_path, 'r', encoding='utf-8') as f:
+            content = f.read()
+        
+        if not content.strip():
+            logging.warning(f"Empty file: {file_path}")
+            return []
+        
+        cleaned_content = self.clean_text(content)
+        metadata = self.extract_metadata(cleaned_content)
+        metadata.update(self.file_type_metadata(file_path, content))
+        return [(cleaned_content, metadata)]
+
+    def iter_chunks(self, file_path):
+        """Clean and annotate a large file chunk by chunk, holding only one chunk in memory.
+
+        Chunks are numbered like PDF pages. Metadata labels are looked up in
+        the first chunk and inherited by all following chunks.
+        """
+        document_metadata = None
+        with open(file_path, 'r', encoding='utf-8') as f:
+            for chunk_number, chunk in enumerate(read_chunks(f, self.CHUNK_SIZE), start=1):
+                cleaned_content = self.clean_text(chunk)
+                if not cleaned_content:
+                    continue
+                if document_metadata is None:
+                    document_metadata = self.extract_metadata(cleaned_content)
+                metadata = dict(document_metadata, **self.file_type_metadata(file_path, chunk))
+                metadata['page_number'] = chunk_number
+                yield cleaned_content, metadata
+        if document_metadata is None:
+            logging.warning(f"Empty file: {file_path}")
+
+    def file_type_metadata(self, file_path, content):
+        """Docstrings of Python files, table names of SQL files"""
+        metadata = {}
+        if file_path.suffix.lower() == '.py':
+            docstrings = DOCSTRING.findall(content)
+            if docstrings:
+                metadata['docstrings'] = '\n'.join(docstrings)
+        elif file_path.suffix.lower() == '.sql':
+            tables = CREATE_TABLE.findall(content)
+            if tables:
+                metadata['tables'] = ', '.join(tables)
+        return metadata
+
+    def process(self, file_path, content_hash=None):
+        """Process text files (.txt, .py, .sql); large files are streamed to the database in chunks"""
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            if not content.strip():
-                logging.warning(f"Empty file: {file_path}")
+            records = self.iter_chunks(file_path) if self.streams(file_path) else self.extract(file_path)
+            content_id, word_count = self.store(file_path, records)
+            if content_id is None:
                 return None, 0
             
-            cleaned_content = self.clean_text(content)
-            metadata = self.extract_metadata(cleaned_content)
-            
-            # Extract additional metadata based on file type
-            if file_path.suffix.lower() == '.py':
-                docstring_pattern = r'"""[\s\S]*?"""|\'\'\'[\s\S]*?\'\'\''
-                docstrings = re.findall(docstring_pattern, content)
-                if docstrings:
-                    metadata['docstrings'] = '\n'.join(docstrings)
-            elif file_path.suffix.lower() == '.sql':
-                table_pattern = r'CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?([^\s(]+)'
-                tables = re.findall(table_pattern, content, re.IGNORECASE)
-                if tables:
-                    metadata['tables'] = ', '.join(tables)
-            
-            content_id = self.db.store_content(
-                file_path=str(file_path),
-                content=cleaned_content,
-                metadata=metadata,
-                file_type=file_path.suffix.lower()[1:]
-            )
-            
-            word_count = len(cleaned_content.split())
             logging.info(f"Processed {file_path} - {word_count} words")
             return content_id, word_count
             
@@ -90,39 +190,76 @@ class TextProcessor(BaseProcessor):
             raise
 
 class PDFProcessor(BaseProcessor):
-    def process(self, file_path):
+    # Plain text without ligature and whitespace preservation, so ligatures
+    # come out as plain letters ("ﬁ" as "fi") and match the query terms;
+    # clean_text collapses the whitespace anyway. Not measurably faster than
+    # the default flags: MuPDF's text extraction costs the same either way
+    TEXT_FLAGS = fitz.TEXT_MEDIABOX_CLIP
+    # Identifies the extraction settings in the page cache; change it together with clean_text
+    CACHE_SETTINGS = f"text;flags={TEXT_FLAGS};clean=1"
+    # Module and instructor are the same on every page of a deck: if found on
+    # the first pages they are inherited by all pages
+    DOCUMENT_FIELDS = ('module', 'instructor')
+    DOCUMENT_PAGES = 3
+
+    def __init__(self, database, cache_path=PAGE_CACHE_PATH):
+        super().__init__(database)
+        self.cache_path = cache_path
+
+    def page_texts(self, file_path, content_hash=None):
+        """Cleaned text of every page, from the page cache if the same file was extracted before"""
+        cache = PageCache.open(self.cache_path)
+        if cache is not None:
+            content_hash = content_hash or file_hash(file_path)
+            pages = cache.get(content_hash, self.CACHE_SETTINGS)
+            if pages is not None:
+                PAGE_CACHE_HITS.inc()
+                return pages
+            PAGE_CACHE_MISSES.inc()
+
+        pages = []
+        with fitz.open(file_path) as doc:
+            for page in doc:
+                with PDF_PAGE_TIME.time():
+                    text = page.get_text('text', flags=self.TEXT_FLAGS)
+                pages.append(self.clean_text(text))
+
+        if cache is not None:
+            try:
+                cache.put(content_hash, self.CACHE_SETTINGS, pages)
+            except sqlite3.Error as e:
+                logging.warning(f"Could not cache pages of {file_path}: {e}")
+        return pages
+
+    def extract(self, file_path, content_hash=None):
+        """Extract and clean the text of every non-empty PDF page using PyMuPDF"""
+        pages = self.page_texts(file_path, content_hash)
+
+        document_metadata = {}
+        for text in pages[:self.DOCUMENT_PAGES]:
+            for key, value in self.extract_metadata(text, self.DOCUMENT_FIELDS).items():
+                document_metadata.setdefault(key, value)
+        # A document field missing from the first pages (e.g. a deck whose title
+        # slide comes later) is searched on every page, as for any other field
+        page_fields = [key for key in self.metadata_extractor.fields
+                       if key not in self.DOCUMENT_FIELDS or key not in document_metadata]
+
+        records = []
+        for page_number, cleaned_content in enumerate(pages, start=1):
+            if not cleaned_content:
+                continue  # Skip empty pages
+
+            # Page-level metadata on top of the document's
+            metadata = dict(document_metadata, **self.extract_metadata(cleaned_content, page_fields))
+            metadata['page_number'] = page_number  # Add page number
+            records.append((cleaned_content, metadata))
+        return records
+
+    def process(self, file_path, content_hash=None):
         """Process PDF files using PyMuPDF"""
         try:
-            doc = fitz.open(file_path)
-            total_word_count = 0
-            content_id = None
-            
-            for page_number, page in enumerate(doc, start=1):
-                # Extract text and clean it
-                text = page.get_text()
-                cleaned_content = self.clean_text(text)
-                if not cleaned_content.strip():
-                    continue  # Skip empty pages
-                
-                # Extract metadata
-                metadata = self.extract_metadata(cleaned_content)
-                metadata['page_number'] = page_number  # Add page number
-                
-                # Store content in database
-                content_id = self.db.store_content(
-                    file_path=str(file_path),
-                    content=cleaned_content,
-                    metadata=metadata,
-                    file_type='pdf'
-                )
-                
-                # Update word count
-                total_word_count += len(cleaned_content.split())
-            
-            doc.close()
-            
             # Return total word count and last content_id
-            return content_id, total_word_count
+            return self.store(file_path, self.extract(file_path, content_hash))
 
         except Exception as e:
             logging.error(f"Error processing PDF {file_path}: {str(e)}")
@@ -0,0 +1,110 @@
+import os
+import sys
+import threading
+from collections import Counter
+from typing import List, Optional, Tuple
+
+# File the command line tools write sampled stacks to; unset disables the profiler
+PROFILE_PATH = os.environ.get('CAS_PROFILE')
+# Seconds between two samples
+PROFILE_INTERVAL = float(os.environ.get('CAS_PROFILE_INTERVAL', '0.005'))
+# Modules whose functions at the top of a stack mean the thread is idle, waiting for work
+IDLE_MODULES = ('threading.py', 'selectors.py', 'queue.py')
+
+
+class SamplingProfiler:
+    """Wall-clock sampling profiler without dependencies.
+
+    A background thread looks at the stack of every other thread of the
+    process each interval seconds and counts how often each stack was seen.
+    Unlike cProfile it does not slow down the profiled code per call, so the
+    hot path keeps its real proportions. Threads waiting (for a lock, the
+    database or a socket) are sampled too, which shows where requests wait.
+
+    Sampling needs the GIL, so busy threads are sampled about once per
+    interpreter switch interval (5 ms by default) at most.
+
+    write() stores the stacks in the collapsed "frame;frame;frame count"
+    format read by flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, interval: float = PROFILE_INTERVAL, path: Optional[str] = None):
+        self.interval = interval
+        # Where stop_profiler() writes the stacks
+        self.path = path
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def __enter__(self) -> 'SamplingProfiler':
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def start(self) -> None:
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self._stopped.set()
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        own_id = threading.get_ident()
+        names = {}
+        while not self._stopped.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    name = names.get(code)
+                    if name is None:
+                        name = names[code] = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+                    stack.append(name)
+                    frame = frame.f_back
+                self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def top(self, n: int = 20, skip_idle: bool = True) -> List[Tuple[str, int]]:
+        """Functions seen at the top of a stack most often (self time), with their sample counts"""
+        leaves = Counter()
+        for stack, count in self.stacks.items():
+            leaf = stack.rsplit(';', 1)[-1]
+            if skip_idle and leaf.rsplit('(', 1)[-1].startswith(IDLE_MODULES):
+                continue
+            leaves[leaf] += count
+        return leaves.most_common(n)
+
+    def write(self, path: str) -> None:
+        """Write the sampled stacks in collapsed format"""
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+def start_profiler(path: Optional[str] = PROFILE_PATH) -> Optional[SamplingProfiler]:
+    """Start a profiler if a path is given (CAS_PROFILE by default), else return None"""
+    if not path:
+        return None
+    profiler = SamplingProfiler(path=path)
+    profiler.start()
+    return profiler
+
+
+def stop_profiler(profiler: Optional[SamplingProfiler]) -> None:
+    """Stop a profiler started by start_profiler, write its stacks and print the hottest functions"""
+    if profiler is None:
+        return
+    profiler.stop()
+    profiler.write(profiler.path)
+    print(f"\nProfile: {profiler.samples} samples written to {os.path.abspath(profiler.path)}")
+    for name, count in profiler.top(10):
+        print(f"  {count / max(profiler.samples, 1):6.1%}  {name}")
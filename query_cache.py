@@ -0,0 +1,83 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+
+class QueryCache:
+    """Bounded LRU cache of search results tied to an index generation.
+
+    The engine bumps its generation whenever the index changes; the first
+    lookup or store with a newer generation drops every cached entry, so
+    stale results are never served.
+
+    Entries are copied item by item with copy_item on store and on every
+    hit, so a caller changing its results cannot change later hits.
+    """
+
+    def __init__(self, max_entries: int = 256, copy_item: Optional[Callable[[Any], Any]] = None):
+        self.max_entries = max_entries
+        self.copy_item = copy_item
+        self._entries: 'OrderedDict[Hashable, List]' = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _sync_generation(self, generation: int) -> None:
+        if generation > self._generation:
+            if self._entries:
+                self.invalidations += 1
+                self._entries.clear()
+            self._generation = generation
+
+    def get(self, key: Hashable, generation: int) -> Optional[List]:
+        """Return the cached results for key, or None on a miss"""
+        with self._lock:
+            self._sync_generation(generation)
+            results = self._entries.get(key) if generation == self._generation else None
+            if results is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return self._copy(results)
+
+    def _copy(self, results: List) -> List:
+        if self.copy_item is None:
+            return list(results)
+        return [self.copy_item(result) for result in results]
+
+    def put(self, key: Hashable, generation: int, results: List) -> None:
+        """Store results, evicting the least recently used entries beyond max_entries"""
+        if self.max_entries <= 0:
+            return
+        results = self._copy(results)
+        with self._lock:
+            self._sync_generation(generation)
+            if generation != self._generation:
+                return
+            self._entries[key] = results
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        """Counters for sizing the cache"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,178 @@
+import re
+from dataclasses import dataclass
+from typing import Iterable, List, Optional, Tuple, Union
+
+# Parentheses, NEAR/n, field:value or field:"several words", "phrases", words
+TOKEN = re.compile(r'''
+    (?P<open>\() | (?P<close>\)) |
+    NEAR/(?P<distance>\d+)(?=[\s()"]|$) |
+    (?P<field>\w+):(?:"(?P<field_phrase>[^"]*)"?|(?P<field_word>[^\s()"]+)) |
+    "(?P<phrase>[^"]*)"? |
+    (?P<word>[^\s()"]+)
+''', re.VERBOSE)
+# Operators are only recognized in upper case, so "and"/"or" stay ordinary words
+OPERATORS = ('AND', 'OR', 'NOT')
+
+
+@dataclass(frozen=True)
+class Word:
+    text: str
+    field: Optional[str] = None
+
+
+@dataclass(frozen=True)
+class Phrase:
+    text: str
+    field: Optional[str] = None
+
+
+@dataclass(frozen=True)
+class Near:
+    """At most distance words between left and right, in either order"""
+    left: Union[Word, Phrase]
+    right: Union[Word, Phrase]
+    distance: int
+
+
+@dataclass(frozen=True)
+class And:
+    children: Tuple['Node', ...]
+
+
+@dataclass(frozen=True)
+class Or:
+    children: Tuple['Node', ...]
+
+
+@dataclass(frozen=True)
+class Not:
+    child: 'Node'
+
+
+Node = Union[Word, Phrase, Near, And, Or, Not]
+
+
+class _Parser:
+    """Recursive descent over the token list; malformed input is repaired, never rejected.
+
+    query   := or
+    or      := and ('OR' and)*
+    and     := unary (['AND'] unary)*        juxtaposition means AND
+    unary   := 'NOT' unary | near
+    near    := primary ('NEAR/n' primary)*   operands must be words or phrases
+    primary := '(' or ')' | field:value | "phrase" | word
+    """
+
+    def __init__(self, query: str, fields: Iterable[str]):
+        self.known = {name.lower() for name in fields}
+        self.tokens: List[Tuple[str, object]] = []
+        for match in TOKEN.finditer(query):
+            self.tokens.extend(self._tokens(match))
+        self.position = 0
+
+    def _tokens(self, match: re.Match) -> List[Tuple[str, object]]:
+        if match.group('open'):
+            return [('open', None)]
+        if match.group('close'):
+            return [('close', None)]
+        if match.group('distance'):
+            return [('near', int(match.group('distance')))]
+        name = match.group('field')
+        if name:
+            phrase, word = match.group('field_phrase'), match.group('field_word')
+            if name.lower() not in self.known:
+                # Not a field (e.g. a "Note:" typed by the user): keep it as text
+                return [('atom', Word(name)), ('atom', Phrase(phrase) if phrase is not None else Word(word))]
+            if phrase is not None:
+                return [('atom', Phrase(phrase, name.lower()))]
+            return [('atom', Word(word, name.lower()))]
+        if match.group('phrase') is not None:
+            return [('atom', Phrase(match.group('phrase')))]
+        word = match.group('word')
+        if word in OPERATORS:
+            return [(word, None)]
+        return [('atom', Word(word))]
+
+    def _peek(self) -> Optional[str]:
+        return self.tokens[self.position][0] if self.position < len(self.tokens) else None
+
+    def parse(self) -> Optional['Node']:
+        parts = []
+        while self.position < len(self.tokens):
+            node = self._or()
+            if node is not None:
+                parts.append(node)
+            if self._peek() == 'close':
+                self.position += 1  # unmatched ")"
+        return _combine(And, parts)
+
+    def _or(self) -> Optional['Node']:
+        parts = [self._and()]
+        while self._peek() == 'OR':
+            self.position += 1
+            parts.append(self._and())
+        return _combine(Or, [part for part in parts if part is not None])
+
+    def _and(self) -> Optional['Node']:
+        parts = []
+        while self._peek() not in (None, 'close', 'OR'):
+            if self._peek() == 'AND':
+                self.position += 1
+                continue
+            node = self._unary()
+            if node is not None:
+                parts.append(node)
+        return _combine(And, parts)
+
+    def _unary(self) -> Optional['Node']:
+        if self._peek() == 'NOT':
+            self.position += 1
+            child = self._unary()
+            return Not(child) if child is not None else None
+        return self._near()
+
+    def _near(self) -> Optional['Node']:
+        left = self._primary()
+        pairs = []
+        while self._peek() == 'near' and isinstance(left, (Word, Phrase)):
+            distance = self.tokens[self.position][1]
+            self.position += 1
+            right = self._primary()
+            if not isinstance(right, (Word, Phrase)):
+                # NEAR needs two plain operands; otherwise it is dropped
+                return _combine(And, pairs + [node for node in (left, right) if node is not None])
+            # Chains like a NEAR/2 b NEAR/3 c become pairwise clauses
+            pairs.append(Near(left, right, distance))
+            left = right
+        return _combine(And, pairs) if pairs else left
+
+    def _primary(self) -> Optional['Node']:
+        kind = self._peek()
+        if kind == 'open':
+            self.position += 1
+            node = self._or()
+            if self._peek() == 'close':
+                self.position += 1
+            return node
+        if kind == 'atom':
+            self.position += 1
+            return self.tokens[self.position - 1][1]
+        if kind in ('near', 'AND', 'OR'):
+            self.position += 1  # operator without a left operand
+        return None
+
+
+def _combine(kind, parts: List['Node']) -> Optional['Node']:
+    if not parts:
+        return None
+    return parts[0] if len(parts) == 1 else kind(tuple(parts))
+
+
+def parse_query(query: str, fields: Iterable[str]) -> Optional[Node]:
+    """Parse a query into a tree of Word, Phrase, Near, And, Or and Not nodes.
+
+    Terms next to each other must all match; AND, OR, NOT (upper case) and
+    parentheses combine them explicitly. Only known field names are treated
+    as field:value clauses. Returns None for a query without any terms.
+    """
+    return _Parser(query, fields).parse()
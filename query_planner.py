@@ -0,0 +1,353 @@
+import heapq
+from array import array
+from itertools import accumulate
+from typing import Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+from analyzer import Analyzer
+from postings import InvertedIndex, PostingList, gallop, intersect, near, phrase_starts
+from query_parser import And, Near, Node, Not, Or, Phrase, Word
+
+# Name of the positional full text index; field indexes are keyed by field name
+CONTENT = 'content'
+
+
+class Plan:
+    """Executable form of a query node, bound to the indexes it reads.
+
+    evaluate() returns the matching doc ids in order, matches() tests a
+    single document; estimate() is the planner's cost/size guess.
+    """
+
+    def estimate(self) -> int:
+        raise NotImplementedError
+
+    def evaluate(self, num_docs: int) -> Sequence[int]:
+        raise NotImplementedError
+
+    def matches(self, doc_id: int) -> bool:
+        raise NotImplementedError
+
+    def terms(self) -> List[Tuple[InvertedIndex, str]]:
+        """Terms that contribute to the score (none below a NOT)"""
+        raise NotImplementedError
+
+    def key(self) -> Hashable:
+        """Canonical form, equal for queries that differ only in term order"""
+        raise NotImplementedError
+
+
+class TermPlan(Plan):
+    def __init__(self, name: str, index: InvertedIndex, term: str):
+        self.name = name
+        self.index = index
+        self.term = term
+
+    @property
+    def postings(self) -> PostingList:
+        return self.index[self.term] if self.term in self.index else PostingList()
+
+    def estimate(self) -> int:
+        return len(self.postings)
+
+    def evaluate(self, num_docs: int) -> Sequence[int]:
+        return self.postings.doc_ids
+
+    def matches(self, doc_id: int) -> bool:
+        return doc_id in self.postings
+
+    def terms(self) -> List[Tuple[InvertedIndex, str]]:
+        return [(self.index, self.term)]
+
+    def key(self) -> Hashable:
+        return ('term', self.name, self.term)
+
+
+class PhrasePlan(Plan):
+    """Terms at fixed offsets from each other, checked on the positional postings"""
+
+    def __init__(self, name: str, index: InvertedIndex, offsets: Tuple[Tuple[int, str], ...]):
+        self.name = name
+        self.index = index
+        self.offsets = offsets
+        self.length = offsets[-1][0] + 1
+
+    def _postings(self) -> List[PostingList]:
+        return [self.index[term] if term in self.index else PostingList() for _, term in self.offsets]
+
+    def starts(self, doc_id: int) -> List[int]:
+        """Positions in doc_id where the phrase starts"""
+        position_lists = [postings.doc_positions(doc_id) for postings in self._postings()]
+        return phrase_starts(position_lists, [offset for offset, _ in self.offsets])
+
+    def estimate(self) -> int:
+        return min(len(postings) for postings in self._postings())
+
+    def evaluate(self, num_docs: int) -> Sequence[int]:
+        candidates = intersect([postings.doc_ids for postings in self._postings()])
+        return array('I', (doc_id for doc_id in candidates if self.matches(doc_id)))
+
+    def matches(self, doc_id: int) -> bool:
+        return bool(self.starts(doc_id))
+
+    def terms(self) -> List[Tuple[InvertedIndex, str]]:
+        return [(self.index, term) for _, term in self.offsets]
+
+    def key(self) -> Hashable:
+        return ('phrase', self.name, self.offsets)
+
+
+class NearPlan(Plan):
+    def __init__(self, left: PhrasePlan, right: PhrasePlan, distance: int):
+        self.left = left
+        self.right = right
+        self.distance = distance
+
+    def estimate(self) -> int:
+        return min(self.left.estimate(), self.right.estimate())
+
+    def evaluate(self, num_docs: int) -> Sequence[int]:
+        candidates = intersect([postings.doc_ids for side in (self.left, self.right)
+                                for postings in side._postings()])
+        return array('I', (doc_id for doc_id in candidates if self.matches(doc_id)))
+
+    def matches(self, doc_id: int) -> bool:
+        return near(self.left.starts(doc_id), self.left.length,
+                    self.right.starts(doc_id), self.right.length, self.distance)
+
+    def terms(self) -> List[Tuple[InvertedIndex, str]]:
+        return self.left.terms() + self.right.terms()
+
+    def key(self) -> Hashable:
+        return ('near', frozenset((self.left.key(), self.right.key())), self.distance)
+
+
+class AndPlan(Plan):
+    """Conjunction of required children minus excluded ones.
+
+    Term children are intersected by galloping search, shortest posting list
+    first, so the candidate set only shrinks; phrase, NEAR, OR and NOT
+    children are then checked per surviving document. Evaluation stops as
+    soon as the candidate set is empty.
+    """
+
+    def __init__(self, required: List[Plan], excluded: List[Plan]):
+        self.required = required
+        self.excluded = excluded
+
+    def estimate(self) -> int:
+        return min((child.estimate() for child in self.required), default=1 << 31)
+
+    def evaluate(self, num_docs: int) -> Sequence[int]:
+        terms = sorted((child for child in self.required if isinstance(child, TermPlan)),
+                       key=lambda child: child.estimate())
+        others = sorted((child for child in self.required if not isinstance(child, TermPlan)),
+                        key=lambda child: child.estimate())
+        if terms:
+            candidates = intersect([child.evaluate(num_docs) for child in terms])
+        elif others:
+            candidates = others.pop(0).evaluate(num_docs)
+        else:
+            candidates = range(num_docs)
+        for child in others:
+            if not candidates:
+                break
+            candidates = [doc_id for doc_id in candidates if child.matches(doc_id)]
+        for child in self.excluded:
+            if not candidates:
+                break
+            candidates = [doc_id for doc_id in candidates if not child.matches(doc_id)]
+        return candidates
+
+    def matches(self, doc_id: int) -> bool:
+        return (all(child.matches(doc_id) for child in self.required)
+                and not any(child.matches(doc_id) for child in self.excluded))
+
+    def terms(self) -> List[Tuple[InvertedIndex, str]]:
+        return [term for child in self.required for term in child.terms()]
+
+    def key(self) -> Hashable:
+        return ('and', frozenset(child.key() for child in self.required),
+                frozenset(child.key() for child in self.excluded))
+
+
+class OrPlan(Plan):
+    def __init__(self, children: List[Plan]):
+        self.children = children
+
+    def estimate(self) -> int:
+        return sum(child.estimate() for child in self.children)
+
+    def evaluate(self, num_docs: int) -> Sequence[int]:
+        matched = set()
+        for child in self.children:
+            matched.update(child.evaluate(num_docs))
+        return array('I', sorted(matched))
+
+    def matches(self, doc_id: int) -> bool:
+        return any(child.matches(doc_id) for child in self.children)
+
+    def terms(self) -> List[Tuple[InvertedIndex, str]]:
+        return [term for child in self.children for term in child.terms()]
+
+    def key(self) -> Hashable:
+        return ('or', frozenset(child.key() for child in self.children))
+
+    def only_terms(self) -> bool:
+        """True for a plain disjunction of terms, which max_score_top_k can rank"""
+        return all(isinstance(child, TermPlan) for child in self.children)
+
+
+def compile_plan(node: Optional[Node], analyzer: Analyzer, indexes: Dict[str, InvertedIndex],
+                 default: str = CONTENT) -> Optional[Plan]:
+    """Bind a parsed query to indexes; returns None if nothing in it is searchable.
+
+    Words and phrases without a field go to the default index. Stop words
+    vanish, so "NOT der" or a phrase of stop words imposes no condition.
+    Phrases and NEAR in a non-positional (field) index degrade to AND.
+    """
+    if node is None:
+        return None
+    if isinstance(node, (Word, Phrase)):
+        name = node.field or default
+        index = indexes[name]
+        if isinstance(node, Phrase) and name == CONTENT:
+            phrase = _phrase(name, index, analyzer, node.text)
+            return phrase if phrase is None or len(phrase.offsets) > 1 else TermPlan(name, index, phrase.offsets[0][1])
+        terms = list(dict.fromkeys(analyzer.terms(node.text)))
+        return _and([TermPlan(name, index, term) for term in terms], [])
+    if isinstance(node, Near):
+        left, right = (compile_plan(side, analyzer, indexes, default) for side in (node.left, node.right))
+        if left is None or right is None:
+            return left or right
+        name = node.left.field or default
+        if name != CONTENT or (node.right.field or default) != CONTENT:
+            return _and([left, right], [])
+        return NearPlan(_as_phrase(left), _as_phrase(right), node.distance)
+    if isinstance(node, Not):
+        child = compile_plan(node.child, analyzer, indexes, default)
+        return AndPlan([], [child]) if child is not None else None
+    if isinstance(node, And):
+        required, excluded = [], []
+        for child in node.children:
+            if isinstance(child, Not):
+                plan = compile_plan(child.child, analyzer, indexes, default)
+                if plan is not None:
+                    excluded.append(plan)
+                continue
+            plan = compile_plan(child, analyzer, indexes, default)
+            if plan is not None:
+                required.append(plan)
+        return _and(required, excluded)
+    children = []
+    for child in node.children:
+        plan = compile_plan(child, analyzer, indexes, default)
+        if isinstance(plan, OrPlan):
+            children.extend(plan.children)
+        elif plan is not None:
+            children.append(plan)
+    if not children:
+        return None
+    return children[0] if len(children) == 1 else OrPlan(children)
+
+
+def _phrase(name: str, index: InvertedIndex, analyzer: Analyzer, text: str) -> Optional[PhrasePlan]:
+    occurrences = analyzer.positions(text)
+    if not occurrences:
+        return None
+    first = occurrences[0][0]
+    return PhrasePlan(name, index, tuple((position - first, term) for position, term in occurrences))
+
+
+def _as_phrase(plan: Plan) -> PhrasePlan:
+    if isinstance(plan, TermPlan):
+        return PhrasePlan(plan.name, plan.index, ((0, plan.term),))
+    if isinstance(plan, AndPlan):
+        # Several words from one NEAR operand, e.g. a hyphenated word
+        first = plan.required[0]
+        return PhrasePlan(first.name, first.index, tuple(enumerate(child.term for child in plan.required)))
+    return plan
+
+
+def _and(required: List[Plan], excluded: List[Plan]) -> Optional[Plan]:
+    """AndPlan with nested conjunctions flattened, or the single child"""
+    flat_required, flat_excluded = [], list(excluded)
+    for child in required:
+        if isinstance(child, AndPlan):
+            flat_required.extend(child.required)
+            flat_excluded.extend(child.excluded)
+        else:
+            flat_required.append(child)
+    if not flat_required and not flat_excluded:
+        return None
+    if len(flat_required) == 1 and not flat_excluded:
+        return flat_required[0]
+    return AndPlan(flat_required, flat_excluded)
+
+
+# A scored posting list for max_score_top_k: postings, the highest score any
+# document can get from it, and score(doc_id, term frequency)
+ScoredTerm = Tuple[PostingList, float, Callable[[int, int], float]]
+
+
+def max_score_top_k(scored_terms: List[ScoredTerm], k: int, check: Optional[Callable[[], None]] = None,
+                    check_interval: int = 1024) -> List[Tuple[float, int]]:
+    """Top k documents of a disjunction by summed term scores (MaxScore).
+
+    Posting lists are sorted by upper bound. Once k results are held, the
+    lists whose bounds add up to no more than the k-th best score become
+    non-essential: documents occurring only there cannot enter the top k,
+    so candidates are drawn from the essential lists alone and the others
+    are probed by galloping search, stopping as soon as the remaining bounds
+    cannot lift a document past the threshold. Ties go to the lower doc id,
+    as in SearchEngine._top_k. check, if given, is called every
+    check_interval candidates and may raise to stop the search (a deadline).
+    """
+    if k <= 0 or not scored_terms:
+        return []
+    scored_terms = sorted(scored_terms, key=lambda item: item[1])
+    doc_lists = [postings.doc_ids for postings, _, _ in scored_terms]
+    frequencies = [postings.frequencies for postings, _, _ in scored_terms]
+    scorers = [score for _, _, score in scored_terms]
+    # bounds[i]: best possible score from lists 0..i together
+    bounds = list(accumulate(bound for _, bound, _ in scored_terms))
+    sizes = [len(doc_ids) for doc_ids in doc_lists]
+    count = len(scored_terms)
+    cursors = [0] * count
+    heap: List[Tuple[float, int]] = []
+    threshold = -1.0
+    first_essential = 0
+    candidates = 0
+
+    while first_essential < count:
+        if check is not None and not candidates % check_interval:
+            check()
+        candidates += 1
+        doc_id = min((doc_lists[i][cursors[i]] for i in range(first_essential, count) if cursors[i] < sizes[i]),
+                     default=None)
+        if doc_id is None:
+            break
+        score = 0.0
+        for i in range(first_essential, count):
+            cursor = cursors[i]
+            if cursor < sizes[i] and doc_lists[i][cursor] == doc_id:
+                score += scorers[i](doc_id, frequencies[i][cursor])
+                cursors[i] = cursor + 1
+        for i in range(first_essential - 1, -1, -1):
+            if score + bounds[i] <= threshold:
+                break
+            cursor = gallop(doc_lists[i], doc_id, cursors[i])
+            cursors[i] = cursor
+            if cursor < sizes[i] and doc_lists[i][cursor] == doc_id:
+                score += scorers[i](doc_id, frequencies[i][cursor])
+                cursors[i] = cursor + 1
+
+        item = (score, -doc_id)
+        if len(heap) < k:
+            heapq.heappush(heap, item)
+        elif item > heap[0]:
+            heapq.heapreplace(heap, item)
+        if len(heap) == k:
+            threshold = heap[0][0]
+            while first_essential < count and bounds[first_essential] <= threshold:
+                first_essential += 1
+    return [(score, -neg_id) for score, neg_id in sorted(heap, reverse=True)]
@@ -1,25 +1,46 @@
-from db_connector import DatabaseConnector
+from typing import Optional
+
+from db_connector import StorageBackend, connect_database
 from search_engine import SearchEngine, SearchResult
-from tqdm import tqdm  # Fortschrittsbalken
+from metrics import METRICS, export_metrics, progress
+from profiler import start_profiler, stop_profiler
+import index_store
+
+INDEX_PATH = "search_index.bin"
+TOP_K = 5
+# Passages shown per result
+SNIPPETS = 2
+# Show near-duplicate pages (e.g. the same slide in several decks) only once
+COLLAPSE = True
 
 def print_result(result: SearchResult, rank: int) -> None:
     """Print a single search result."""
     print(f"\n{rank}. {result.file_path}")  # Verwenden Sie direkte Attribute
     print(f"Module: {result.module or 'N/A'}")
     print(f"Topic: {result.topic or 'N/A'}")
+    if result.page_number:
+        print(f"Page: {result.page_number}")
     print(f"Relevance Score: {result.relevance_score:.2f}")
+    for snippet in result.snippets:
+        print(f"  {snippet}")
+    if result.duplicates:
+        print(f"Also in: {', '.join(result.duplicates)}")
     print("-" * 80)
 
-def load_documents_into_search_engine(db: DatabaseConnector, search_engine: SearchEngine):
-    """Load all documents from the database into the search engine."""
+def load_documents_into_search_engine(db: StorageBackend, search_engine: SearchEngine):
+    """Stream all documents from the database into the search engine."""
     print("Loading search index...")
-    rows = db.fetch_all_content()
+    # Near-duplicate clusters and the other files a row's text is stored for
+    clusters = db.fetch_clusters()
+    content_paths = db.fetch_content_paths()
+    rows = db.iter_content()
 
-    for row in tqdm(rows, desc="Indexing Documents", unit="doc"):
-        file_path, content, file_type, module, topic, subtopic, chapter, instructor, page_number = row[1:10]
+    for row in progress(rows, total=db.count_content(), desc="Indexing Documents", unit="doc"):
+        content_id, file_path, content, file_type, module, topic, subtopic, chapter, instructor, page_number = row
 
         # Create document with metadata
         doc = {
+            'content_id': content_id,
             'file_path': file_path,
             'content': content,
             'file_type': file_type,
@@ -28,17 +49,50 @@ def load_documents_into_search_engine(db: DatabaseConnector, search_engine: Sear
             'subtopic': subtopic if subtopic else None,
             'chapter': chapter if chapter else None,
             'instructor': instructor if instructor else None,
-            'page_number': page_number
+            'page_number': page_number,
+            'cluster_id': clusters.get(content_id, content_id)
         }
+        if content_id in content_paths:
+            doc['duplicate_paths'] = content_paths[content_id]
 
         # Add document to search engine
         search_engine.add_document(doc)
     print("\nSearch index loaded successfully!")
 
+def load_search_engine(db: StorageBackend, index_path: str = INDEX_PATH,
+                       lazy_content: bool = True, fingerprint: Optional[str] = None) -> SearchEngine:
+    """Load the saved index if it matches the database, otherwise rebuild and save it.
+
+    With lazy_content only doc ids and metadata stay in memory (and in the
+    index file); document text is fetched from the database when needed.
+    fingerprint is the database's content fingerprint, if already known.
+    """
+    if fingerprint is None:
+        fingerprint = db.content_fingerprint()
+    search_engine = None
+    if index_store.read_fingerprint(index_path) == fingerprint:
+        try:
+            search_engine = SearchEngine.load(index_path, store_content=not lazy_content)
+            print(f"Search index loaded from {index_path}")
+        except (OSError, index_store.IndexFormatError) as e:
+            print(f"Saved index unusable ({e}), rebuilding...")
+
+    if search_engine is None:
+        search_engine = SearchEngine(store_content=not lazy_content)
+        load_documents_into_search_engine(db, search_engine)
+        search_engine.save(index_path, fingerprint)
+
+    search_engine.content_loader = lambda doc: db.fetch_content(doc['content_id'])
+    search_engine.content_slice_loader = lambda doc, start, length: db.fetch_content_slice(
+        doc['content_id'], start, length)
+    return search_engine
+
 def interactive_search(search_engine: SearchEngine):
     """Interactive search interface."""
     print("\nSearch system ready! Enter search queries (Ctrl+C to exit)")
     print("Available fields: module, topic, subtopic, chapter, instructor, content")
+    print('Field clauses can be combined with free text, e.g. topic:normalisierung instructor:"hans meier"')
+    print('Operators: AND, OR, NOT, ( ), "exact phrase", a NEAR/3 b')
 
     while True:
         try:
@@ -49,14 +103,20 @@ def interactive_search(search_engine: SearchEngine):
             field = input("Enter field to search (press Enter for full text): ").strip() or None
 
             print("\nSearching...")
-            results = search_engine.search_with_progress(query, field)
-            print(f"\nFound {len(results)} results:")
+            results = search_engine.search_with_progress(query, field, k=TOP_K, snippets=SNIPPETS,
+                                                          collapse=COLLAPSE)
+            print(f"\nTop {len(results)} results:")
 
-            for i, result in enumerate(results[:5], 1):
+            for i, result in enumerate(results, 1):
                 print_result(result, i)
 
         except KeyboardInterrupt:
-            print("\nExiting search system...")
+            stats = search_engine.cache_stats()
+            print(f"\nQuery cache: {stats['hits']} hits, {stats['misses']} misses, "
+                  f"{stats['evictions']} evictions ({stats['hit_rate']:.0%} hit rate)")
+            for line in METRICS.summary('search_'):
+                print(line)
+            print("Exiting search system...")
             break
         except Exception as e:
             print(f"Error during search: {str(e)}")
@@ -64,17 +124,19 @@ def interactive_search(search_engine: SearchEngine):
 
 def main():
     """Main function for the search system."""
-    db = DatabaseConnector()
-    search_engine = SearchEngine()
+    db = connect_database()
+    profiler = start_profiler()
 
     try:
-        # Load documents into the search engine
-        load_documents_into_search_engine(db, search_engine)
+        # Load the saved index, rebuilding it only if the content table changed
+        search_engine = load_search_engine(db)
 
         # Start interactive search
         interactive_search(search_engine)
     finally:
         db.close()
+        stop_profiler(profiler)
+        export_metrics()
 
 if __name__ == "__main__":
     main()
@@ -1,8 +1,60 @@
-from collections import defaultdict
-import re
-from typing import List, Dict, Optional, Set
-from dataclasses import dataclass
-from tqdm import tqdm  # Fortschrittsbalken
+from array import array
+from collections import Counter, defaultdict
+from functools import partial
+import heapq
+import math
+import time
+from typing import Callable, Iterable, List, Dict, Optional, Sequence, Set, Tuple
+from dataclasses import dataclass, field, replace
+import index_store
+from analyzer import WORD_PATTERN, Analyzer
+from metrics import COUNT_BUCKETS, counter, histogram, progress
+from postings import CollectionStats, InvertedIndex
+from query_cache import QueryCache
+from query_parser import parse_query
+from query_planner import OrPlan, Plan, TermPlan, compile_plan, max_score_top_k
+from snippets import WINDOW, passage_windows, render_passage
+
+# Metadata fields that get their own inverted index for field:value queries
+FIELDS = ('module', 'topic', 'subtopic', 'chapter', 'instructor')
+
+# Words between two stored character offsets of a document's content
+OFFSET_INTERVAL = 32
+
+# Stages of a query that missed the cache; on the MaxScore path candidate
+# generation is part of scoring
+QUERIES = counter('search_queries_total', "Searches, including cache hits")
+SEARCH_TIME = histogram('search_seconds', "Searches that missed the cache")
+PARSE_TIME = histogram('search_parse_seconds', "Parsing, tokenizing and compiling a query")
+CANDIDATE_TIME = histogram('search_candidates_seconds', "Evaluating a query plan to its matching documents")
+CANDIDATE_DOCS = histogram('search_candidate_docs', "Matching documents per evaluated query plan", COUNT_BUCKETS)
+SCORING_TIME = histogram('search_scoring_seconds', "Scoring and selecting the top k")
+RESULT_TIME = histogram('search_results_seconds', "Building results, including snippets")
+INDEX_TIME = histogram('index_add_document_seconds', "Tokenizing and indexing one document")
+
+# Candidates scored between two checks of a search deadline
+DEADLINE_CHECK_INTERVAL = 1024
+
+# A query term: the index it is looked up in and the normalized word
+QueryTerm = Tuple[InvertedIndex, str]
+
+
+class QueryTimeout(TimeoutError):
+    """A search ran past its deadline and was stopped"""
+
+
+def _check_deadline(deadline: Optional[float]) -> None:
+    if deadline is not None and time.monotonic() > deadline:
+        raise QueryTimeout("Search stopped at its deadline")
+
+
+def _until(deadline: float, doc_ids: Iterable[int]) -> Iterable[int]:
+    """doc_ids, raising QueryTimeout once deadline has passed"""
+    for count, doc_id in enumerate(doc_ids):
+        if not count % DEADLINE_CHECK_INTERVAL:
+            _check_deadline(deadline)
+        yield doc_id
+
 
 @dataclass
 class SearchResult:
@@ -12,81 +64,417 @@ class SearchResult:
     topic: Optional[str]
     instructor: Optional[str]
     relevance_score: float
+    page_number: Optional[int] = None
+    # Best matching passages of the content, query terms marked with **
+    snippets: List[str] = field(default_factory=list)
+    # Near-duplicate cluster (see near_duplicates.py) and other files with the same text
+    cluster_id: Optional[int] = None
+    duplicates: List[str] = field(default_factory=list)
+
+    def copy(self) -> 'SearchResult':
+        """Copy whose lists can be changed without touching this result"""
+        return replace(self, snippets=list(self.snippets), duplicates=list(self.duplicates))
 
 class SearchEngine:
-    def __init__(self):
-        self.index: Dict[str, List[int]] = defaultdict(list)
+    RANKINGS = ('bm25', 'tfidf', 'overlap')
+
+    def __init__(self, ranking: str = 'bm25', k1: float = 1.2, b: float = 0.75,
+                 store_content: bool = True, cache_size: int = 256,
+                 analyzer: Optional[Analyzer] = None):
+        if ranking not in self.RANKINGS:
+            raise ValueError(f"Unknown ranking '{ranking}', expected one of {self.RANKINGS}")
+        self.ranking = ranking
+        self.k1 = k1
+        self.b = b
+        # Shared by indexing and querying, so both produce the same terms
+        self.analyzer = analyzer or Analyzer()
+        # Full text index over content and the main metadata fields
+        self.index = InvertedIndex()
+        self.field_index: Dict[str, InvertedIndex] = {name: InvertedIndex() for name in FIELDS}
         self.documents: List[Dict] = []
+        # Near-duplicate cluster of each document (doc['cluster_id']), -1 if it has none
+        self.clusters = array('q')
+        # With store_content=False documents keep only their metadata after
+        # indexing; get_content() fetches the text through content_loader
+        self.store_content = store_content
+        self.content_loader: Optional[Callable[[Dict], Optional[str]]] = None
+        # (doc, start, length) -> part of the text, so snippets need not load all of it
+        self.content_slice_loader: Optional[Callable[[Dict, int, int], str]] = None
+        # Bumped by every index change; cached results of older generations are dropped
+        self.generation = 0
+        self.cache = QueryCache(cache_size, copy_item=SearchResult.copy)
+        # Set when the index was loaded from / saved for a given database state
+        self.fingerprint: Optional[str] = None
+        self._mapping = None
+
+    def save(self, path: str, fingerprint: Optional[str] = None) -> None:
+        """Persist postings and the document table to a binary index file"""
+        index_store.save_index(self, path, fingerprint)
+        self.fingerprint = fingerprint
+
+    @classmethod
+    def load(cls, path: str, **kwargs) -> 'SearchEngine':
+        """Memory-map an index file written by save()"""
+        return index_store.load_index(path, cls(**kwargs))
+
+    def close(self) -> None:
+        """Release the memory-mapped index file, if any"""
+        if self._mapping is not None:
+            self._mapping.close()
+            self._mapping = None
     
     def add_document(self, doc: Dict) -> None:
         """Add a document to the search index"""
+        with INDEX_TIME.time():
+            self._add_document(doc)
+
+    def _add_document(self, doc: Dict) -> None:
+        """add_document() without the timing"""
         doc_id = len(self.documents)
+
+        # Character offset of every OFFSET_INTERVAL-th word, for snippets
+        word_offsets, content_words = self.analyzer.word_offsets(doc['content'] or '', OFFSET_INTERVAL)
+
+        # Full text index with word positions for phrase and NEAR queries;
+        # a gap between values keeps phrases from spanning two of them. Each
+        # value advances by all its words, dropped ones included, so metadata
+        # positions start past content_words.
+        positions: Dict[str, List[int]] = defaultdict(list)
+        values = [(doc['content'], content_words)]
+        for name in ('module', 'topic', 'instructor'):
+            value = doc.get(name)
+            if value:
+                values.append((str(value), len(WORD_PATTERN.findall(str(value)))))
+        offset = 0
+        for value, word_count in values:
+            if not word_count:
+                continue
+            for position, term in self.analyzer.positions(value):
+                positions[term].append(offset + position)
+            offset += word_count + 1
+        self.index.add(doc_id, {term: len(term_positions) for term, term_positions in positions.items()},
+                       positions)
+
+        for name, field_index in self.field_index.items():
+            value = doc.get(name)
+            field_index.add(doc_id, Counter(self.analyzer.cached_terms(str(value))) if value else {})
+
+        doc = dict(doc, word_offsets=word_offsets, content_words=content_words)
+        if not self.store_content:
+            del doc['content']
         self.documents.append(doc)
-        
-        # Index words with basic text normalization
-        text = f"{doc['content']} {doc.get('module', '')} {doc.get('topic', '')} {doc.get('instructor', '')}"
-        words = self._tokenize(text)
-        
-        for word in words:
-            self.index[word].append(doc_id)
+        cluster_id = doc.get('cluster_id')
+        self.clusters.append(-1 if cluster_id is None else cluster_id)
+        self.generation += 1
+
+    def get_content(self, doc_id: int) -> Optional[str]:
+        """Return a document's text, loading it through content_loader if it is not kept in memory"""
+        doc = self.documents[doc_id]
+        if 'content' in doc:
+            return doc['content']
+        if self.content_loader is None:
+            raise RuntimeError("Document content is not stored and no content_loader is set")
+        return self.content_loader(doc)
+
+    def get_content_slice(self, doc_id: int, start: int, end: int) -> str:
+        """Characters start..end-1 of a document's text, loading only those if possible"""
+        doc = self.documents[doc_id]
+        if 'content' in doc:
+            return (doc['content'] or '')[start:end]
+        if self.content_slice_loader is not None:
+            return self.content_slice_loader(doc, start, end - start) or ''
+        return (self.get_content(doc_id) or '')[start:end]
     
-    def add_documents(self, docs: List[Dict]) -> None:
+    def add_documents(self, docs: Iterable[Dict]) -> None:
         """Add multiple documents to the search index with progress bar"""
-        for doc in tqdm(docs, desc="Indexing Documents", unit="doc"):
+        for doc in progress(docs, desc="Indexing Documents", unit="doc"):
             self.add_document(doc)
     
     def _tokenize(self, text: str) -> Set[str]:
         """Tokenize and normalize text"""
-        if not text:
-            return set()
-        # Convert to lowercase and split into words
-        words = re.findall(r'\w+', text.lower())
-        # Remove common stop words and short terms
-        stop_words = {'aber', 'alle', 'allem', 'allen', 'aller', 'alles', 'als', 'also', 'am', 'an', 'ander', 'andere', 'anderem', 'anderen', 'anderer', 'anderes', 'anderm', 'andern', 'anderr', 'anders', 'auch', 'auf', 'aus', 'bei', 'bin', 'bis', 'bist', 'da', 'damit', 'dann', 'den', 'des', 'dem', 'die', 'das', 'dass', 'dein', 'deine', 'deren', 'derer', 'dergleichen', 'desgleichen', 'desto', 'dich', 'dieb', 'dies', 'diese', 'diesem', 'diesen', 'dieser', 'dieses', 'dir', 'doch', 'dort', 'du', 'durch', 'ein', 'eine', 'einem', 'einen', 'einer', 'eines', 'enig', 'einige', 'einigem', 'einigen', 'einiger', 'einiges', 'einmal', 'er', 'ihm', 'ihn', 'ihr', 'ihre', 'ihrem', 'ihren', 'ihrer', 'ihres', 'im', 'in', 'indem', 'ins', 'ist', 'jede', 'jedem', 'jeden', 'jeder', 'jedes', 'jene', 'jenem', 'jenen', 'jener', 'jenes', 'jetzt', 'kann', 'kein', 'keine', 'keinem', 'keinen', 'keiner', 'keines', 'können', 'könnte', 'machen', 'man', 'manche', 'manchem', 'manchen', 'mancher', 'manches', 'mein', 'meine', 'meinem', 'meinen', 'meiner', 'meines', 'mich', 'mit', 'muss', 'musste', 'nach', 'nicht', 'nichts', 'noch', 'nun', 'nur', 'ob', 'oder', 'ohne', 'sehr', 'sein', 'seine', 'seinem', 'seinen', 'seiner', 'seines', 'selbst', 'sich', 'sie', 'sind', 'so', 'solche', 'solchem', 'solchen', 'solcher', 'solches', 'soll', 'sollte', 'sondern', 'sonst', 'über', 'um', 'und', 'uns', 'unse', 'unsen', 'unser', 'unsere', 'unsers', 'unter', 'viel', 'viele', 'vielem', 'vielen', 'vieler', 'vieles', 'vom', 'von', 'vor', 'während', 'war', 'waren', 'warst', 'was', 'weg', 'weil', 'weiter', 'welche', 'welchem', 'welchen', 'welcher', 'welches', 'wenn', 'werde', 'werden', 'werdet', 'wir', 'wird', 'wirst', 'wo', 'wollen', 'wollte', 'würde', 'würden', 'zu', 'zum', 'zur', 'zwar', 'zwischen'}
-
-        stop_words = {'der', 'die', 'das', 'und', 'in', 'im', 'für', 'von', 'mit'}
-        return {w for w in words if len(w) > 2 and w not in stop_words}
+        return set(self._terms(text))
+
+    def _terms(self, text: str) -> List[str]:
+        """Tokenize and normalize text, keeping repeated terms"""
+        return self.analyzer.terms(text)
     
-    def search_with_progress(self, query: str, field: Optional[str] = None) -> List[SearchResult]:
+    def search_with_progress(self, query: str, field: Optional[str] = None,
+                             k: Optional[int] = None, snippets: int = 0,
+                             collapse: bool = False) -> List[SearchResult]:
         """Search for documents matching the query with progress bar"""
-        query_words = self._tokenize(query)
-        results = []
-        
-        if field:
-            # Field-specific search
-            for doc_id, doc in tqdm(enumerate(self.documents), desc="Searching Documents", unit="doc"):
-                if field in doc and doc[field]:
-                    field_content = self._tokenize(str(doc[field]))
-                    if query_words & field_content:  # Use set intersection
-                        score = len(query_words & field_content) / len(query_words)
-                        results.append(self._create_search_result(doc_id, score))
+        return self.search(query, field, k, progress=True, snippets=snippets, collapse=collapse)
+
+    def search(self, query: str, field: Optional[str] = None, k: Optional[int] = None,
+               progress: bool = False, snippets: int = 0, collapse: bool = False,
+               deadline: Optional[float] = None) -> List[SearchResult]:
+        """Search for documents matching the query.
+
+        Terms next to each other must all match; AND, OR, NOT and parentheses
+        combine them explicitly, e.g. ``(normalisierung OR normalform) NOT
+        übung``. Field clauses such as ``topic:normalisierung`` search one
+        metadata field. Quoted phrases ``"third normal form"`` must occur as
+        written, and ``a NEAR/n b`` requires at most n words between a and b;
+        both are checked on the positional postings. Passing field keeps its
+        original meaning: documents with any query word in that field, which
+        may be any document key (e.g. file_type); the query syntax is not
+        interpreted then. Returns the k best results (all
+        matches if k is None), best first, each with up to snippets
+        highlighted passages of its content. With collapse, near-duplicates
+        are shown once: only the best document of each cluster is returned.
+        With a deadline (a time.monotonic() value) the search checks between
+        its stages and while scoring whether it has passed and then raises
+        QueryTimeout, so a query nobody waits for no longer keeps a thread.
+        """
+        QUERIES.inc()
+        if field and field.lower() not in self.field_index and field.lower() != 'content':
+            return self._search_values(query, field, k, snippets, collapse, progress, deadline)
+        with PARSE_TIME.time():
+            plan = self._plan(query, field)
+        if plan is None:
+            return []
+        cache_key = (plan.key(), k, snippets, collapse)
+        cached = self.cache.get(cache_key, self.generation)
+        if cached is not None:
+            return cached
+        generation = self.generation
+        with SEARCH_TIME.time():
+            results = self._search(plan, k, snippets, collapse, progress, deadline)
+        self.cache.put(cache_key, generation, results)
+        return results
+
+    def _search(self, plan: Plan, k: Optional[int], snippets: int, collapse: bool,
+                show_progress: bool, deadline: Optional[float] = None) -> List[SearchResult]:
+        """Rank the documents matching a compiled plan; search() without the cache"""
+        _check_deadline(deadline)
+        query_terms = list(dict.fromkeys(plan.terms()))
+        weights = self._term_weights(query_terms)
+        if k is not None and self.ranking != 'overlap' and isinstance(plan, OrPlan) and plan.only_terms():
+            # Broad disjunctions: rank without scoring every matching document
+            with SCORING_TIME.time():
+                lists = [(target[word], self._upper_bound(target, word, idf), partial(self._term_score, target, idf))
+                         for target, word, idf in weights]
+                check = partial(_check_deadline, deadline) if deadline is not None else None
+                top = max_score_top_k(lists, k, check, DEADLINE_CHECK_INTERVAL)
+                if collapse:
+                    # The k best clusters are all among the n best documents once
+                    # those contain k clusters (or all matches)
+                    n = k
+                    while len(self._collapse(top)) < k and len(top) == n:
+                        n *= 4
+                        top = max_score_top_k(lists, n, check, DEADLINE_CHECK_INTERVAL)
+                    top = self._collapse(top)[:k]
         else:
-            # Full text search using inverted index
-            candidate_docs = self._find_candidate_documents(query_words)
-            for doc_id in tqdm(candidate_docs, desc="Calculating Scores", unit="doc"):
-                score = self._calculate_relevance_score(doc_id, query_words)
-                results.append(self._create_search_result(doc_id, score))
-        
-        return sorted(results, key=lambda x: x.relevance_score, reverse=True)
-    
-    def _find_candidate_documents(self, query_words: Set[str]) -> Set[int]:
-        """Find candidate documents containing query words"""
-        candidate_docs = set()
-        for word in query_words:
-            if word in self.index:
-                if not candidate_docs:
-                    candidate_docs = set(self.index[word])
-                else:
-                    candidate_docs &= set(self.index[word])
-        return candidate_docs
+            with CANDIDATE_TIME.time():
+                candidate_docs = plan.evaluate(len(self.documents))
+            CANDIDATE_DOCS.observe(len(candidate_docs))
+            _check_deadline(deadline)
+            if deadline is not None:
+                candidate_docs = _until(deadline, candidate_docs)
+            with SCORING_TIME.time():
+                scored = (
+                    (self._calculate_relevance_score(doc_id, query_terms, weights), doc_id)
+                    for doc_id in progress(candidate_docs, show_progress, desc="Calculating Scores", unit="doc")
+                )
+                top = self._top_k(self._best_per_cluster(scored) if collapse else scored, k)
+
+        with RESULT_TIME.time():
+            content_terms = [word for target, word in query_terms if target is self.index]
+            results = []
+            for score, doc_id in top:
+                # Snippets may read from the database for every result
+                _check_deadline(deadline)
+                results.append(self._create_search_result(doc_id, score, content_terms, snippets))
+            return results
+
+    def collection_stats(self) -> Dict[str, CollectionStats]:
+        """Statistics of the documents in this engine, per index name ('content' and the fields)"""
+        return {name: target.stats() for name, target in dict(self.field_index, content=self.index).items()}
+
+    def use_collection_stats(self, stats: Dict[str, CollectionStats]) -> None:
+        """Score with the statistics of a larger collection this engine holds a shard of"""
+        for name, target in dict(self.field_index, content=self.index).items():
+            target.collection = stats[name]
+        self.generation += 1
+
+    def cache_stats(self) -> Dict[str, float]:
+        """Hit, miss and eviction counters of the query result cache"""
+        return self.cache.stats()
+
+    def _plan(self, query: str, field: Optional[str] = None) -> Optional[Plan]:
+        """Parse a query and compile it against the indexes; None if it has no terms.
+
+        With an indexed field the query is a plain disjunction of its words
+        in that field's index, as field searches always were.
+        """
+        indexes = dict(self.field_index, content=self.index)
+        if not field:
+            return compile_plan(parse_query(query, indexes), self.analyzer, indexes)
+        name = field.lower()
+        terms = [TermPlan(name, indexes[name], term) for term in dict.fromkeys(self.analyzer.terms(query))]
+        if not terms:
+            return None
+        return terms[0] if len(terms) == 1 else OrPlan(terms)
+
+    def _search_values(self, query: str, field: str, k: Optional[int], snippets: int, collapse: bool,
+                       show_progress: bool, deadline: Optional[float] = None) -> List[SearchResult]:
+        """Field search on a document key without an index: scan for any query word.
+
+        Scores are the fraction of query words found in the value.
+        """
+        with PARSE_TIME.time():
+            words = set(self.analyzer.terms(query))
+        if not words:
+            return []
+        cache_key = (('values', field, frozenset(words)), k, snippets, collapse)
+        cached = self.cache.get(cache_key, self.generation)
+        if cached is not None:
+            return cached
+        generation = self.generation
+        with SEARCH_TIME.time():
+            doc_ids = range(len(self.documents))
+            if deadline is not None:
+                doc_ids = _until(deadline, doc_ids)
+            with SCORING_TIME.time():
+                scored = []
+                for doc_id in progress(doc_ids, show_progress, desc="Searching Documents", unit="doc"):
+                    value = self.documents[doc_id].get(field)
+                    if value:
+                        matching = len(words & set(self.analyzer.cached_terms(str(value))))
+                        if matching:
+                            scored.append((matching / len(words), doc_id))
+                top = self._top_k(self._best_per_cluster(scored) if collapse else scored, k)
+            with RESULT_TIME.time():
+                content_words = [word for word in words if word in self.index]
+                results = []
+                for score, doc_id in top:
+                    _check_deadline(deadline)
+                    results.append(self._create_search_result(doc_id, score, content_words, snippets))
+        self.cache.put(cache_key, generation, results)
+        return results
+
+    def _cluster(self, doc_id: int) -> int:
+        """Key documents are collapsed by: their cluster, or a negative key of their own"""
+        cluster_id = self.clusters[doc_id]
+        return cluster_id if cluster_id >= 0 else -1 - doc_id
+
+    def _collapse(self, ranked: List[Tuple[float, int]]) -> List[Tuple[float, int]]:
+        """Keep the first (best) document of every cluster in a ranked list"""
+        seen = set()
+        collapsed = []
+        for score, doc_id in ranked:
+            cluster = self._cluster(doc_id)
+            if cluster not in seen:
+                seen.add(cluster)
+                collapsed.append((score, doc_id))
+        return collapsed
+
+    def _best_per_cluster(self, scored: Iterable[Tuple[float, int]]) -> List[Tuple[float, int]]:
+        """Best (score, doc_id) of every cluster, ties going to the lower doc_id"""
+        best: Dict[int, Tuple[float, int]] = {}
+        for score, doc_id in scored:
+            cluster = self._cluster(doc_id)
+            current = best.get(cluster)
+            if current is None or score > current[0] or (score == current[0] and doc_id < current[1]):
+                best[cluster] = (score, doc_id)
+        return list(best.values())
+
+    @staticmethod
+    def _top_k(scored: Iterable[Tuple[float, int]], k: Optional[int]) -> List[Tuple[float, int]]:
+        """Select the k highest (score, doc_id) pairs, ties going to the lower doc_id"""
+        if k is None:
+            return sorted(scored, key=lambda item: (-item[0], item[1]))
+        if k <= 0:
+            return []
+        # Min-heap of the best k seen so far; doc ids are negated so that
+        # on equal scores the earlier document ranks higher
+        heap: List[Tuple[float, int]] = []
+        for score, doc_id in scored:
+            item = (score, -doc_id)
+            if len(heap) < k:
+                heapq.heappush(heap, item)
+            elif item > heap[0]:
+                heapq.heapreplace(heap, item)
+        return [(score, -neg_id) for score, neg_id in sorted(heap, reverse=True)]
     
-    def _calculate_relevance_score(self, doc_id: int, query_words: Set[str]) -> float:
-        """Calculate relevance score for a document"""
-        doc_text = self._tokenize(self.documents[doc_id]['content'])
-        matching_words = query_words & doc_text
-        return len(matching_words) / len(query_words)
+    def _term_weights(self, query_terms: List[QueryTerm]) -> List[Tuple[InvertedIndex, str, float]]:
+        """Collection-level weight (idf) of each indexed query term"""
+        weights = []
+        for target, word in query_terms:
+            if word not in target:
+                continue
+            num_docs = target.doc_count()
+            doc_freq = target.doc_freq(word)
+            if not doc_freq:
+                continue
+            if self.ranking == 'bm25':
+                weight = math.log(1 + (num_docs - doc_freq + 0.5) / (doc_freq + 0.5))
+            elif self.ranking == 'tfidf':
+                weight = math.log(num_docs / doc_freq)
+            else:
+                weight = 1.0
+            weights.append((target, word, weight))
+        return weights
+
+    def _term_score(self, target: InvertedIndex, idf: float, doc_id: int, tf: int) -> float:
+        """Score contribution of one term occurring tf times in doc_id"""
+        if self.ranking == 'bm25':
+            length_ratio = target.doc_lengths[doc_id] / (target.average_length() or 1.0)
+            return idf * tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * length_ratio))
+        return (1 + math.log(tf)) * idf
+
+    def _upper_bound(self, target: InvertedIndex, word: str, idf: float) -> float:
+        """Highest score word can contribute to any document"""
+        max_tf = target[word].max_frequency
+        if self.ranking == 'bm25':
+            # BM25 grows with tf and shrinks with length; bound with a zero-length document
+            bound = idf * max_tf * (self.k1 + 1) / (max_tf + self.k1 * (1 - self.b))
+        else:
+            bound = (1 + math.log(max_tf)) * idf
+        # Headroom for rounding, so a real score never exceeds its bound
+        return bound * (1 + 1e-9)
+
+    def _calculate_relevance_score(self, doc_id: int, query_terms: List[QueryTerm],
+                                   weights: List[Tuple[InvertedIndex, str, float]]) -> float:
+        """Calculate relevance score for a document from index-time statistics"""
+        if self.ranking == 'overlap':
+            matching = sum(1 for target, word, _ in weights if target[word].frequency(doc_id))
+            return matching / len(query_terms) if query_terms else 0.0
+
+        score = 0.0
+        for target, word, idf in weights:
+            tf = target[word].frequency(doc_id)
+            if tf:
+                score += self._term_score(target, idf, doc_id, tf)
+        return score
     
-    def _create_search_result(self, doc_id: int, score: float) -> SearchResult:
+    def _snippets(self, doc_id: int, doc: Dict, terms: List[str], count: int) -> List[str]:
+        """Up to count passages with the most query terms, built from the stored word offsets.
+
+        Only the hit positions and the text around the chosen windows are
+        read, so the cost does not depend on the length of the document.
+        """
+        offsets = doc.get('word_offsets')
+        content_words = doc.get('content_words', 0)
+        if not offsets or not content_words:
+            return []
+        # Positions past the content belong to the metadata values indexed after it
+        hits = sorted((position, term) for term in terms if term in self.index
+                      for position in self.index[term].doc_positions(doc_id) if position < content_words)
+        highlight = {position for position, _ in hits}
+        windows = passage_windows(hits, WINDOW, count) if hits else [(0, WINDOW)]
+
+        passages = []
+        for start, end in windows:
+            end = min(end, content_words)
+            first_block = start // OFFSET_INTERVAL
+            last_block = min((end - 1) // OFFSET_INTERVAL + 1, len(offsets) - 1)
+            text = self.get_content_slice(doc_id, offsets[first_block], offsets[last_block])
+            passages.append(render_passage(text, first_block * OFFSET_INTERVAL, start, end, highlight,
+                                           offsets[first_block] > 0, offsets[last_block] < offsets[-1]))
+        return [passage for passage in passages if passage]
+
+    def _create_search_result(self, doc_id: int, score: float, terms: Sequence[str] = (),
+                              snippets: int = 0) -> SearchResult:
         """Create a SearchResult object from a document"""
         doc = self.documents[doc_id]
         return SearchResult(
@@ -95,5 +483,9 @@ class SearchEngine:
             module=doc.get('module'),
             topic=doc.get('topic'),
             instructor=doc.get('instructor'),
-            relevance_score=score
+            relevance_score=score,
+            page_number=doc.get('page_number'),
+            snippets=self._snippets(doc_id, doc, list(terms), snippets) if snippets > 0 else [],
+            cluster_id=doc.get('cluster_id'),
+            duplicates=doc.get('duplicate_paths', [])
         )
@@ -0,0 +1,436 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as SearchTimeout
+from dataclasses import asdict
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from db_connector import StorageBackend, connect_database
+from metrics import METRICS, counter, export_metrics, histogram
+from mysql_pool import POOL_SIZE
+from profiler import PROFILE_PATH, start_profiler, stop_profiler
+from search_documents import INDEX_PATH, load_search_engine
+from search_engine import QueryTimeout, SearchEngine
+
+MAX_K = 100
+MAX_SNIPPETS = 5
+
+# Including the wait for a free search thread
+REQUEST_TIME = histogram('server_search_seconds', "Search requests answered, including queueing")
+TIMEOUTS = counter('server_search_timeouts_total', "Search requests that timed out")
+REJECTED = counter('server_search_rejected_total', "Search requests rejected because all workers were busy")
+
+
+def generation_path(index_path: str, fingerprint: str) -> str:
+    """Index file of one database state, e.g. search_index.3f2a9c01d4e5b6a7.bin"""
+    root, ext = os.path.splitext(index_path)
+    return f"{root}.{hashlib.sha1(fingerprint.encode('utf-8')).hexdigest()[:16]}{ext}"
+
+
+def generation_paths(index_path: str) -> List[str]:
+    """Index files written by generation_path() for index_path"""
+    directory, name = os.path.split(index_path)
+    root, ext = os.path.splitext(name)
+    pattern = re.compile(re.escape(root) + r"\.[0-9a-f]{16}" + re.escape(ext))
+    return [os.path.join(directory, entry) for entry in os.listdir(directory or '.') if pattern.fullmatch(entry)]
+
+
+class SearchService:
+    """Holds the current index and swaps in rebuilt ones without interrupting searches.
+
+    All database access for the index happens on one background thread: it
+    loads the index at start-up and afterwards rebuilds it whenever the
+    content fingerprint changes, checked every reload_interval seconds or on
+    request_reload(). Every database state gets its own index file (see
+    generation_path), so a rebuild never replaces a file that is still
+    mapped. Searches take the current engine and keep using it, so a swap
+    never affects a request already running; the old engine is closed and
+    its file deleted once the last of them finishes.
+
+    At most workers searches run at once; further requests are rejected
+    instead of queueing behind them, and a search stops itself once it runs
+    past search_timeout.
+    """
+
+    def __init__(self, db_factory: Callable[[], StorageBackend] = connect_database,
+                 index_path: str = INDEX_PATH, reload_interval: Optional[float] = None,
+                 search_timeout: float = 5.0, workers: int = 8):
+        self.db_factory = db_factory
+        self.index_path = index_path
+        self.reload_interval = reload_interval
+        self.search_timeout = search_timeout
+        self.workers = workers
+        self.engine: Optional[SearchEngine] = None
+        self.loaded_at: Optional[float] = None
+        self.started_at = time.time()
+        self.reloads = 0
+        self.last_error: Optional[str] = None
+        self.reloading = False
+        self._ready = threading.Event()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="search")
+        self._slots = threading.BoundedSemaphore(workers)
+        # Searches running per engine and the index file of each engine
+        self._engine_lock = threading.Lock()
+        self._running: Dict[SearchEngine, int] = {}
+        self._engine_paths: Dict[SearchEngine, str] = {}
+        # Database connection of each worker thread, opened on its first snippet
+        # and kept until stop(); opening one per search would re-run the
+        # schema setup of the SQLite backend and contend with the ingest writer
+        self._thread_state = threading.local()
+        self._connections: List[StorageBackend] = []
+        self._connections_lock = threading.Lock()
+        self._loader = threading.Thread(target=self._run_loader, name="index-loader", daemon=True)
+
+    def start(self, wait: bool = True) -> None:
+        self._loader.start()
+        if wait:
+            self._ready.wait()
+            if self.engine is None:
+                raise RuntimeError(f"Initial index load failed: {self.last_error}")
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._wake.set()
+        self._loader.join()
+        # Searches end at their deadline at the latest; then no thread uses a connection
+        self._executor.shutdown(wait=True)
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for db in connections:
+            try:
+                db.close()
+            except Exception as e:
+                logging.warning(f"Could not close a search connection: {e}")
+
+    def _content_slice(self, doc: Dict, start: int, length: int) -> Optional[str]:
+        """Part of a document's text, read through the connection of this worker thread"""
+        db = getattr(self._thread_state, 'db', None)
+        if db is None:
+            db = self._thread_state.db = self.db_factory()
+            with self._connections_lock:
+                self._connections.append(db)
+        self._thread_state.used = True
+        return db.fetch_content_slice(doc['content_id'], start, length)
+
+    def _end_read(self) -> None:
+        """End the read transaction of this thread's connection, dropping the connection if that fails"""
+        db = getattr(self._thread_state, 'db', None)
+        if db is None or not getattr(self._thread_state, 'used', False):
+            return
+        self._thread_state.used = False
+        try:
+            # Under MySQL's REPEATABLE READ the next search would otherwise read this one's snapshot
+            db.db.rollback()
+        except Exception as e:
+            logging.warning(f"Dropping a search connection: {e}")
+            self._thread_state.db = None
+            with self._connections_lock:
+                if db in self._connections:
+                    self._connections.remove(db)
+            try:
+                db.close()
+            except Exception:
+                pass
+
+    def request_reload(self) -> None:
+        """Check the database now instead of waiting for the next interval"""
+        self._wake.set()
+
+    def _run_loader(self) -> None:
+        db = None
+        try:
+            db = self.db_factory()
+            while not self._stopped.is_set():
+                try:
+                    fingerprint = db.content_fingerprint()
+                    if self.engine is None or fingerprint != self.engine.fingerprint:
+                        self._load(db, fingerprint)
+                finally:
+                    # End the read transaction; under MySQL's REPEATABLE READ the
+                    # next check would otherwise still see this one's snapshot
+                    db.db.rollback()
+                self._ready.set()
+                self._wake.wait(self.reload_interval)
+                self._wake.clear()
+        except Exception as e:
+            logging.exception("Index loader stopped")
+            self.last_error = str(e)
+        finally:
+            self._ready.set()
+            if db is not None:
+                db.close()
+
+    def _load(self, db: StorageBackend, fingerprint: str) -> None:
+        self.reloading = True
+        try:
+            start = time.perf_counter()
+            path = generation_path(self.index_path, fingerprint)
+            engine = load_search_engine(db, path, fingerprint=fingerprint)
+            # The connection belongs to this thread; snippets read the text through
+            # a connection of the searching thread instead
+            engine.content_loader = None
+            engine.content_slice_loader = self._content_slice
+            first = self.engine is None
+            self._swap(engine, path)
+            if first:
+                self._remove_stale_files(path)
+            self.loaded_at = time.time()
+            self.reloads += 1
+            self.last_error = None
+            logging.info(f"Index with {len(engine.documents)} documents ready in "
+                         f"{time.perf_counter() - start:.2f}s")
+        except Exception as e:
+            # Keep serving the previous index
+            logging.exception("Index reload failed")
+            self.last_error = str(e)
+        finally:
+            self.reloading = False
+
+    def _swap(self, engine: SearchEngine, path: str) -> None:
+        with self._engine_lock:
+            old, self.engine = self.engine, engine
+            self._engine_paths[engine] = path
+            idle = old is not None and old not in self._running
+        if idle:
+            self._retire(old)
+
+    def _acquire_engine(self) -> SearchEngine:
+        with self._engine_lock:
+            engine = self.engine
+            if engine is None:
+                raise RuntimeError("Index not loaded")
+            self._running[engine] = self._running.get(engine, 0) + 1
+            return engine
+
+    def _release_engine(self, engine: SearchEngine) -> None:
+        with self._engine_lock:
+            self._running[engine] -= 1
+            if self._running[engine]:
+                return
+            del self._running[engine]
+            if engine is self.engine:
+                return
+        self._retire(engine)
+
+    def _retire(self, engine: SearchEngine) -> None:
+        """Unmap a replaced engine's index file and delete the file"""
+        engine.close()
+        with self._engine_lock:
+            path = self._engine_paths.pop(engine, None)
+            current = self._engine_paths.get(self.engine)
+        if path is not None and path != current:
+            try:
+                os.remove(path)
+            except OSError as e:
+                logging.warning(f"Could not delete old index file {path}: {e}")
+
+    def _remove_stale_files(self, current: str) -> None:
+        """Delete index files of earlier database states left by a previous run"""
+        for path in generation_paths(self.index_path):
+            if os.path.abspath(path) != os.path.abspath(current):
+                try:
+                    os.remove(path)
+                except OSError as e:
+                    logging.warning(f"Could not delete old index file {path}: {e}")
+
+    def _run_search(self, engine: SearchEngine, deadline: float, *args) -> List:
+        """Search on a worker thread, then end its read and give back its slot and engine"""
+        try:
+            return engine.search(*args, deadline=deadline)
+        finally:
+            self._end_read()
+            self._release_engine(engine)
+            self._slots.release()
+
+    def search(self, query: str, field: Optional[str] = None, k: int = 10, snippets: int = 0,
+               collapse: bool = False) -> Dict:
+        """Run a search on the current index, giving up after search_timeout seconds"""
+        start = time.perf_counter()
+        if not self._slots.acquire(blocking=False):
+            REJECTED.inc()
+            raise RuntimeError(f"All {self.workers} search workers are busy")
+        try:
+            engine = self._acquire_engine()
+        except BaseException:
+            self._slots.release()
+            raise
+        deadline = time.monotonic() + self.search_timeout
+        try:
+            future = self._executor.submit(self._run_search, engine, deadline,
+                                           query, field, k, False, snippets, collapse)
+        except BaseException:
+            self._release_engine(engine)
+            self._slots.release()
+            raise
+        try:
+            results = future.result(timeout=self.search_timeout)
+        except (SearchTimeout, QueryTimeout):
+            TIMEOUTS.inc()
+            raise
+        REQUEST_TIME.observe(time.perf_counter() - start)
+        return {
+            'query': query,
+            'field': field,
+            'took_ms': (time.perf_counter() - start) * 1000,
+            'results': [asdict(result) for result in results],
+        }
+
+    def health(self) -> Dict:
+        engine = self.engine
+        return {
+            'status': 'ok' if engine is not None else 'starting',
+            'documents': len(engine.documents) if engine is not None else 0,
+            'fingerprint': engine.fingerprint if engine is not None else None,
+            'loaded_at': self.loaded_at,
+            'reloads': self.reloads,
+            'reloading': self.reloading,
+            'last_error': self.last_error,
+            'uptime_s': time.time() - self.started_at,
+            'cache': engine.cache_stats() if engine is not None else None,
+        }
+
+
+class SearchRequestHandler(BaseHTTPRequestHandler):
+    """GET/POST /search, GET /health and POST /reload answering JSON; GET /metrics for monitoring"""
+
+    server_version = "CASSearch/1.0"
+    # Socket timeout, so a stalled client cannot hold a thread forever
+    timeout = 30
+
+    @property
+    def service(self) -> SearchService:
+        return self.server.service
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == '/health':
+            health = self.service.health()
+            self._send(200 if health['status'] == 'ok' else 503, health)
+        elif url.path == '/metrics':
+            # Prometheus text by default, ?format=json for JSON
+            if parse_qs(url.query).get('format', [''])[-1] == 'json':
+                self._send(200, METRICS.to_json())
+            else:
+                self._send_text(200, METRICS.to_prometheus(), 'text/plain; version=0.0.4; charset=utf-8')
+        elif url.path == '/search':
+            params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+            self._search(params)
+        else:
+            self._send(404, {'error': f"Unknown path {url.path}"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path == '/reload':
+            self.service.request_reload()
+            self._send(202, {'status': 'reload scheduled'})
+        elif url.path == '/search':
+            try:
+                length = int(self.headers.get('Content-Length', 0))
+                params = json.loads(self.rfile.read(length) or b'{}')
+            except ValueError:
+                self._send(400, {'error': "Request body must be JSON"})
+                return
+            if not isinstance(params, dict):
+                self._send(400, {'error': "Request body must be a JSON object"})
+                return
+            self._search(params)
+        else:
+            self._send(404, {'error': f"Unknown path {url.path}"})
+
+    def _search(self, params: Dict) -> None:
+        query = str(params.get('q') or '').strip()
+        if not query:
+            self._send(400, {'error': "Missing query parameter q"})
+            return
+        try:
+            k = min(max(int(params.get('k', 10)), 1), MAX_K)
+        except (TypeError, ValueError):
+            self._send(400, {'error': "k must be an integer"})
+            return
+        try:
+            snippets = min(max(int(params.get('snippets', 0)), 0), MAX_SNIPPETS)
+        except (TypeError, ValueError):
+            self._send(400, {'error': "snippets must be an integer"})
+            return
+        # JSON bodies may send true, query strings collapse=1 or collapse=true
+        collapse = str(params.get('collapse', '')).lower() in ('1', 'true', 'yes')
+        try:
+            self._send(200, self.service.search(query, params.get('field') or None, k, snippets, collapse))
+        except ValueError as e:
+            self._send(400, {'error': str(e)})
+        except (SearchTimeout, QueryTimeout):
+            self._send(504, {'error': f"Search timed out after {self.service.search_timeout}s"})
+        except RuntimeError as e:
+            self._send(503, {'error': str(e)})
+
+    def _send(self, status: int, body: Dict) -> None:
+        self._send_text(status, json.dumps(body, ensure_ascii=False, default=str),
+                        'application/json; charset=utf-8')
+
+    def _send_text(self, status: int, body: str, content_type: str) -> None:
+        payload = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        logging.info(f"{self.address_string()} {format % args}")
+
+
+def make_server(service: SearchService, address: Tuple[str, int]) -> ThreadingHTTPServer:
+    """HTTP server handling each connection on its own thread"""
+    server = ThreadingHTTPServer(address, SearchRequestHandler)
+    server.daemon_threads = True
+    server.service = service
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search server with a JSON HTTP API")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--index', default=INDEX_PATH,
+                        help="Base name of the index files, one per database state (e.g. search_index.<hash>.bin)")
+    parser.add_argument('--timeout', type=float, default=5.0, help="Search timeout in seconds")
+    parser.add_argument('--workers', type=int, default=8, help="Concurrent searches")
+    parser.add_argument('--reload-interval', type=float, default=60.0,
+                        help="Seconds between checks for changed content (0 = only on POST /reload)")
+    parser.add_argument('--profile', default=PROFILE_PATH,
+                        help="Sample stacks while serving and write them to this file on exit (collapsed format)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    # Every running search and the index loader hold a connection of the pool
+    pool_size = max(POOL_SIZE, args.workers + 1) if POOL_SIZE else 0
+    service = SearchService(db_factory=partial(connect_database, pool_size=pool_size), index_path=args.index,
+                            reload_interval=args.reload_interval or None,
+                            search_timeout=args.timeout, workers=args.workers)
+    profiler = start_profiler(args.profile)
+    service.start()
+    server = make_server(service, (args.host, args.port))
+    logging.info(f"Serving on http://{args.host}:{args.port} (GET /search?q=..., GET /health, GET /metrics, POST /reload)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.stop()
+        stop_profiler(profiler)
+        export_metrics()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,311 @@
+import argparse
+import heapq
+import multiprocessing
+import os
+import threading
+import zlib
+from dataclasses import replace
+from itertools import islice
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import index_store
+from metrics import METRICS, export_metrics
+from db_connector import StorageBackend, connect_database
+from postings import CollectionStats
+from search_documents import INDEX_PATH, interactive_search, load_documents_into_search_engine
+from search_engine import SearchEngine, SearchResult
+
+PARTITIONS = ('doc_id', 'module')
+# Documents sent to a shard per message while indexing
+BATCH_SIZE = 256
+
+
+def shard_path(index_path: str, shard: int) -> str:
+    """Index file of one shard, e.g. search_index.shard0.bin"""
+    root, ext = os.path.splitext(index_path)
+    return f"{root}.shard{shard}{ext}"
+
+
+def _serve_shard(conn, engine_kwargs: Dict) -> None:
+    """Worker process: holds one shard's SearchEngine and answers commands sent over conn.
+
+    Every command except 'add' gets a reply ('ok', value) or ('error',
+    exception). Errors while adding documents are kept and reported with the
+    next reply, so indexing can stream without waiting for each batch.
+    """
+    engine = SearchEngine(**engine_kwargs)
+    pending_error = None
+    while True:
+        try:
+            command, *args = conn.recv()
+        except EOFError:
+            break
+        if command == 'close':
+            break
+        try:
+            if command == 'add':
+                if pending_error is None:
+                    for doc in args[0]:
+                        engine.add_document(doc)
+                continue
+            if pending_error is not None:
+                error, pending_error = pending_error, None
+                raise error
+            if command == 'search':
+                value = []
+                for result in engine.search(*args):
+                    # Report the id the coordinator assigned, not the shard-local one;
+                    # copied, since the shard's query cache holds the original
+                    result = replace(result, doc_id=engine.documents[result.doc_id]['global_id'])
+                    value.append((result.relevance_score, result.doc_id, result))
+            elif command == 'stats':
+                value = engine.collection_stats()
+            elif command == 'use_stats':
+                engine.use_collection_stats(args[0])
+                value = None
+            elif command == 'save':
+                engine.save(*args)
+                value = None
+            elif command == 'load':
+                engine.close()
+                engine = SearchEngine.load(args[0], **engine_kwargs)
+                value = len(engine.documents)
+            elif command == 'reset':
+                engine.close()
+                engine = SearchEngine(**engine_kwargs)
+                value = None
+            elif command == 'cache_stats':
+                value = engine.cache_stats()
+            elif command == 'metrics':
+                value = METRICS.drain()
+            else:
+                raise ValueError(f"Unknown shard command '{command}'")
+            conn.send(('ok', value))
+        except Exception as e:
+            if command == 'add':
+                pending_error = e
+            else:
+                conn.send(('error', e))
+    engine.close()
+
+
+class ShardedSearchEngine:
+    """Search over N index shards, each held by its own worker process.
+
+    Documents are assigned to shards by doc id (round robin) or by module.
+    A query is sent to all shards at once, every shard computes its own
+    top-k in parallel and the coordinator merges them. Before searching, the
+    shards exchange their statistics, so each one scores with collection-wide
+    document frequencies and lengths: results and scores are the same as
+    those of a single SearchEngine over all documents, and result doc ids
+    are the ids a single engine would have assigned.
+
+    Results carry metadata and, if requested, snippets built by the shard
+    holding the document; document text stays in the shards.
+    """
+
+    def __init__(self, shards: Optional[int] = None, partition: str = 'doc_id', **engine_kwargs):
+        if partition not in PARTITIONS:
+            raise ValueError(f"Unknown partition '{partition}', expected one of {PARTITIONS}")
+        self.shards = shards or os.cpu_count() or 1
+        self.partition = partition
+        self.doc_count = 0
+        self.fingerprint: Optional[str] = None
+        self._batches: List[List[Dict]] = [[] for _ in range(self.shards)]
+        self._stats_current = True
+        # One request at a time per pipe; concurrent callers are serialized
+        self._lock = threading.Lock()
+        self._connections = []
+        self._processes = []
+        for shard in range(self.shards):
+            parent, child = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=_serve_shard, args=(child, engine_kwargs),
+                                              name=f"search-shard-{shard}", daemon=True)
+            process.start()
+            child.close()
+            self._connections.append(parent)
+            self._processes.append(process)
+
+    def __enter__(self) -> 'ShardedSearchEngine':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Stop the worker processes"""
+        for conn in self._connections:
+            try:
+                conn.send(('close',))
+            except OSError:
+                pass
+            conn.close()
+        for process in self._processes:
+            process.join(timeout=5)
+        self._connections = []
+        self._processes = []
+
+    def _shard_of(self, doc: Dict, doc_id: int) -> int:
+        if self.partition == 'module':
+            # Stable across runs, unlike hash() on strings
+            return zlib.crc32((doc.get('module') or '').encode('utf-8')) % self.shards
+        return doc_id % self.shards
+
+    def add_document(self, doc: Dict) -> None:
+        """Queue a document for its shard; batches are sent as they fill up"""
+        shard = self._shard_of(doc, self.doc_count)
+        self._batches[shard].append(dict(doc, global_id=self.doc_count))
+        self.doc_count += 1
+        self._stats_current = False
+        if len(self._batches[shard]) >= BATCH_SIZE:
+            self._connections[shard].send(('add', self._batches[shard]))
+            self._batches[shard] = []
+
+    def add_documents(self, docs: Iterable[Dict]) -> None:
+        for doc in docs:
+            self.add_document(doc)
+
+    def _flush(self) -> None:
+        for shard, batch in enumerate(self._batches):
+            if batch:
+                self._connections[shard].send(('add', batch))
+                self._batches[shard] = []
+
+    def _call(self, commands: List[Tuple]) -> List:
+        """Send one command to every shard, then collect the replies in shard order"""
+        for conn, command in zip(self._connections, commands):
+            conn.send(command)
+        replies = [conn.recv() for conn in self._connections]
+        for status, value in replies:
+            if status == 'error':
+                raise value
+        return [value for _, value in replies]
+
+    def _call_all(self, *command) -> List:
+        return self._call([command] * self.shards)
+
+    def refresh(self) -> None:
+        """Send queued documents and share collection-wide statistics; search() does this itself"""
+        with self._lock:
+            self._sync()
+
+    def _sync(self) -> None:
+        self._flush()
+        if not self._stats_current:
+            parts = self._call_all('stats')
+            merged = {name: CollectionStats.merge(part[name] for part in parts) for name in parts[0]}
+            self._call_all('use_stats', merged)
+            self._stats_current = True
+
+    def search(self, query: str, field: Optional[str] = None, k: Optional[int] = None,
+               snippets: int = 0, collapse: bool = False) -> List[SearchResult]:
+        """Search all shards in parallel and merge their results, best first"""
+        with self._lock:
+            self._sync()
+            per_shard = self._call_all('search', query, field, k, False, snippets, collapse)
+        # Each shard's list is ordered by score, then doc id, like SearchEngine._top_k
+        merged = (result for _, _, result in heapq.merge(*per_shard, key=lambda item: (-item[0], item[1])))
+        if collapse:
+            # A cluster can span shards; each shard returned its best document
+            # of every cluster, so the first one merged is the best overall
+            merged = self._collapse(merged)
+        return list(islice(merged, k))
+
+    @staticmethod
+    def _collapse(results: Iterable[SearchResult]) -> Iterable[SearchResult]:
+        seen = set()
+        for result in results:
+            cluster = ('doc', result.doc_id) if result.cluster_id is None else result.cluster_id
+            if cluster not in seen:
+                seen.add(cluster)
+                yield result
+
+    def search_with_progress(self, query: str, field: Optional[str] = None, k: Optional[int] = None,
+                             snippets: int = 0, collapse: bool = False) -> List[SearchResult]:
+        """Same as search(); scoring runs in the shards, so there is no progress bar"""
+        return self.search(query, field, k, snippets, collapse)
+
+    def cache_stats(self) -> Dict[str, float]:
+        """Query cache counters summed over all shards"""
+        with self._lock:
+            parts = self._call_all('cache_stats')
+        totals = {key: sum(part[key] for part in parts) for key in parts[0] if key != 'hit_rate'}
+        lookups = totals['hits'] + totals['misses']
+        totals['hit_rate'] = totals['hits'] / lookups if lookups else 0.0
+        return totals
+
+    def collect_metrics(self) -> None:
+        """Add the metrics the shards recorded since the last call to this process's registry"""
+        with self._lock:
+            parts = self._call_all('metrics')
+        for part in parts:
+            METRICS.merge(part)
+
+    def save(self, index_path: str, fingerprint: Optional[str] = None) -> None:
+        """Write one index file per shard (see shard_path)"""
+        with self._lock:
+            self._sync()
+            self._call([('save', shard_path(index_path, shard), fingerprint) for shard in range(self.shards)])
+        self.fingerprint = fingerprint
+
+    def load(self, index_path: str) -> None:
+        """Memory-map the shard files written by save() with the same number of shards"""
+        with self._lock:
+            counts = self._call([('load', shard_path(index_path, shard)) for shard in range(self.shards)])
+            self._batches = [[] for _ in range(self.shards)]
+            self.doc_count = sum(counts)
+            self._stats_current = False
+            self._sync()
+        self.fingerprint = index_store.read_fingerprint(shard_path(index_path, 0))
+
+    def reset(self) -> None:
+        """Drop all documents from every shard"""
+        with self._lock:
+            self._call_all('reset')
+            self._batches = [[] for _ in range(self.shards)]
+            self.doc_count = 0
+            self._stats_current = True
+            self.fingerprint = None
+
+
+def load_sharded_engine(db: StorageBackend, index_path: str = INDEX_PATH, shards: Optional[int] = None,
+                        partition: str = 'doc_id') -> ShardedSearchEngine:
+    """Load the saved shards if they match the database, otherwise rebuild and save them"""
+    fingerprint = db.content_fingerprint()
+    # Shards keep the text in their index files to build snippets without the database
+    engine = ShardedSearchEngine(shards, partition)
+    paths = [shard_path(index_path, shard) for shard in range(engine.shards)]
+    if all(index_store.read_fingerprint(path) == fingerprint for path in paths):
+        try:
+            engine.load(index_path)
+            print(f"Search index loaded from {engine.shards} shards")
+            return engine
+        except (OSError, index_store.IndexFormatError) as e:
+            print(f"Saved shards unusable ({e}), rebuilding...")
+            engine.reset()
+
+    load_documents_into_search_engine(db, engine)
+    engine.save(index_path, fingerprint)
+    return engine
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Interactive search over a sharded index")
+    parser.add_argument('--shards', type=int, default=os.cpu_count(), help="Number of shards (worker processes)")
+    parser.add_argument('--partition', choices=PARTITIONS, default='doc_id',
+                        help="Assign documents to shards round robin or by module")
+    parser.add_argument('--index', default=INDEX_PATH, help="Base name of the shard index files")
+    args = parser.parse_args()
+
+    db = connect_database()
+    try:
+        with load_sharded_engine(db, args.index, args.shards, args.partition) as engine:
+            interactive_search(engine)
+            engine.collect_metrics()
+    finally:
+        db.close()
+    export_metrics()
+
+
+if __name__ == "__main__":
+    main()
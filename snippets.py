@@ -0,0 +1,73 @@
+from collections import Counter
+from typing import List, Set, Tuple
+
+from analyzer import WORD_PATTERN
+
+# Words per passage window
+WINDOW = 24
+# Put around highlighted words
+HIGHLIGHT = ('**', '**')
+ELLIPSIS = '…'
+
+
+def passage_windows(hits: List[Tuple[int, str]], size: int = WINDOW, count: int = 1) -> List[Tuple[int, int]]:
+    """Best non-overlapping word ranges [start, end) around query term hits, best first.
+
+    hits are (word position, term) pairs sorted by position. A window is
+    ranked by the number of distinct terms it contains, then by the number
+    of hits; its hits are centered in it. The cost grows with the number of
+    hits, not with the length of the document.
+    """
+    candidates = []
+    in_window = Counter()
+    end = 0
+    for first, (position, term) in enumerate(hits):
+        while end < len(hits) and hits[end][0] < position + size:
+            in_window[hits[end][1]] += 1
+            end += 1
+        candidates.append((-len(in_window), first - end, position, first, end))
+        in_window[term] -= 1
+        if not in_window[term]:
+            del in_window[term]
+
+    windows: List[Tuple[int, int]] = []
+    for _, _, position, first, end in sorted(candidates):
+        span = hits[end - 1][0] - position + 1
+        start = max(0, position - (size - span) // 2)
+        if any(start < taken_end and taken_start < start + size for taken_start, taken_end in windows):
+            continue
+        windows.append((start, start + size))
+        if len(windows) == count:
+            break
+    return windows
+
+
+def render_passage(text: str, first_word: int, start: int, end: int, highlight: Set[int],
+                   text_before: bool, text_after: bool) -> str:
+    """Words start..end-1 of text, whose first word has position first_word, with highlighted hits.
+
+    text_before / text_after tell whether the document continues beyond
+    text, which adds an ellipsis even if the passage reaches its edge.
+    """
+    parts = []
+    passage_start = passage_end = None
+    for position, match in enumerate(WORD_PATTERN.finditer(text), start=first_word):
+        if position < start:
+            continue
+        if position >= end:
+            break
+        if passage_start is None:
+            passage_start = passage_end = match.start()
+        if position in highlight:
+            parts.append(text[passage_end:match.start()])
+            parts.append(f"{HIGHLIGHT[0]}{text[match.start():match.end()]}{HIGHLIGHT[1]}")
+        else:
+            parts.append(text[passage_end:match.end()])
+        passage_end = match.end()
+    if passage_start is None:
+        return ''
+    if passage_start > 0 or text_before:
+        parts.insert(0, ELLIPSIS + ' ')
+    if passage_end < len(text) or text_after:
+        parts.append(' ' + ELLIPSIS)
+    return ''.join(parts)
@@ -0,0 +1,216 @@
+import sqlite3
+from datetime import datetime
+from typing import List, Tuple
+
+from db_connector import CONTENT_COLUMNS, BulkWriter, StorageBackend
+
+# Store timestamps as ISO strings (the implicit adapter is deprecated since 3.12)
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(" "))
+
+
+class _Cursor:
+    """sqlite3 cursor that accepts the %s placeholders used by the shared queries"""
+
+    def __init__(self, cursor: sqlite3.Cursor):
+        self._cursor = cursor
+
+    def execute(self, query: str, params=()):
+        self._cursor.execute(query.replace("%s", "?"), params)
+        return self
+
+    def executemany(self, query: str, seq_of_params):
+        self._cursor.executemany(query.replace("%s", "?"), seq_of_params)
+        return self
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    def close(self):
+        self._cursor.close()
+
+
+class SQLiteConnector(StorageBackend):
+    """Embedded SQLite storage backend.
+
+    Runs in WAL mode so the search side can read while content is being
+    ingested. Databases in the old cas_content.db layout (content_text column,
+    one row per file) are migrated to the current schema on open.
+    """
+
+    MANIFEST_UPSERT = """
+        INSERT INTO file_manifest (file_path, size, mtime, content_hash)
+        VALUES (%s, %s, %s, %s)
+        ON CONFLICT(file_path) DO UPDATE SET
+            size = excluded.size, mtime = excluded.mtime,
+            content_hash = excluded.content_hash, updated_at = CURRENT_TIMESTAMP
+    """
+
+    def __init__(self, path: str = "cas_content.db"):
+        """Open (and create if needed) the SQLite database at path"""
+        self.path = path
+        # Used by one thread at a time, but possibly closed by another (SearchService.stop)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.cursor = _Cursor(self.db.cursor())
+        self._writers: List[BulkWriter] = []
+        self._init_database()
+
+    def _new_cursor(self):
+        return _Cursor(self.db.cursor())
+
+    def _init_database(self):
+        """Initialize database with proper tables"""
+        self._migrate_legacy_content()
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS content (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                file_path TEXT,
+                content TEXT,
+                file_type TEXT,
+                module TEXT,
+                topic TEXT,
+                subtopic TEXT,
+                chapter TEXT,
+                instructor TEXT,
+                page_number INTEGER,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                word_count INTEGER
+            );
+
+            CREATE TABLE IF NOT EXISTS file_references (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                file_path TEXT UNIQUE,
+                file_type TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                metadata TEXT
+            );
+
+            CREATE TABLE IF NOT EXISTS tags (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                content_id INTEGER,
+                tag TEXT,
+                weight REAL,
+                FOREIGN KEY (content_id) REFERENCES content(id)
+            );
+
+            CREATE TABLE IF NOT EXISTS processing_errors (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                file_path TEXT,
+                error_message TEXT,
+                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+
+            -- Tracks which files are in the database, so unchanged files can be skipped
+            CREATE TABLE IF NOT EXISTS file_manifest (
+                file_path TEXT PRIMARY KEY,
+                size INTEGER,
+                mtime REAL,
+                content_hash TEXT,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+
+            -- Near-duplicate detection: signature and cluster of each stored row, and
+            -- paths whose text is stored as another file's row
+            CREATE TABLE IF NOT EXISTS content_signatures (
+                content_id INTEGER PRIMARY KEY,
+                cluster_id INTEGER NOT NULL,
+                signature BLOB NOT NULL
+            );
+
+            CREATE TABLE IF NOT EXISTS content_paths (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                content_id INTEGER NOT NULL,
+                file_path TEXT,
+                page_number INTEGER,
+                similarity REAL
+            );
+
+            CREATE INDEX IF NOT EXISTS idx_content_file_path ON content (file_path);
+            CREATE INDEX IF NOT EXISTS idx_content_paths_content ON content_paths (content_id);
+            CREATE INDEX IF NOT EXISTS idx_content_paths_file_path ON content_paths (file_path);
+            CREATE INDEX IF NOT EXISTS idx_manifest_hash ON file_manifest (content_hash);
+
+            -- Bumped on every change to content; part of the index fingerprint
+            CREATE TABLE IF NOT EXISTS content_version (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                version INTEGER NOT NULL
+            );
+            INSERT OR IGNORE INTO content_version (id, version) VALUES (1, 0);
+
+            CREATE TRIGGER IF NOT EXISTS content_version_insert AFTER INSERT ON content
+            BEGIN UPDATE content_version SET version = version + 1; END;
+            CREATE TRIGGER IF NOT EXISTS content_version_update AFTER UPDATE ON content
+            BEGIN UPDATE content_version SET version = version + 1; END;
+            CREATE TRIGGER IF NOT EXISTS content_version_delete AFTER DELETE ON content
+            BEGIN UPDATE content_version SET version = version + 1; END;
+            CREATE TRIGGER IF NOT EXISTS content_version_signature AFTER INSERT ON content_signatures
+            BEGIN UPDATE content_version SET version = version + 1; END;
+            CREATE TRIGGER IF NOT EXISTS content_version_path_insert AFTER INSERT ON content_paths
+            BEGIN UPDATE content_version SET version = version + 1; END;
+            CREATE TRIGGER IF NOT EXISTS content_version_path_delete AFTER DELETE ON content_paths
+            BEGIN UPDATE content_version SET version = version + 1; END;
+        """)
+        self.db.commit()
+
+    def _migrate_legacy_content(self):
+        """Convert a content table from the old SQLite layout to the current one"""
+        columns = [row[1] for row in self.db.execute("PRAGMA table_info(content)")]
+        if 'content_text' not in columns:
+            return
+        # The old table had UNIQUE(file_path), which rules out one row per PDF page.
+        # legacy_alter_table keeps the tags foreign key pointing at "content".
+        self.db.executescript(f"""
+            PRAGMA legacy_alter_table = ON;
+            BEGIN;
+            ALTER TABLE content RENAME TO content_legacy;
+            CREATE TABLE content (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                file_path TEXT,
+                content TEXT,
+                file_type TEXT,
+                module TEXT,
+                topic TEXT,
+                subtopic TEXT,
+                chapter TEXT,
+                instructor TEXT,
+                page_number INTEGER,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                word_count INTEGER
+            );
+            INSERT INTO content (id, {CONTENT_COLUMNS})
+            SELECT id, file_path, content_text, file_type, module, topic, subtopic, chapter,
+                   instructor, page_number, created_at, word_count
+            FROM content_legacy ORDER BY id;
+            DROP TABLE content_legacy;
+            COMMIT;
+            PRAGMA legacy_alter_table = OFF;
+        """)
+
+    def _insert_content_rows(self, rows: List[Tuple]) -> List[int]:
+        self.cursor.executemany(
+            f"INSERT INTO content ({CONTENT_COLUMNS}) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)",
+            rows
+        )
+        # Single writer per transaction, so the ids of one batch are consecutive
+        last_id = self.cursor.execute("SELECT last_insert_rowid()").fetchone()[0]
+        return list(range(last_id - len(rows) + 1, last_id + 1))
+
+    def content_fingerprint(self) -> str:
+        """Return a value that changes whenever the content table or its duplicate references change"""
+        self.cursor.execute("SELECT COUNT(*), MAX(id) FROM content")
+        count, max_id = self.cursor.fetchone()
+        self.cursor.execute("SELECT version FROM content_version WHERE id = 1")
+        version = self.cursor.fetchone()[0]
+        return f"{count}:{max_id}:{version}"
@@ -0,0 +1,105 @@
+import pytest
+
+from db_connector import ContentId
+from sqlite_connector import SQLiteConnector
+
+
+@pytest.fixture
+def connector(tmp_path):
+    connector = SQLiteConnector(str(tmp_path / 'content.db'))
+    yield connector
+    connector.close()
+
+
+def stored_ids(connector):
+    connector.cursor.execute("SELECT id, file_path, page_number FROM content ORDER BY id")
+    return {(file_path, page_number): content_id for content_id, file_path, page_number in connector.cursor.fetchall()}
+
+
+def test_content_ids_are_assigned_on_flush(connector):
+    writer = connector.bulk_writer(batch_size=1000, flush_interval=3600)
+    ids = {}
+    for page in range(1, 8):
+        content_id = writer.store_content('a.pdf', f'Seite {page}', {'page_number': page}, 'pdf')
+        assert isinstance(content_id, ContentId) and content_id.value is None
+        ids['a.pdf', page] = content_id
+    writer.flush()
+    assert {key: content_id.value for key, content_id in ids.items()} == stored_ids(connector)
+
+
+def test_content_ids_across_batches_and_deletes(connector):
+    writer = connector.bulk_writer(batch_size=3, flush_interval=3600)
+    ids = {}
+    for round_ in range(2):
+        if round_:
+            writer.delete_content('b.pdf')
+        for page in range(1, 6):
+            ids['b.pdf', page] = writer.store_content('b.pdf', f'Text {round_} {page}', {'page_number': page}, 'pdf')
+    writer.close()
+    stored = stored_ids(connector)
+    assert len(stored) == 5
+    assert {key: content_id.value for key, content_id in ids.items()} == stored
+
+
+def test_signatures_refer_to_assigned_ids(connector):
+    from near_duplicates import signature
+    writer = connector.bulk_writer(batch_size=1000, flush_interval=3600)
+    first = writer.store_content('c.pdf', 'eins zwei drei vier fünf', {'page_number': 1}, 'pdf')
+    second = writer.store_content('c.pdf', 'eins zwei drei vier sechs', {'page_number': 2}, 'pdf')
+    writer.store_signature(first, first, signature('eins zwei drei vier fünf'))
+    writer.store_signature(second, first, signature('eins zwei drei vier sechs'))
+    writer.flush()
+    connector.cursor.execute("SELECT content_id, cluster_id FROM content_signatures ORDER BY content_id")
+    assert connector.cursor.fetchall() == [(first.value, first.value), (second.value, first.value)]
+
+
+def test_failed_flush_clears_ids_and_reports_them(connector, monkeypatch):
+    writer = connector.bulk_writer(batch_size=1000, flush_interval=3600)
+    discarded = []
+    writer.on_discard = discarded.extend
+    content_id = writer.store_content('d.pdf', 'Text', {'page_number': 1}, 'pdf')
+
+    def fail(rows):
+        raise RuntimeError("disk full")
+
+    monkeypatch.setattr(connector, '_insert_content_rows', fail)
+    with pytest.raises(RuntimeError):
+        writer.flush()
+    assert content_id.value is None and discarded == [content_id]
+    assert writer.pending == 0
+    assert stored_ids(connector) == {}
+
+
+class FakeMySQLCursor:
+    """Hands out ids like MySQL with the given auto-increment settings"""
+
+    def __init__(self, increment, lock_mode):
+        self.settings = (increment, lock_mode)
+        self.next_id = 1
+        self.lastrowid = None
+        self.statements = []
+
+    def execute(self, query, params=()):
+        self.statements.append(query)
+        if query.startswith("INSERT"):
+            self.lastrowid = self.next_id
+            self.next_id += self.settings[0] * (len(params) // 11)
+
+    def fetchone(self):
+        return self.settings
+
+
+@pytest.mark.parametrize('increment, lock_mode, statements', [(1, 1, 1), (2, 1, 3), (1, 2, 3)])
+def test_mysql_ids_follow_the_auto_increment_settings(increment, lock_mode, statements):
+    from db_connector import DatabaseConnector
+    connector = DatabaseConnector.__new__(DatabaseConnector)
+    connector.cursor = FakeMySQLCursor(increment, lock_mode)
+    connector._consecutive = None
+    rows = [(f'{name}.pdf',) + (None,) * 10 for name in 'abc']
+    ids = connector._insert_content_rows(rows)
+    inserts = [query for query in connector.cursor.statements if query.startswith("INSERT")]
+    assert len(inserts) == statements
+    assert ids == [1 + increment * offset for offset in range(3)]
+    # The settings are only read once
+    connector._insert_content_rows(rows)
+    assert sum(query.startswith("SELECT") for query in connector.cursor.statements) == 1
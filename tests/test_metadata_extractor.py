@@ -0,0 +1,32 @@
+import pytest
+
+from benchmark import _per_pattern_metadata, metadata_samples, synthetic_corpus
+from metadata_extractor import MetadataExtractor
+
+
+@pytest.mark.parametrize('language', ['de', 'en'])
+def test_same_values_as_the_per_pattern_extractor(language):
+    extractor = MetadataExtractor()
+    for text in metadata_samples(list(synthetic_corpus(500, language))):
+        assert extractor.extract(text) == _per_pattern_metadata(text)
+
+
+def test_later_pattern_overrides_earlier_one():
+    text = "Thema: Joins\nText\nModul: Datenbanken\nDozent: Meier\nVon: Keller\nM3 - Statistik"
+    assert MetadataExtractor().extract(text) == {'module': 'Statistik', 'topic': 'Joins', 'instructor': 'Keller'}
+
+
+def test_overlong_value_is_skipped():
+    text = "Modul: " + "x " * 60 + "\nModul: Datenbanken"
+    assert MetadataExtractor().extract(text) == {'module': 'Datenbanken'}
+
+
+def test_only_requested_fields_and_word_starts():
+    extractor = MetadataExtractor()
+    assert extractor.extract("Thema: Joins\nDozent: Meier", ['instructor']) == {'instructor': 'Meier'}
+    assert extractor.extract("davon: nichts") == {}
+
+
+def test_patterns_need_one_group():
+    with pytest.raises(ValueError):
+        MetadataExtractor({'chapter': [r'Kapitel \d+']})
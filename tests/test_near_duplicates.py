@@ -0,0 +1,87 @@
+import random
+
+from near_duplicates import (CLUSTER_THRESHOLD, DUPLICATE_THRESHOLD, SIGNATURE_SIZE, NearDuplicateIndex,
+                             decode_signature, encode_signature, signature, similarity)
+
+WORDS = ('datenbank tabelle abfrage schlüssel beziehung normalisierung transaktion index sicht spalte '
+         'zeile modell sprache verbund gruppierung sortierung bedingung funktion prozedur sperre').split()
+
+
+def text(rng, words=300):
+    return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+
+def edited(rng, source, changes):
+    words = source.split()
+    for position in rng.sample(range(len(words)), changes):
+        words[position] = 'geändert'
+    return ' '.join(words)
+
+
+def test_signature_shape_and_round_trip():
+    sig = signature(text(random.Random(1)))
+    assert len(sig) == SIGNATURE_SIZE
+    assert decode_signature(encode_signature(sig)) == sig
+    assert signature('') is None and signature('... --') is None
+
+
+def test_short_texts_get_full_signatures():
+    sig = signature('kurzer text')
+    assert len(sig) == SIGNATURE_SIZE
+    assert similarity(sig, signature('Kurzer Text')) == 1.0
+    assert similarity(sig, signature('ganz anderer inhalt')) < CLUSTER_THRESHOLD
+
+
+def test_similarity_tracks_the_amount_of_change():
+    rng = random.Random(2)
+    source = text(rng)
+    sig = signature(source)
+    assert similarity(sig, signature(source)) == 1.0
+    assert similarity(sig, signature(edited(rng, source, 1))) >= DUPLICATE_THRESHOLD
+    assert similarity(sig, signature(text(rng))) < CLUSTER_THRESHOLD
+
+
+def test_index_finds_near_duplicates_but_not_unrelated_texts():
+    rng = random.Random(3)
+    index = NearDuplicateIndex()
+    sources = [text(rng) for _ in range(200)]
+    for content_id, source in enumerate(sources):
+        index.add(content_id, f'doc{content_id}.pdf', content_id, signature(source))
+    assert len(index) == 200
+
+    found = 0
+    for content_id in rng.sample(range(200), 50):
+        match = index.best_match(signature(edited(rng, sources[content_id], 1)))
+        if match is not None and match[0] == content_id:
+            found += 1
+    # LSH may miss a rare candidate, but not many
+    assert found >= 48
+
+    false_matches = sum(index.best_match(signature(text(rng))) is not None for _ in range(50))
+    assert false_matches == 0
+
+
+def test_best_match_prefers_the_most_similar_row():
+    rng = random.Random(4)
+    source = text(rng)
+    index = NearDuplicateIndex()
+    index.add('far', 'far.pdf', 'far', signature(edited(rng, source, 8)))
+    index.add('near', 'near.pdf', 'near', signature(edited(rng, source, 1)))
+    content_id, cluster_id, value = index.best_match(signature(source))
+    assert (content_id, cluster_id) == ('near', 'near') and value >= DUPLICATE_THRESHOLD
+
+
+def test_removed_rows_are_not_matched():
+    rng = random.Random(5)
+    first, second = text(rng), text(rng)
+    index = NearDuplicateIndex()
+    index.add(1, 'a.pdf', 1, signature(first))
+    index.add(2, 'b.pdf', 1, signature(first + ' anhang'))
+    index.add(3, 'c.pdf', 3, signature(second))
+
+    index.remove_path('c.pdf')
+    assert index.best_match(signature(second)) is None
+    # Discarding a row also drops the rows clustered with it
+    index.discard([1])
+    assert index.best_match(signature(first)) is None
+    assert len(index) == 0
@@ -0,0 +1,85 @@
+import random
+from array import array
+
+import pytest
+
+from postings import (InvertedIndex, PostingList, decode_positions, decode_varints, encode_positions,
+                      encode_varints, intersect)
+
+
+@pytest.mark.parametrize('values', [
+    [],
+    [0],
+    [127, 128, 255, 16383, 16384, 2**21, 2**28 - 1, 2**28, 2**32 - 1],
+    list(range(300)),
+])
+def test_varints_round_trip(values):
+    data = encode_varints(values)
+    assert list(decode_varints(data, 0, len(data))) == values
+
+
+def test_varint_sizes():
+    assert len(encode_varints([127])) == 1
+    assert len(encode_varints([128])) == 2
+    assert len(encode_varints([2**32 - 1])) == 5
+
+
+def test_delta_varints_round_trip_inside_a_buffer():
+    rng = random.Random(1)
+    values = sorted(rng.sample(range(2**31), 1000))
+    data = encode_varints(values, delta=True)
+    # Blocks are decoded from a larger buffer at an offset
+    buffer = b'\xff' * 7 + data + b'\x81'
+    assert list(decode_varints(buffer, 7, len(data), delta=True)) == values
+    assert len(data) < len(encode_varints(values))
+
+
+def test_positions_round_trip():
+    rng = random.Random(2)
+    frequencies = [rng.randint(1, 20) for _ in range(200)]
+    positions = []
+    for frequency in frequencies:
+        positions.extend(sorted(rng.sample(range(5000), frequency)))
+    data = encode_positions(positions, frequencies)
+    assert list(decode_positions(data, 0, len(data), frequencies)) == positions
+
+
+def test_posting_list_encode_decode():
+    postings = PostingList()
+    for doc_id, frequency in [(0, 1), (3, 2), (130, 1), (70000, 5)]:
+        postings.append(doc_id, frequency)
+    data = postings.encode()
+    doc_length = len(encode_varints(postings.doc_ids, delta=True))
+    decoded = PostingList.decode(data, 0, doc_length, doc_length, len(data) - doc_length)
+    assert list(decoded) == [0, 3, 130, 70000]
+    assert decoded.frequency(3) == 2 and decoded.frequency(70000) == 5 and decoded.frequency(4) == 0
+
+
+def test_intersect_matches_sets():
+    rng = random.Random(3)
+    for _ in range(50):
+        lists = [array('I', sorted(rng.sample(range(2000), rng.randint(0, 400)))) for _ in range(rng.randint(1, 4))]
+        expected = sorted(set.intersection(*(set(doc_ids) for doc_ids in lists)))
+        assert list(intersect(lists)) == expected
+
+
+def test_inverted_index_statistics():
+    index = InvertedIndex()
+    index.add(0, {'tabelle': 2, 'relation': 1})
+    index.add(1, {'tabelle': 1})
+    assert index.doc_count() == 2
+    assert index.doc_freq('tabelle') == 2 and index.doc_freq('relation') == 1
+    assert index.average_length() == 2.0
+
+
+def test_max_frequency_follows_appends_and_decoding():
+    postings = PostingList()
+    assert postings.max_frequency == 0
+    postings.append(1, 3)
+    assert postings.max_frequency == 3
+    postings.append(2, 7)
+    postings.append(5, 2)
+    assert postings.max_frequency == 7
+    data = postings.encode()
+    doc_length = len(encode_varints(postings.doc_ids, delta=True))
+    assert PostingList.decode(data, 0, doc_length, doc_length, len(data) - doc_length).max_frequency == 7
@@ -0,0 +1,69 @@
+import pytest
+
+from query_parser import And, Near, Not, Or, Phrase, Word, parse_query
+
+FIELDS = ('module', 'topic', 'subtopic', 'chapter', 'instructor', 'content')
+
+
+def parse(query):
+    return parse_query(query, FIELDS)
+
+
+def test_juxtaposed_words_must_all_match():
+    assert parse('normalisierung relation') == And((Word('normalisierung'), Word('relation')))
+
+
+def test_or_binds_weaker_than_and():
+    assert parse('a OR b c') == Or((Word('a'), And((Word('b'), Word('c')))))
+    assert parse('(a OR b) c') == And((Or((Word('a'), Word('b'))), Word('c')))
+
+
+def test_not_and_explicit_and():
+    assert parse('a AND NOT b') == And((Word('a'), Not(Word('b'))))
+    assert parse('NOT a') == Not(Word('a'))
+
+
+def test_lower_case_operators_are_words():
+    assert parse('and or not') == And((Word('and'), Word('or'), Word('not')))
+
+
+def test_phrase():
+    assert parse('"third normal form"') == Phrase('third normal form')
+    assert parse('"a b" c') == And((Phrase('a b'), Word('c')))
+
+
+def test_near():
+    assert parse('a NEAR/3 b') == Near(Word('a'), Word('b'), 3)
+    assert parse('"a b" NEAR/0 c') == Near(Phrase('a b'), Word('c'), 0)
+    # Chains become pairwise clauses
+    assert parse('a NEAR/2 b NEAR/1 c') == And((Near(Word('a'), Word('b'), 2), Near(Word('b'), Word('c'), 1)))
+
+
+def test_field_clauses():
+    assert parse('topic:normalisierung') == Word('normalisierung', 'topic')
+    assert parse('Instructor:"Hans Meier" relation') == And((Phrase('Hans Meier', 'instructor'), Word('relation')))
+
+
+def test_unknown_field_is_text():
+    assert parse('Note:wichtig') == And((Word('Note'), Word('wichtig')))
+
+
+@pytest.mark.parametrize('query, expected', [
+    ('', None),
+    ('   ', None),
+    ('AND', None),
+    ('OR NOT', None),
+    ('()', None),
+    ('a OR', Word('a')),
+    ('OR a', Word('a')),
+    ('a AND OR b', Or((Word('a'), Word('b')))),
+    ('((a', Word('a')),
+    ('a)) b', And((Word('a'), Word('b')))),
+    ('"x y', Phrase('x y')),
+    ('topic:"x y', Phrase('x y', 'topic')),
+    ('NEAR/2 b', Word('b')),
+    ('a NEAR/2', Word('a')),
+    ('a NEAR/2 (b OR c)', And((Word('a'), Or((Word('b'), Word('c')))))),
+])
+def test_malformed_input_is_repaired(query, expected):
+    assert parse(query) == expected
@@ -0,0 +1,119 @@
+import random
+import time
+
+import pytest
+
+from analyzer import Analyzer
+from postings import InvertedIndex
+from query_parser import parse_query
+from query_planner import compile_plan, max_score_top_k
+from search_engine import QueryTimeout, SearchEngine
+
+WORDS = ['tabelle', 'abfrage', 'schluessel', 'relation', 'index', 'sicht', 'spalte', 'zeile',
+         'modell', 'sprache', 'verbund', 'sperre', 'protokoll', 'sicherung', 'katalog', 'knoten']
+
+
+def random_index(rng, num_docs=300):
+    """Index with Zipf-like term frequencies, so posting lists differ a lot in length"""
+    index = InvertedIndex()
+    weights = [1 / rank for rank in range(1, len(WORDS) + 1)]
+    docs = []
+    for doc_id in range(num_docs):
+        words = rng.choices(WORDS, weights=weights, k=rng.randint(1, 12))
+        counts = {word: words.count(word) for word in words}
+        index.add(doc_id, counts)
+        docs.append(counts)
+    return index, docs
+
+
+def exhaustive_top_k(docs, scores, k):
+    ranked = []
+    for doc_id, counts in enumerate(docs):
+        matched = [scores[word](doc_id, tf) for word, tf in counts.items() if word in scores]
+        if matched:
+            ranked.append((sum(matched), doc_id))
+    ranked.sort(key=lambda item: (-item[0], item[1]))
+    return ranked[:k]
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_max_score_matches_exhaustive_ranking(seed):
+    rng = random.Random(seed)
+    index, docs = random_index(rng)
+    for _ in range(20):
+        query = rng.sample(WORDS, rng.randint(1, 6))
+        k = rng.choice([1, 3, 10, 50, 1000])
+        # Scores in eighths add up exactly in any order, so ties are real ties
+        weight = {word: rng.randint(1, 16) / 8 for word in query}
+        scores = {word: (lambda doc_id, tf, w=weight[word]: w * min(tf, 4)) for word in query}
+        lists = [(index[word], weight[word] * min(max(index[word].frequencies), 4), scores[word])
+                 for word in query if word in index]
+        assert max_score_top_k(lists, k) == exhaustive_top_k(docs, scores, k)
+
+
+@pytest.mark.parametrize('ranking', ['bm25', 'tfidf'])
+def test_engine_or_queries_rank_like_full_scoring(ranking):
+    rng = random.Random(7)
+    engine = SearchEngine(ranking=ranking, cache_size=0)
+    for doc_id in range(400):
+        engine.add_document({'file_path': f'doc{doc_id}.txt', 'content': ' '.join(
+            rng.choices(WORDS, weights=[1 / rank for rank in range(1, len(WORDS) + 1)], k=rng.randint(3, 40)))})
+    for _ in range(50):
+        query = ' OR '.join(rng.sample(WORDS, rng.randint(2, 5)))
+        k = rng.choice([1, 5, 20])
+        # k=None scores every matching document
+        expected = engine.search(query)[:k]
+        top = engine.search(query, k=k)
+        assert [result.relevance_score for result in top] == pytest.approx(
+            [result.relevance_score for result in expected])
+        # Documents may only swap places where their scores are equal
+        for got, want in zip(top, expected):
+            assert got.doc_id == want.doc_id or got.relevance_score == pytest.approx(want.relevance_score)
+
+
+def test_boolean_plans_match_set_semantics():
+    rng = random.Random(3)
+    analyzer = Analyzer(stem=False)
+    index, docs = random_index(rng, 200)
+    indexes = {'content': index}
+    everything = set(range(len(docs)))
+
+    def having(word):
+        return {doc_id for doc_id, counts in enumerate(docs) if word in counts}
+
+    a, b, c = 'tabelle', 'relation', 'katalog'
+    cases = {
+        f'{a} {b}': having(a) & having(b),
+        f'{a} OR {b}': having(a) | having(b),
+        f'{a} NOT {b}': having(a) - having(b),
+        f'({a} OR {b}) NOT {c}': (having(a) | having(b)) - having(c),
+        f'NOT {a}': everything - having(a),
+        f'{a} OR ({b} {c})': having(a) | (having(b) & having(c)),
+    }
+    for query, expected in cases.items():
+        plan = compile_plan(parse_query(query, indexes), analyzer, indexes)
+        assert set(plan.evaluate(len(docs))) == expected, query
+        assert {doc_id for doc_id in everything if plan.matches(doc_id)} == expected, query
+
+
+def test_max_score_checks_the_deadline():
+    rng = random.Random(5)
+    index, _ = random_index(rng, 5000)
+    lists = [(index[word], float(index[word].max_frequency), lambda doc_id, tf: float(tf)) for word in WORDS[:4]]
+    calls = []
+
+    def check():
+        calls.append(1)
+        if len(calls) > 2:
+            raise TimeoutError
+
+    with pytest.raises(TimeoutError):
+        # Enough results that the scan cannot end before the third check
+        max_score_top_k(lists, 1000, check, check_interval=100)
+
+
+def test_engine_or_query_stops_at_deadline():
+    engine = SearchEngine(cache_size=0)
+    engine.add_documents({'file_path': f'd{i}', 'content': 'tabelle relation'} for i in range(10))
+    with pytest.raises(QueryTimeout):
+        engine.search('tabelle OR relation', k=3, deadline=time.monotonic() - 1)
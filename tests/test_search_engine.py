@@ -0,0 +1,46 @@
+from search_engine import SearchEngine
+
+
+def engine(cache_size=0):
+    engine = SearchEngine(cache_size=cache_size)
+    engine.add_documents([
+        {'file_path': 'a.pdf', 'file_type': 'pdf', 'content': 'Normalisierung der Relation',
+         'module': 'Datenbanken', 'topic': 'Normalisierung'},
+        {'file_path': 'b.pptx', 'file_type': 'pptx', 'content': 'Python Übung',
+         'module': 'Programmieren', 'topic': 'Python'},
+        {'file_path': 'c.pdf', 'file_type': 'pdf', 'content': 'Relation und Tabelle',
+         'module': 'Datenbanken', 'topic': 'Relationen'},
+    ])
+    return engine
+
+
+def paths(results):
+    return sorted(result.file_path for result in results)
+
+
+def test_field_argument_matches_any_word():
+    assert paths(engine().search('normalisierung python', 'topic')) == ['a.pdf', 'b.pptx']
+
+
+def test_field_argument_accepts_document_keys_without_index():
+    results = engine().search('pptx xlsx', 'file_type')
+    assert paths(results) == ['b.pptx'] and results[0].relevance_score == 0.5
+    assert engine().search('pdf', 'no_such_key') == []
+
+
+def test_field_clauses_in_the_query_must_all_match():
+    assert paths(engine().search('module:datenbanken relation')) == ['a.pdf', 'c.pdf']
+    assert paths(engine().search('module:datenbanken topic:python')) == []
+
+
+def test_changing_results_does_not_change_cache_hits():
+    cached = engine(cache_size=8)
+    first = cached.search('relation', snippets=1)
+    first[0].snippets.append('geändert')
+    first[0].relevance_score = -1.0
+    second = cached.search('relation', snippets=1)
+    second[0].duplicates.append('x.pdf')
+    third = cached.search('relation', snippets=1)
+    assert cached.cache_stats()['hits'] == 2
+    assert 'geändert' not in third[0].snippets and third[0].duplicates == []
+    assert third[0].relevance_score > 0
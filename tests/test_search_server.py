@@ -0,0 +1,28 @@
+from sqlite_connector import SQLiteConnector
+from search_server import SearchService
+
+
+def test_snippet_searches_reuse_one_connection_per_worker(tmp_path, caplog):
+    path = str(tmp_path / 'content.db')
+    db = SQLiteConnector(path)
+    for i in range(20):
+        db.store_content(f'f{i}.txt', f'datenbank tabelle nummer{i} ' * 20, {'module': 'DB'}, 'txt')
+    db.close()
+    opened = []
+
+    def connect():
+        opened.append(SQLiteConnector(path))
+        return opened[-1]
+
+    service = SearchService(db_factory=connect, index_path=str(tmp_path / 'search_index.bin'), workers=2)
+    service.start()
+    try:
+        for i in range(20):
+            results = service.search(f'nummer{i}', snippets=1)['results']
+            assert '**nummer' in results[0]['snippets'][0]
+        # The index loader and at most one connection per worker thread
+        assert len(opened) <= 1 + service.workers
+    finally:
+        service.stop()
+    assert service._connections == []
+    assert not [record for record in caplog.records if 'connection' in record.getMessage()]
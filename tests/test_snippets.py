@@ -0,0 +1,37 @@
+from analyzer import Analyzer
+from search_engine import OFFSET_INTERVAL, SearchEngine
+
+
+def test_word_offsets_point_into_the_original_text():
+    # 'İ'.lower() is two characters long
+    text = ' '.join(['İİİ İstanbul'] * 50 + ['Normalisierung', 'Relation'])
+    offsets, words = Analyzer().word_offsets(text, OFFSET_INTERVAL)
+    assert words == 102
+    for block, offset in enumerate(offsets[:-1]):
+        # Every stored offset is the start of word block * OFFSET_INTERVAL
+        assert text[offset:].startswith(text.split()[block * OFFSET_INTERVAL])
+    assert offsets[-1] == len(text)
+
+
+def test_snippets_highlight_the_hit_after_length_changing_characters():
+    engine = SearchEngine()
+    content = ('İİİİ İstanbul ' * 40) + 'Die Normalisierung der Relation. ' + ('Ölçü İzmir ' * 50) + 'Zielwort hier.'
+    engine.add_document({'file_path': 'a.pdf', 'content': content})
+    assert '**Normalisierung**' in engine.search('normalisierung', snippets=1)[0].snippets[0]
+    assert '**Zielwort**' in engine.search('zielwort', snippets=1)[0].snippets[0]
+
+
+def test_metadata_positions_stay_past_content_ending_in_stop_words():
+    engine = SearchEngine()
+    engine.add_document({'file_path': 'a.pdf', 'content': 'Normalisierung ist in der DB so da',
+                         'module': 'Datenbanken'})
+    assert engine.search('normalisierung datenbanken', snippets=1)[0].snippets == [
+        '**Normalisierung** ist in der DB so da']
+
+
+def test_phrases_do_not_span_content_and_metadata():
+    engine = SearchEngine()
+    engine.add_document({'file_path': 'a.pdf', 'content': 'Die Relation der Tabelle ist in der DB',
+                         'module': 'Datenbanken'})
+    assert engine.search('"tabelle datenbanken"') == []
+    assert len(engine.search('tabelle NEAR/5 datenbanken')) == 1